@@ -1,120 +1,679 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
-from flask_socketio import SocketIO, emit
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context, g, has_request_context
+from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_cors import CORS
-import sqlite3
 import os
+import io
+import atexit
+import json
+import base64
+import re
+import time
 from datetime import datetime
+from functools import wraps
 from werkzeug.security import generate_password_hash, check_password_hash
+from autenticacao import CacheStatus, EmissorTokens, LimitadorTentativas, chave_secreta
+from cache_cifras import CacheCifras, EntradaCifra, hash_cifra
+from catalogo import versao_catalogo
+from db import PoolSQLite
+from entrega import Coalescedor, EntregaConfirmada
+import busca
+import catalogo
+import estado
+import importacao
+import metricas
+import migracoes
+import perfil
+import serializacao
+import transposicao
+from uso import AcumuladorUso
+import uso
 
 app = Flask(__name__)
-app.secret_key = os.environ.get("APP_SECRET_KEY", "dev-secret")
 
-CORS(app)
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading') 
+CORS(app, expose_headers=["ETag", "X-Next-Cursor", "X-Catalog-Version"])
+# "threading" (padrão, servidor do Werkzeug), "eventlet" ou "gevent". Os dois últimos precisam
+# do monkey patch antes de qualquer import: use producao.py para subir nesses modos.
+ASYNC_MODE = os.environ.get("ECHO_ASYNC_MODE", "threading")
+# Vários processos: fila para os emits (ECHO_MESSAGE_QUEUE) e estado comum (ECHO_ESTADO_URL); ver estado.py
+MESSAGE_QUEUE = os.environ.get("ECHO_MESSAGE_QUEUE", "")
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=ASYNC_MODE, **estado.opcoes_socketio(MESSAGE_QUEUE))
 
 # --- ESTADO DO SERVIDOR ---
-router_user = None
-connected_users = {}
+# Em memória por padrão; com ECHO_ESTADO_URL os mapas são lidos e gravados no backend compartilhado,
+# por isso os handlers gravam a sessão de volta (connected_users[sid] = sessao) depois de alterar.
+ESTADO = estado.Estado(os.environ.get("ECHO_ESTADO_URL"))
+PROCESSO = estado.id_processo()
+INICIO_PROCESSO = time.time()
+PROCESSO_BATIMENTO_S = 10
+# Cada celular está sempre em uma sala; open_song, tom, setlist e router valem só dentro dela
+SALA_PADRAO = os.environ.get("ECHO_SALA_PADRAO", "principal")
+NOME_SALA = re.compile(r"^[\w\- ]{1,40}$")
+connected_users = ESTADO.mapa("sessoes")  # sid -> {'user_info', 'sala', 'processo', 'conectado_em', 'logs'}
+routers = ESTADO.mapa("routers")          # sala -> usuário que controla a sala
+setlists = ESTADO.mapa("setlists")        # sala -> {'hash', 'song_ids'} da última setlist publicada pelo router
+processos = ESTADO.mapa("processos")      # processo -> último sinal de vida (só com estado compartilhado)
+# sala -> música e tom que o router está mostrando agora, com o número de sequência de cada mudança
+atuais = ESTADO.mapa("atuais")            # {'song_id', 'seq_musica', 'semitones', 'tom', 'seq'}
+_batimento = {'ativo': False}
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-CIFRAS_DB_PATH = os.path.join(BASE_DIR, "cifras.db")
-USUARIOS_DB_PATH = os.path.join(BASE_DIR, "usuarios.db")
+DB_DIR = os.environ.get("ECHO_DB_DIR", BASE_DIR)
+# Assina sessões e tokens da API: APP_SECRET_KEY ou a chave aleatória guardada em DB_DIR/segredo.key
+app.secret_key = chave_secreta(DB_DIR)
+CIFRAS_DB_PATH = os.path.join(DB_DIR, "cifras.db")
+USUARIOS_DB_PATH = os.path.join(DB_DIR, "usuarios.db")
+USO_DB_PATH = os.path.join(DB_DIR, "uso.db")
+
+# Métricas do processo em /metrics (formato Prometheus, metricas.py). Sem ECHO_METRICS_TOKEN só respondem
+# para quem chama direto da própria máquina (nada que passe por túnel/proxy, que manda X-Forwarded-For)
+METRICAS_TOKEN = os.environ.get("ECHO_METRICS_TOKEN", "")
+METRICAS = metricas.Registro()
+m_http = METRICAS.histograma("echo_http_request_duration_seconds", "Duração das requisições HTTP por rota", ("route", "method", "status"))
+m_sql = METRICAS.histograma("echo_sqlite_query_duration_seconds", "Duração das consultas SQLite (execute + leitura das linhas)",
+                            ("db", "operation"), metricas.BALDES_SQL)
+m_fanout_clientes = METRICAS.histograma("echo_open_song_fanout_clients", "Celulares deste processo que recebem cada open_song",
+                                        baldes=(0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+m_fanout_duracao = METRICAS.histograma("echo_open_song_fanout_seconds", "Tempo para codificar e entregar um open_song à sala")
+m_open_song_ack = METRICAS.histograma("echo_open_song_ack_seconds", "Do envio do open_song até a confirmação do celular (carregou a música)")
+m_login_cpu = METRICAS.histograma("echo_login_cpu_seconds", "CPU gasta conferindo a senha no /api/login", ("result",),
+                                  baldes=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+m_login_bloqueado = METRICAS.contador("echo_login_rate_limited_total", "Logins recusados pelo limite de tentativas")
+
+# Diagnóstico opt-in (perfil.py). ECHO_PERFIL=1 grava em ECHO_PERFIL_DIR perfis cProfile das requisições
+# acima de ECHO_PERFIL_MS, ou de 1 a cada ECHO_PERFIL_CADA qualquer que seja a duração (aí o limite não
+# vale); ECHO_SQL_LENTA_MS>0 liga o log de consultas lentas
+perfilador = perfil.Perfilador(
+    os.environ.get("ECHO_PERFIL_DIR", os.path.join(DB_DIR, "perfis")),
+    limite_ms=float(os.environ.get("ECHO_PERFIL_MS", 200)),
+    cada=int(os.environ.get("ECHO_PERFIL_CADA", 0)),
+) if os.environ.get("ECHO_PERFIL") == "1" else None
+SQL_LENTA_MS = float(os.environ.get("ECHO_SQL_LENTA_MS", 0))
+consultas_lentas = perfil.LogConsultasLentas(os.path.join(DB_DIR, "sql_lentas.log"), SQL_LENTA_MS) if SQL_LENTA_MS > 0 else None
+
+def origem_atual():
+    # Quem fez a consulta, para o log: rota HTTP ou evento do socket
+    if not has_request_context(): return None
+    evento = getattr(request, "event", None)
+    if evento: return f"socket:{evento['message']}"
+    return f"{request.method} {request.url_rule.rule if request.url_rule else request.path}"
+
+def observar_sql(banco):
+    # Rótulo pela primeira palavra do SQL (SELECT, INSERT, UPDATE...), não pelo texto: cardinalidade fixa
+    def observar(sql, params, duracao, linhas):
+        m_sql.observar(duracao, banco, sql.split(None, 1)[0].upper())
+        if consultas_lentas: consultas_lentas.registrar(banco, sql, params, duracao, linhas, origem_atual())
+    return observar
+
+# Conexões reaproveitadas (WAL + pragmas em db.py) em vez de um sqlite3.connect por requisição
+DB_POOL_TAMANHO = int(os.environ.get("ECHO_DB_POOL", 8))
+cifras_pool = PoolSQLite(CIFRAS_DB_PATH, tamanho=DB_POOL_TAMANHO, observador=observar_sql("cifras"))
+usuarios_pool = PoolSQLite(USUARIOS_DB_PATH, tamanho=DB_POOL_TAMANHO, observador=observar_sql("usuarios"))
+# Estatísticas de uso num banco à parte: a gravação em lote nunca segura o lock do cifras.db
+uso_pool = PoolSQLite(USO_DB_PATH, tamanho=2, observador=observar_sql("uso"))
+
+# O que vai junto no broadcast de open_song:
+#   "id"   -> só o song_id (cada celular busca /api/song/<id>)
+#   "hash" -> song_id + hash do conteúdo + url imutável (celular usa o cache local se o hash bater)
+#   "full" -> song_id + hash + url + música completa, serializada uma vez no servidor
+OPEN_SONG_PAYLOAD = os.environ.get("ECHO_OPEN_SONG_PAYLOAD", "hash").lower()
+# Rajada do router (entrega.py): a primeira troca sai na hora, as que chegam em menos de
+# ECHO_OPEN_SONG_JANELA_MS viram uma só, a última (0 desliga). Celulares que confirmam o open_song
+# (auth={'acks': true}) recebem um por vez; sem confirmação em ECHO_OPEN_SONG_PRAZO_ACK s, o mais novo sai assim mesmo
+OPEN_SONG_JANELA_S = float(os.environ.get("ECHO_OPEN_SONG_JANELA_MS", 150)) / 1000.0
+OPEN_SONG_PRAZO_ACK_S = float(os.environ.get("ECHO_OPEN_SONG_PRAZO_ACK", 5))
+
+# Cache das músicas completas (/api/song, detalhe e open_song), invalidado nas escritas
+cache_cifras = CacheCifras(
+    max_itens=int(os.environ.get("ECHO_CACHE_ITENS", 512)),
+    max_bytes=int(os.environ.get("ECHO_CACHE_BYTES", 32 * 1024 * 1024)),
+)
+
+# Com vários processos, escritas feitas em outro processo chegam pela versão do catálogo:
+# cada processo confere a versão no máximo uma vez por CACHE_SINCRONIZAR_S e limpa o cache se ela mudou
+CACHE_SINCRONIZAR_S = 1.0
+_versao_vista = {'versao': None, 'em': 0.0}
+
+# Pacotes de setlist (todas as cifras da setlist num JSON só), indexados pelo hash do conteúdo
+SETLIST_MAX_MUSICAS = 100
+cache_setlists = CacheCifras(max_itens=16, max_bytes=16 * 1024 * 1024)
+
+# Eventos guardados por sessão (os mais antigos saem); a tela de conectados acompanha pelo namespace /admin
+LOG_SESSAO_MAX = int(os.environ.get("ECHO_LOG_SESSAO", 50))
+ADMIN_NS = "/admin"
+
+# Paginação do catálogo (/api/songs e /api/songs/changes)
+CATALOGO_LIMITE_PADRAO = 500
+CATALOGO_LIMITE_MAXIMO = 2000
+# Lista de músicas do admin (sem busca): linhas por página
+ADMIN_PAGINA = int(os.environ.get("ECHO_ADMIN_PAGINA", 50))
+
+# Busca full-text (busca.py): resultados por página no admin e no /api/search
+BUSCA_LIMITE_ADMIN = 200
+BUSCA_LIMITE_API = 20
+BUSCA_LIMITE_API_MAXIMO = 100
+
+# Importação/exportação em lote (importacao.py): músicas por transação / por página
+IMPORTACAO_LOTE = int(os.environ.get("ECHO_IMPORTACAO_LOTE", 500))
+
+# Estatísticas de uso (uso.py): open_song, /api/song e setlists ficam em memória e vão para o uso.db
+# em lote a cada ECHO_USO_INTERVALO segundos; eventos brutos guardados por ECHO_USO_DIAS dias
+USO_INTERVALO_S = float(os.environ.get("ECHO_USO_INTERVALO", 10))
+uso_acumulador = AcumuladorUso(uso_pool.conexao, dias_brutos=int(os.environ.get("ECHO_USO_DIAS", 90)))
+_uso_tarefa = {'ativa': False}
+
+# Autenticação (autenticacao.py): o /api/login confere a senha uma vez e devolve um token assinado;
+# a API e o identify do socket só conferem o HMAC do token. ECHO_EXIGIR_TOKEN=0 libera clientes antigos.
+EXIGIR_TOKEN = os.environ.get("ECHO_EXIGIR_TOKEN", "1") != "0"
+tokens = EmissorTokens(app.secret_key, validade_s=int(os.environ.get("ECHO_TOKEN_VALIDADE", 12 * 3600)))
+# Tentativas de login que falharam: por IP (protege a CPU do hash de senha) e por login (senha errada).
+# Login certo não conta, senão a banda inteira entrando pelo túnel (tudo 127.0.0.1) esgota a cota
+limite_login_ip = LimitadorTentativas(int(os.environ.get("ECHO_LOGIN_POR_IP", 20)), janela_s=60)
+limite_login_falhas = LimitadorTentativas(5, janela_s=300)
 
 def get_cifras_conn():
-    conn = sqlite3.connect(CIFRAS_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    # Context manager: `with get_cifras_conn() as conn:` devolve a conexão ao pool no fim
+    return cifras_pool.conexao()
 
 def get_usuarios_conn():
-    conn = sqlite3.connect(USUARIOS_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return usuarios_pool.conexao()
+
+def get_uso_conn():
+    return uso_pool.conexao()
+
+def carregar_status_usuario(usuario_id):
+    with get_usuarios_conn() as conn:
+        row = conn.execute("SELECT status, nivel FROM usuarios WHERE id=?", (usuario_id,)).fetchone()
+    return (row["status"], row["nivel"]) if row else None
+
+# Usuário desativado no admin perde o acesso em até ECHO_STATUS_TTL segundos (na hora, neste processo)
+status_usuarios = CacheStatus(carregar_status_usuario, ttl_s=float(os.environ.get("ECHO_STATUS_TTL", 30)))
+
+def sockets_locais():
+    # sid -> sessão dos celulares ligados a ESTE processo (a sala None do Socket.IO tem todos os sids)
+    return socketio.server.manager.rooms.get('/', {}).get(None, {})
+
+def usuarios_identificados():
+    return len({s['user_info'] for _, s in sessoes_vivas() if s.get('processo') == PROCESSO and s['user_info'] != 'Anônimo'})
+
+def estatisticas_caches():
+    return {"cifras": cache_cifras.estatisticas(), "setlists": cache_setlists.estatisticas()}
+
+METRICAS.medidor("echo_socket_connections", "Sockets conectados a este processo", lambda: len(sockets_locais()))
+METRICAS.medidor("echo_identified_users", "Usuários distintos identificados nos sockets deste processo", usuarios_identificados)
+METRICAS.medidor("echo_usage_pending_events", "Eventos de uso em memória esperando a gravação em lote", uso_acumulador.pendentes)
+METRICAS.medidor("echo_usage_written_total", "Eventos de uso gravados no uso.db", lambda: uso_acumulador.gravados, tipo="counter")
+METRICAS.medidor("echo_usage_dropped_total", "Eventos de uso descartados com a fila cheia", lambda: uso_acumulador.descartados, tipo="counter")
+# (campo de CacheCifras.estatisticas(), métrica, tipo, ajuda), um rótulo por cache
+METRICAS_CACHE = (
+    ("acertos", "echo_cache_hits_total", "counter", "Acertos do cache"),
+    ("erros", "echo_cache_misses_total", "counter", "Faltas do cache"),
+    ("remocoes", "echo_cache_evictions_total", "counter", "Itens removidos do cache por falta de espaço"),
+    ("itens", "echo_cache_items", "gauge", "Itens no cache"),
+    ("bytes", "echo_cache_bytes", "gauge", "Bytes ocupados no cache"),
+    ("taxa_acerto", "echo_cache_hit_ratio", "gauge", "Fração de acertos do cache desde o início"),
+)
+for _campo, _nome, _tipo, _ajuda in METRICAS_CACHE:
+    METRICAS.medidor(_nome, _ajuda, lambda campo=_campo: {(nome,): e[campo] for nome, e in estatisticas_caches().items()},
+                     ("cache",), _tipo)
+
+def usuario_do_token(token):
+    # {'id', 'login', 'nivel'} de um token válido de usuário ativo, ou None
+    dados = tokens.verificar(token)
+    if dados is None: return None
+    atual = status_usuarios.obter(dados["id"])
+    if atual is None or atual[0] == 'inativo': return None
+    return dict(dados, nivel=atual[1])
+
+def token_da_requisicao():
+    cabecalho = request.headers.get("Authorization", "")
+    return cabecalho[7:].strip() if cabecalho.startswith("Bearer ") else None
+
+def exigir_token(rota):
+    @wraps(rota)
+    def protegida(*args, **kwargs):
+        # g.usuario: dono do token (ou None), para as estatísticas de uso
+        g.usuario = usuario_do_token(token_da_requisicao())
+        if EXIGIR_TOKEN and g.usuario is None:
+            return jsonify({"error": "401", "message": "Token inválido ou expirado"}), 401
+        return rota(*args, **kwargs)
+    return protegida
 
 def init_dbs():
-    conn = get_cifras_conn()
-    conn.execute("CREATE TABLE IF NOT EXISTS cifras (id INTEGER PRIMARY KEY AUTOINCREMENT, titulo TEXT NOT NULL, banda TEXT NOT NULL, tom TEXT NOT NULL, letra TEXT NOT NULL, cifra TEXT NOT NULL, created_at TEXT NOT NULL)")
-    conn.close()
-    
-    conn = get_usuarios_conn()
-    # NOVA ESTRUTURA: nome_completo, login, email
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS usuarios (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, 
-            nome_completo TEXT NOT NULL,
-            login TEXT NOT NULL UNIQUE, 
-            email TEXT NOT NULL,
-            senha TEXT NOT NULL, 
-            nivel TEXT NOT NULL, 
-            status TEXT NOT NULL DEFAULT 'ativo'
-        )
-    """)
-    conn.close()
+    # Esquema versionado em migracoes.py (PRAGMA user_version de cada banco)
+    with get_cifras_conn() as conn:
+        migracoes.aplicar(conn, migracoes.CIFRAS)
+    with get_usuarios_conn() as conn:
+        migracoes.aplicar(conn, migracoes.USUARIOS)
+    with get_uso_conn() as conn:
+        migracoes.aplicar(conn, migracoes.USO)
+
+def sincronizar_cache():
+    if not (MESSAGE_QUEUE or ESTADO.compartilhado): return
+    agora = time.monotonic()
+    if agora - _versao_vista['em'] < CACHE_SINCRONIZAR_S: return
+    with get_cifras_conn() as conn: versao = versao_catalogo(conn)
+    if _versao_vista['versao'] is not None and versao != _versao_vista['versao']: cache_cifras.invalidar()
+    _versao_vista.update(versao=versao, em=agora)
+
+def carregar_cifra(cifra_id):
+    # Música pronta para servir (EntradaCifra) ou None; só vai ao banco em caso de miss
+    try: cifra_id = int(cifra_id)
+    except (TypeError, ValueError): return None
+    sincronizar_cache()
+    entrada = cache_cifras.obter(cifra_id)
+    if entrada is None:
+        # Antes da leitura: se uma edição invalidar a música enquanto isso, o guardar não grava a versão velha
+        geracao = cache_cifras.geracao(cifra_id)
+        with get_cifras_conn() as conn:
+            # Sem a coluna versao: ela muda a cada escrita e o corpo de /api/song/<id>/<hash> não pode mudar
+            row = conn.execute("SELECT id, titulo, banda, tom, letra, cifra, created_at, hash FROM cifras WHERE id=?", (cifra_id,)).fetchone()
+        if row is None: return None
+        dados = dict(row)
+        # Linha gravada por fora do app (servidor.py antigo, scripts): calcula na hora
+        if not dados["hash"]: dados["hash"] = hash_cifra(dados["titulo"], dados["banda"], dados["tom"], dados["letra"], dados["cifra"])
+        entrada = cache_cifras.guardar(cifra_id, dados, dados["hash"], geracao)
+    return entrada
+
+def cifra_transposta(entrada, semitons):
+    # Variante transposta da música, memorizada na própria entrada do cache (por deslocamento)
+    semitons %= 12
+    if not semitons: return entrada
+    variante = entrada.variantes.get(semitons)
+    if variante is None:
+        dados = dict(entrada.dados)
+        dados["tom"] = transposicao.tom_transposto(entrada.dados["tom"], semitons)
+        dados["cifra"] = transposicao.transpor(entrada.dados["cifra"], semitons, transposicao.usa_bemois(dados["tom"]))
+        dados["tom_original"] = entrada.dados["tom"]
+        dados["semitones"] = semitons
+        variante = entrada.guardar_variante(semitons, dados)
+    return variante
+
+def montar_setlist(song_ids):
+    # Um pacote com todas as cifras da setlist, codificado/comprimido uma vez e servido pelo hash
+    musicas = []
+    for cifra_id in song_ids:
+        entrada = carregar_cifra(cifra_id)
+        if entrada: musicas.append({"hash": entrada.hash, "song": entrada.dados})
+    pacote = EntradaCifra({"song_ids": [m["song"]["id"] for m in musicas], "songs": musicas})
+    # A mesma entrada vai para o cache: o pacote é codificado e comprimido uma vez só
+    return cache_setlists.guardar(pacote.hash, pacote)
+
+def publicar_setlist(song_ids, sala):
+    pacote = montar_setlist(song_ids)
+    atual = setlists[sala] = {'hash': pacote.hash, 'song_ids': pacote.dados["song_ids"]}
+    emitir_sala('setlist', dict(atual, url=url_setlist(pacote.hash)), sala)
+
+def url_setlist(conteudo_hash):
+    return f"/api/setlist/{conteudo_hash}"
+
+def url_cifra(cifra_id, conteudo_hash):
+    return f"/api/song/{cifra_id}/{conteudo_hash}"
+
+def atualizar_setlist_se_afetada(cifra_id):
+    # Editar/excluir uma música da setlist gera um pacote novo (hash novo) para os celulares
+    for sala, atual in list(setlists.items()):
+        if cifra_id in atual['song_ids']: publicar_setlist(atual['song_ids'], sala)
+
+def responder_entrada(entrada, imutavel=False):
+    # Resposta a partir de uma EntradaCifra: 304 pelo ETag e corpo pré-comprimido pelo Accept-Encoding,
+    # em JSON ou MessagePack conforme o Accept (cada formato com o seu ETag)
+    binario = serializacao.prefere_msgpack(request.accept_mimetypes)
+    etag = entrada.hash + ".mp" if binario else entrada.hash
+    if request.if_none_match.contains(etag):
+        resp = app.response_class(status=304)
+    else:
+        aceitas = request.accept_encodings
+        preferida = "br" if aceitas["br"] else "gzip" if aceitas["gzip"] else None
+        corpo, codificacao = entrada.corpo_msgpack(preferida) if binario else entrada.corpo(preferida)
+        resp = app.response_class(corpo, mimetype=serializacao.MSGPACK if binario else "application/json")
+        if codificacao: resp.headers["Content-Encoding"] = codificacao
+    resp.headers["Vary"] = "Accept, Accept-Encoding"
+    # Endereço com hash: nunca muda, guarda por um ano. Sem hash: pode guardar, mas confere o ETag antes de usar
+    resp.headers["Cache-Control"] = "public, max-age=31536000, immutable" if imutavel else "no-cache"
+    resp.set_etag(etag)
+    return resp
+
+def responder_dados(dados):
+    # Respostas montadas na hora (catálogo, busca): JSON ou MessagePack pelo Accept, comprimidas se valer a pena
+    corpo, mimetype = serializacao.codificar(dados, serializacao.prefere_msgpack(request.accept_mimetypes))
+    corpo, codificacao = serializacao.comprimir(corpo, request.accept_encodings)
+    resp = app.response_class(corpo, mimetype=mimetype)
+    if codificacao: resp.headers["Content-Encoding"] = codificacao
+    resp.headers["Vary"] = "Accept, Accept-Encoding"
+    return resp
+
+def registrar_evento(sid, tipo, **dados):
+    # Guarda o evento no buffer da sessão e repassa para quem está com a tela de conectados aberta
+    sessao = connected_users.get(sid)
+    if sessao is None: return
+    evento = dict(dados, tipo=tipo, hora=datetime.now().strftime("%H:%M:%S"))
+    sessao['logs'].append(evento)
+    del sessao['logs'][:-LOG_SESSAO_MAX]
+    connected_users[sid] = sessao
+    socketio.emit('sessao_evento', {'sid': sid, 'user_info': sessao['user_info'], 'sala': sessao['sala'], 'evento': evento},
+                  namespace=ADMIN_NS)
+
+def registrar_uso(tipo, cifra_id, usuario=None, sala=None):
+    # Só um append em memória; a tarefa de fundo (iniciada no primeiro evento) grava em lote
+    try: cifra_id = int(cifra_id)
+    except (TypeError, ValueError): return
+    uso_acumulador.registrar(tipo, cifra_id, usuario, sala)
+    if _uso_tarefa['ativa']: return
+    _uso_tarefa['ativa'] = True
+    socketio.start_background_task(uso_acumulador.rodar, USO_INTERVALO_S, socketio.sleep)
+
+# O que ainda estiver na fila ao encerrar o processo vai para o banco
+atexit.register(lambda: uso_acumulador.descarregar())
+
+def sessoes_vivas():
+    # list() porque os handlers alteram o dict enquanto a página renderiza
+    itens = list(connected_users.items())
+    if not ESTADO.compartilhado: return itens
+    agora = time.time()
+    vivos = {p for p, visto in processos.items() if agora - visto < 3 * PROCESSO_BATIMENTO_S}
+    vivas = []
+    for sid, s in itens:
+        if s.get('processo') in vivos: vivas.append((sid, s))
+        else: connected_users.pop(sid, None)  # processo caiu sem limpar as sessões dele
+    return vivas
+
+def manter_processo_vivo():
+    # Sinal de vida deste processo; as sessões de processos que pararam de bater somem da lista
+    processos[PROCESSO] = time.time()
+    if _batimento['ativo']: return
+    _batimento['ativo'] = True
+    def bater():
+        while True:
+            socketio.sleep(PROCESSO_BATIMENTO_S)
+            processos[PROCESSO] = time.time()
+    socketio.start_background_task(bater)
+
+def resumo_sessoes():
+    # Cópia para a tela de conectados
+    return [{'sid': sid, 'user_info': s['user_info'], 'sala': s['sala'], 'conectado_em': s['conectado_em'],
+             'logs': list(s['logs'])} for sid, s in sessoes_vivas()]
+
+def sala_de(sid):
+    sessao = connected_users.get(sid)
+    return sessao['sala'] if sessao else SALA_PADRAO
+
+def sala_socket(sala, binario=False):
+    # Cada sala vira duas salas do Socket.IO, uma por formato: o pacote é codificado uma vez por formato
+    # (o nome de sala não aceita '#', então não colide com uma sala de verdade)
+    return f"{sala}#msgpack" if binario else sala
+
+def emitir_sala(evento, dados, sala, skip_sid=None):
+    socketio.emit(evento, dados, to=sala, skip_sid=skip_sid)
+    if serializacao.disponivel():
+        socketio.emit(evento, serializacao.empacotar(dados), to=sala_socket(sala, True), skip_sid=skip_sid)
+
+def emitir(evento, dados, binario=False):
+    # Só para quem disparou o evento, no formato que ele pediu no handshake
+    emit(evento, serializacao.empacotar(dados) if binario else dados)
+
+def entrar_na_sala(sid, sala):
+    # Troca a sessão de sala e manda para ela o estado da sala nova (router e setlist)
+    sessao = connected_users.get(sid)
+    if sessao is None: return
+    antiga = sessao['sala']
+    binario = sessao.get('formato') == 'msgpack'
+    if antiga: leave_room(sala_socket(antiga, binario))
+    join_room(sala_socket(sala, binario))
+    sessao['sala'] = sala
+    connected_users[sid] = sessao
+    if sid in clientes_ack: clientes_ack[sid] = (sala, binario)
+    if antiga and routers.get(antiga) == sessao['user_info'] and not any(
+            s['sala'] == antiga and s['user_info'] == sessao['user_info'] for _, s in sessoes_vivas()):
+        # O router saiu da sala (e não tem outro aparelho lá): a sala fica sem router
+        routers.pop(antiga, None)
+        registrar_evento(sid, 'release_router', usuario=sessao['user_info'], sala=antiga)
+        emitir_sala('router_claimed', {'router_user': None, 'room': antiga}, antiga)
+    limpar_sala_vazia(antiga)
+    emitir('router_claimed', {'router_user': routers.get(sala), 'room': sala}, binario)
+    # Quem entra já recebe a setlist atual para pré-carregar todas as cifras de uma vez
+    atual = setlists.get(sala)
+    if atual: emitir('setlist', dict(atual, url=url_setlist(atual['hash'])), binario)
+    enviar_estado_atual(sala, binario)
+
+# sid -> (sala, binario) dos celulares DESTE processo que confirmam o open_song; o resto recebe pela sala
+clientes_ack = {}
+
+def enviar_confirmado(sid, payload, confirmar):
+    _, binario = clientes_ack.get(sid, (None, False))
+    socketio.emit('open_song', serializacao.empacotar(payload) if binario else payload, to=sid, callback=confirmar)
+
+def agendar(funcao, atraso_s):
+    def tarefa():
+        socketio.sleep(atraso_s)
+        funcao()
+    socketio.start_background_task(tarefa)
+
+def entregar_open_song(sala, item):
+    # Roda na hora do toque ou no fim da janela (tarefa de fundo, sem request)
+    payload, router_sid = item
+    confirmam = [sid for sid, (s, _) in list(clientes_ack.items()) if s == sala and sid != router_sid]
+    salas = socketio.server.manager.rooms.get('/', {})
+    membros = [salas.get(sala_socket(sala, b), {}) for b in (False, True)]
+    # O router não recebe o próprio open_song, mas só é descontado se estiver mesmo na sala
+    m_fanout_clientes.observar(sum(len(m) for m in membros) - any(router_sid in m for m in membros))
+    inicio = time.perf_counter()
+    # Só para a sala do router: o custo do fan-out acompanha o tamanho da sala
+    emitir_sala('open_song', payload, sala, skip_sid=[router_sid] + confirmam)
+    for sid in confirmam: entregas.entregar(sid, payload)
+    m_fanout_duracao.observar(time.perf_counter() - inicio)
+
+rajadas_open_song = Coalescedor(OPEN_SONG_JANELA_S, entregar_open_song, agendar)
+entregas = EntregaConfirmada(enviar_confirmado, agendar, prazo_s=OPEN_SONG_PRAZO_ACK_S, ao_confirmar=m_open_song_ack.observar)
+METRICAS.medidor("echo_open_song_coalesced_total", "open_song do router substituídos por um mais novo dentro da janela",
+                 lambda: rajadas_open_song.coalescidos, tipo="counter")
+METRICAS.medidor("echo_open_song_skipped_total", "open_song que um celular lento pulou (chegou um mais novo antes da confirmação)",
+                 lambda: entregas.pulados, tipo="counter")
+METRICAS.medidor("echo_open_song_unacked_clients", "Celulares com um open_song ainda sem confirmação", entregas.atrasados)
+
+def proximo_seq(anterior):
+    # Sempre crescente, inclusive depois de reiniciar o servidor (parte do relógio em ms)
+    return max((anterior or 0) + 1, int(time.time() * 1000))
+
+def payload_open_song(song_id, seq):
+    payload = {'song_id': song_id, 'seq': seq}
+    if OPEN_SONG_PAYLOAD in ("hash", "full"):
+        # Uma leitura (normalmente do cache) por troca de música, não uma por celular
+        entrada = carregar_cifra(song_id)
+        if entrada:
+            payload['hash'] = entrada.hash
+            payload['url'] = url_cifra(song_id, entrada.hash)
+            # O python-socketio codifica o pacote uma única vez para todo o broadcast
+            if OPEN_SONG_PAYLOAD == "full": payload['song'] = entrada.dados
+    return payload
+
+def enviar_estado_atual(sala, binario=False):
+    # Quem entra (ou reconecta) recebe na hora a música e o tom atuais da sala, com os mesmos seq
+    atual = atuais.get(sala)
+    if not atual: return
+    emitir('open_song', dict(payload_open_song(atual['song_id'], atual['seq_musica']), catchup=True), binario)
+    if atual['semitones']:
+        emitir('key_changed', {'song_id': atual['song_id'], 'semitones': atual['semitones'], 'tom': atual['tom'],
+                               'seq': atual['seq'], 'catchup': True}, binario)
+
+def limpar_sala_vazia(sala):
+    # Salas sem ninguém não guardam router nem setlist (a sala padrão mantém os dela)
+    if not sala or sala == SALA_PADRAO: return
+    if any(s['sala'] == sala for _, s in sessoes_vivas()): return
+    routers.pop(sala, None); setlists.pop(sala, None); atuais.pop(sala, None)
+    rajadas_open_song.esquecer(sala)
+
+def resumo_salas():
+    salas = {SALA_PADRAO: 0}
+    for _, s in sessoes_vivas(): salas[s['sala']] = salas.get(s['sala'], 0) + 1
+    return {sala: {'clientes': n, 'router': routers.get(sala)} for sala, n in sorted(salas.items())}
+
+def codificar_cursor(*valores):
+    bruto = json.dumps(list(valores), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(bruto).decode("ascii").rstrip("=")
+
+def decodificar_cursor(cursor, tipos):
+    # Retorna a tupla convertida com `tipos` (ex.: (str, int)) ou None se o cursor for inválido
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        valores = json.loads(bruto.decode("utf-8"))
+        if not isinstance(valores, list) or len(valores) != len(tipos):
+            return None
+        return tuple(t(v) for t, v in zip(tipos, valores))
+    except (ValueError, TypeError):
+        return None
 
 # ===================== ROTAS WEB GERAIS =====================
 
+@app.before_request
+def iniciar_medicao():
+    g.perfil = perfilador.iniciar() if perfilador else None
+    g.inicio = time.perf_counter()
+
+@app.after_request
+def medir_requisicao(resp):
+    # Rota pelo molde (/api/song/<int:cifra_id>), não pelo caminho: cardinalidade fixa
+    if "inicio" in g:
+        duracao = time.perf_counter() - g.inicio
+        rota = request.url_rule.rule if request.url_rule else "nao_encontrada"
+        m_http.observar(duracao, rota, request.method, resp.status_code)
+        if g.perfil:
+            perfilador.terminar(g.perfil, duracao, f"{request.method} {rota} {resp.status_code}")
+            g.perfil = None
+    return resp
+
+@app.teardown_request
+def encerrar_perfil(erro=None):
+    # Exceção na view: after_request não roda, mas o perfilador precisa ser liberado
+    if g.get("perfil"):
+        perfilador.terminar(g.perfil, time.perf_counter() - g.inicio, f"{request.method} {request.path} erro")
+
 @app.route("/")
 def home():
     return redirect(url_for("listar_cifras"))
 
 @app.route("/cifras")
 def listar_cifras():
-    conn = get_cifras_conn()
     q = request.args.get("q", "").strip()
     if q:
-        musicas = conn.execute("SELECT * FROM cifras WHERE titulo LIKE ? OR banda LIKE ? ORDER BY created_at DESC", (f"%{q}%", f"%{q}%")).fetchall()
-    else:
-        musicas = conn.execute("SELECT * FROM cifras ORDER BY created_at DESC").fetchall()
-    conn.close()
-    return render_template("index.html", musicas=musicas, q=q)
+        with get_cifras_conn() as conn:
+            musicas = busca.buscar(conn, q, limite=BUSCA_LIMITE_ADMIN, colunas="c.id, c.titulo, c.banda, c.tom, c.created_at")
+        return render_template("index.html", musicas=musicas, q=q, proxima=None)
+    # Página por chave (created_at, id): só as colunas da tabela, custo igual em qualquer página
+    cursor = request.args.get("antes", "").strip()
+    posicao = decodificar_cursor(cursor, (str, int)) if cursor else None
+    with get_cifras_conn() as conn:
+        if posicao:
+            rows = conn.execute("SELECT id, titulo, banda, tom, created_at FROM cifras WHERE (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?", (*posicao, ADMIN_PAGINA + 1)).fetchall()
+        else:
+            rows = conn.execute("SELECT id, titulo, banda, tom, created_at FROM cifras ORDER BY created_at DESC, id DESC LIMIT ?", (ADMIN_PAGINA + 1,)).fetchall()
+    proxima = codificar_cursor(rows[ADMIN_PAGINA - 1]["created_at"], rows[ADMIN_PAGINA - 1]["id"]) if len(rows) > ADMIN_PAGINA else None
+    return render_template("index.html", musicas=rows[:ADMIN_PAGINA], q=q, proxima=proxima, paginado=bool(posicao))
 
 @app.route("/cifras/nova", methods=["GET", "POST"])
 def criar_cifra():
     if request.method == "POST":
         data = [request.form.get("titulo"), request.form.get("banda"), request.form.get("tom"), request.form.get("letra"), request.form.get("cifra"), datetime.now().isoformat()]
-        conn = get_cifras_conn()
-        conn.execute("INSERT INTO cifras (titulo, banda, tom, letra, cifra, created_at) VALUES (?, ?, ?, ?, ?, ?)", data)
-        conn.commit(); conn.close()
+        with get_cifras_conn() as conn:
+            cifra_id = catalogo.inserir(conn, *data)
+            conn.commit()
+        cache_cifras.invalidar(cifra_id)
         flash("Cifra cadastrada!", "success")
         return redirect(url_for("listar_cifras"))
     return render_template("create_edit.html", mode="create", values={})
 
 @app.route("/cifras/<int:cifra_id>")
 def detalhar_cifra(cifra_id):
-    conn = get_cifras_conn()
-    row = conn.execute("SELECT * FROM cifras WHERE id = ?", (cifra_id,)).fetchone()
-    conn.close()
-    return render_template("detail.html", m=row)
+    entrada = carregar_cifra(cifra_id)
+    return render_template("detail.html", m=entrada.dados if entrada else None)
 
 @app.route("/cifras/<int:cifra_id>/editar", methods=["GET", "POST"])
 def editar_cifra(cifra_id):
-    conn = get_cifras_conn()
     if request.method == "POST":
         data = [request.form.get("titulo"), request.form.get("banda"), request.form.get("tom"), request.form.get("letra"), request.form.get("cifra"), cifra_id]
-        conn.execute("UPDATE cifras SET titulo=?, banda=?, tom=?, letra=?, cifra=? WHERE id=?", data)
-        conn.commit(); conn.close()
+        with get_cifras_conn() as conn:
+            catalogo.atualizar(conn, cifra_id, *data[:-1])
+            conn.commit()
+        cache_cifras.invalidar(cifra_id)
+        atualizar_setlist_se_afetada(cifra_id)
         flash("Cifra atualizada!", "success"); return redirect(url_for("detalhar_cifra", cifra_id=cifra_id))
-    row = conn.execute("SELECT * FROM cifras WHERE id = ?", (cifra_id,)).fetchone()
-    conn.close(); return render_template("create_edit.html", mode="edit", values=row)
+    with get_cifras_conn() as conn:
+        row = conn.execute("SELECT * FROM cifras WHERE id = ?", (cifra_id,)).fetchone()
+    return render_template("create_edit.html", mode="edit", values=row)
 
 @app.route("/cifras/<int:cifra_id>/excluir", methods=["POST"])
 def excluir_cifra(cifra_id):
-    conn = get_cifras_conn()
-    conn.execute("DELETE FROM cifras WHERE id = ?", (cifra_id,))
-    conn.commit(); conn.close()
+    with get_cifras_conn() as conn:
+        catalogo.excluir(conn, cifra_id)
+        conn.commit()
+    cache_cifras.invalidar(cifra_id)
+    atualizar_setlist_se_afetada(cifra_id)
     flash("Cifra excluída.", "info"); return redirect(url_for("listar_cifras"))
 
+@app.route("/cifras/importar", methods=["GET", "POST"])
+def importar_cifras():
+    if request.method == "POST":
+        arquivo = request.files.get("arquivo")
+        formato = request.form.get("formato") or importacao.formato_por_nome(arquivo.filename if arquivo else "")
+        if not arquivo or not arquivo.filename:
+            flash("Escolha um arquivo para importar.", "warning"); return redirect(url_for("importar_cifras"))
+        if formato not in importacao.FORMATOS:
+            flash("Formato não reconhecido pela extensão; escolha o formato.", "warning"); return redirect(url_for("importar_cifras"))
+        # Lido em fluxo direto do upload, gravado em lotes de IMPORTACAO_LOTE
+        texto = io.TextIOWrapper(arquivo.stream, encoding="utf-8-sig", errors="replace", newline="")
+        with get_cifras_conn() as conn:
+            resumo = importacao.importar(conn, texto, formato, lote=IMPORTACAO_LOTE,
+                                         permitir_duplicadas=bool(request.form.get("permitir_duplicadas")))
+        cache_cifras.invalidar()
+        flash(f"Importação: {resumo['inseridas']} inseridas, {resumo['duplicadas']} duplicadas, {resumo['invalidas']} inválidas.",
+              "success" if resumo["inseridas"] else "warning")
+        return render_template("importar.html", formatos=importacao.FORMATOS, erros=resumo["erros"])
+    return render_template("importar.html", formatos=importacao.FORMATOS, erros=[])
+
+@app.route("/cifras/exportar")
+def exportar_cifras():
+    formato = request.args.get("formato", "jsonl")
+    if formato not in importacao.FORMATOS: return jsonify({"error": "formato inválido"}), 400
+    extensao = {"jsonl": "jsonl", "csv": "csv", "chordpro": "cho"}[formato]
+    return Response(stream_with_context(importacao.exportar(get_cifras_conn, formato, lote=IMPORTACAO_LOTE)),
+                    mimetype="text/csv" if formato == "csv" else "text/plain",
+                    headers={"Content-Disposition": f'attachment; filename="cifras.{extensao}"'})
+
 # ===================== ROTAS ADMIN =====================
 
 @app.route("/admin/usuarios")
 def gerenciar_usuarios():
-    conn = get_usuarios_conn()
-    # Ajustado para exibir o login e nome_completo
-    usuarios = conn.execute("SELECT * FROM usuarios ORDER BY nome_completo").fetchall()
-    conn.close(); return render_template("admin_usuarios.html", usuarios=usuarios)
+    with get_usuarios_conn() as conn:
+        # Ajustado para exibir o login e nome_completo
+        usuarios = conn.execute("SELECT * FROM usuarios ORDER BY nome_completo").fetchall()
+    return render_template("admin_usuarios.html", usuarios=usuarios)
 
 @app.route("/admin/conectados")
 def usuarios_conectados():
-    return render_template("usuarios_conectados.html", users=connected_users, router_user=router_user)
+    return render_template("usuarios_conectados.html", sessoes=resumo_sessoes(), salas=resumo_salas(),
+                           sala_padrao=SALA_PADRAO, log_max=LOG_SESSAO_MAX)
+
+@app.route("/admin/uso")
+def relatorio_uso():
+    # Relatórios só dos totais por dia (uso_diario_*); ?dias=N define o período (padrão 30)
+    dias = max(1, min(request.args.get("dias", 30, type=int), 3650))
+    desde = uso.dia_de(time.time() - (dias - 1) * 86400)
+    try:
+        uso_acumulador.descarregar()  # o que está em memória entra no relatório
+    except Exception:
+        # Banco ocupado/com erro: o lote volta para a fila (a tarefa de fundo tenta de novo) e o relatório
+        # sai com o que já estava gravado
+        app.logger.exception("falha ao gravar as estatísticas de uso antes do relatório")
+        flash("Os usos mais recentes ainda não foram gravados; o relatório mostra o que já estava no banco.", "warning")
+    with get_uso_conn() as conn:
+        musicas = uso.mais_usadas(conn, desde)
+        usuarios = uso.atividade_usuarios(conn, desde)
+        diario = uso.por_dia(conn, desde)
+    titulos = {}
+    if musicas:
+        with get_cifras_conn() as conn:
+            ids = [m["cifra_id"] for m in musicas]
+            titulos = {r["id"]: r for r in conn.execute(f"SELECT id, titulo, banda FROM cifras WHERE id IN ({','.join('?' * len(ids))})", ids)}
+    return render_template("uso.html", dias=dias, musicas=musicas, usuarios=usuarios, diario=diario, titulos=titulos)
 
 @app.route("/admin/usuarios/novo", methods=["POST"])
 def criar_usuario():
@@ -125,75 +684,378 @@ def criar_usuario():
     nivel = request.form.get("nivel")
     
     hash_s = generate_password_hash(senha)
-    conn = get_usuarios_conn()
-    try:
-        conn.execute("""
-            INSERT INTO usuarios (nome_completo, login, email, senha, nivel) 
-            VALUES (?, ?, ?, ?, ?)
-        """, (nome_completo, login, email, hash_s, nivel))
-        conn.commit()
-        flash("Usuário criado com sucesso!", "success")
-    except:
-        flash("Erro: O Login informado já existe.", "danger")
-    conn.close()
+    with get_usuarios_conn() as conn:
+        try:
+            conn.execute("""
+                INSERT INTO usuarios (nome_completo, login, email, senha, nivel) 
+                VALUES (?, ?, ?, ?, ?)
+            """, (nome_completo, login, email, hash_s, nivel))
+            conn.commit()
+            flash("Usuário criado com sucesso!", "success")
+        except:
+            flash("Erro: O Login informado já existe.", "danger")
     return redirect(url_for("gerenciar_usuarios"))
 
 @app.route("/admin/usuarios/<int:user_id>/status", methods=["POST"])
 def alternar_status_usuario(user_id):
-    conn = get_usuarios_conn()
-    user = conn.execute("SELECT status FROM usuarios WHERE id=?", (user_id,)).fetchone()
-    if user:
-        novo = "inativo" if user['status'] == 'ativo' else "ativo"
-        conn.execute("UPDATE usuarios SET status=? WHERE id=?", (novo, user_id))
-        conn.commit()
-    conn.close(); return redirect(url_for("gerenciar_usuarios"))
+    with get_usuarios_conn() as conn:
+        user = conn.execute("SELECT status FROM usuarios WHERE id=?", (user_id,)).fetchone()
+        if user:
+            novo = "inativo" if user['status'] == 'ativo' else "ativo"
+            conn.execute("UPDATE usuarios SET status=? WHERE id=?", (novo, user_id))
+            conn.commit()
+    status_usuarios.invalidar(user_id)
+    return redirect(url_for("gerenciar_usuarios"))
 
 @app.route("/admin/usuarios/<int:user_id>/excluir", methods=["POST"])
 def excluir_usuario(user_id):
-    conn = get_usuarios_conn()
-    conn.execute("DELETE FROM usuarios WHERE id = ?", (user_id,))
-    conn.commit(); conn.close(); return redirect(url_for("gerenciar_usuarios"))
+    with get_usuarios_conn() as conn:
+        conn.execute("DELETE FROM usuarios WHERE id = ?", (user_id,))
+        conn.commit()
+    status_usuarios.invalidar(user_id)
+    return redirect(url_for("gerenciar_usuarios"))
 
 # ===================== API JSON E SOCKETS =====================
 
+def ip_cliente():
+    # Pelo túnel (ngrok na mesma máquina) todo celular chega como 127.0.0.1: vale o último salto do
+    # X-Forwarded-For, o que o ngrok acrescentou. Os anteriores vêm do próprio cliente (trocar a cada
+    # tentativa daria uma cota nova). Fora do loopback o cabeçalho é ignorado pelo mesmo motivo
+    encaminhado = request.headers.get("X-Forwarded-For", "")
+    if encaminhado and request.remote_addr in ("127.0.0.1", "::1"):
+        return encaminhado.split(",")[-1].strip() or request.remote_addr
+    return request.remote_addr
+
 @app.route("/api/login", methods=["POST"])
 def api_login():
-    data = request.get_json()
+    data = request.get_json(silent=True) or {}
+    login = str(data.get("username") or "")
+    ip = ip_cliente()
+    espera = limite_login_ip.bloqueado(ip) or limite_login_falhas.bloqueado(login)
+    if espera:
+        m_login_bloqueado.inc()
+        resp = jsonify({"status": "error", "message": "Muitas tentativas"})
+        resp.status_code = 429
+        resp.headers["Retry-After"] = str(espera)
+        return resp
     # Acesso via campo 'login'
-    row = get_usuarios_conn().execute("SELECT * FROM usuarios WHERE login=?", (data.get("username"),)).fetchone()
-    if row and check_password_hash(row["senha"], data.get("password")):
+    with get_usuarios_conn() as conn:
+        row = conn.execute("SELECT * FROM usuarios WHERE login=?", (login,)).fetchone()
+    cpu = time.thread_time()
+    senha_ok = bool(row) and check_password_hash(row["senha"], str(data.get("password") or ""))
+    m_login_cpu.observar(time.thread_time() - cpu, "ok" if senha_ok else "invalid" if row else "unknown_user")
+    if senha_ok:
         if row["status"] == 'inativo': return jsonify({"status": "error", "message": "Inativo"}), 403
-        return jsonify({"status": "success", "nivel": row["nivel"]})
+        limite_login_falhas.zerar(login)
+        return jsonify({"status": "success", "nivel": row["nivel"], "login": row["login"],
+                        "token": tokens.emitir(row["id"], row["login"], row["nivel"]), "expires_in": tokens.validade_s})
+    limite_login_ip.registrar(ip)
+    limite_login_falhas.registrar(login)
     return jsonify({"status": "error", "message": "Erro"}), 401
 
+@app.route("/api/me")
+def api_me():
+    # O app confere o token salvo ao abrir, sem pedir a senha de novo
+    usuario = usuario_do_token(token_da_requisicao())
+    if usuario is None: return jsonify({"error": "401", "message": "Token inválido ou expirado"}), 401
+    return jsonify({"login": usuario["login"], "nivel": usuario["nivel"]})
+
 @app.route("/api/songs")
+@exigir_token
 def api_songs():
-    rows = get_cifras_conn().execute("SELECT * FROM cifras ORDER BY titulo").fetchall()
-    return jsonify([dict(r) for r in rows])
+    # Catálogo enxuto: só o que a lista do app usa. Letra/cifra vêm de /api/song/<id>/<hash>
+    limite = request.args.get("limit", CATALOGO_LIMITE_PADRAO, type=int)
+    limite = max(1, min(limite, CATALOGO_LIMITE_MAXIMO))
+    cursor = request.args.get("after", "").strip()
+    posicao = None
+    if cursor:
+        posicao = decodificar_cursor(cursor, (str, int))
+        if posicao is None: return jsonify({"error": "cursor inválido"}), 400
+
+    with get_cifras_conn() as conn:
+        versao = versao_catalogo(conn)
+        etag = f"catalogo-{versao}"
+        if request.if_none_match.contains(etag):
+            resp = app.response_class(status=304)
+            resp.set_etag(etag)
+            return resp
+        if posicao:
+            rows = conn.execute("SELECT id, titulo, banda, tom, hash FROM cifras WHERE (titulo, id) > (? COLLATE NOCASE, ?) ORDER BY titulo COLLATE NOCASE, id LIMIT ?", (*posicao, limite + 1)).fetchall()
+        else:
+            rows = conn.execute("SELECT id, titulo, banda, tom, hash FROM cifras ORDER BY titulo COLLATE NOCASE, id LIMIT ?", (limite + 1,)).fetchall()
+
+    resp = responder_dados([dict(r) for r in rows[:limite]])
+    resp.set_etag(etag)
+    resp.headers["X-Catalog-Version"] = str(versao)
+    if len(rows) > limite:
+        ultimo = rows[limite - 1]
+        resp.headers["X-Next-Cursor"] = codificar_cursor(ultimo["titulo"], ultimo["id"])
+    return resp
+
+@app.route("/api/songs/changes")
+@exigir_token
+def api_songs_changes():
+    # Só o que mudou desde a versão que o cliente já tem. since=0 (ou ausente) = catálogo completo.
+    # Páginas seguem o cursor em "next"; ao chegar em next=null o cliente guarda a "version"
+    # da primeira página (o que for escrito no meio do caminho volta no próximo sync).
+    desde = max(request.args.get("since", 0, type=int), 0)
+    limite = request.args.get("limit", CATALOGO_LIMITE_PADRAO, type=int)
+    limite = max(1, min(limite, CATALOGO_LIMITE_MAXIMO))
+    cursor = request.args.get("after", "").strip()
+    posicao = None
+    if cursor:
+        posicao = decodificar_cursor(cursor, (int, int))
+        if posicao is None: return jsonify({"error": "cursor inválido"}), 400
+
+    with get_cifras_conn() as conn:
+        versao = versao_catalogo(conn)
+        # Cliente à frente do servidor = banco recriado; devolve tudo e avisa para descartar o cache
+        reinicio = desde > versao
+        if reinicio:
+            desde = 0
+        elif desde == versao:
+            return responder_dados({"version": versao, "changed": [], "deleted": [], "next": None, "reset": False})
+
+        if posicao:
+            rows = conn.execute("SELECT id, titulo, banda, tom, hash, versao FROM cifras WHERE versao > ? AND (versao, id) > (?, ?) ORDER BY versao, id LIMIT ?", (desde, *posicao, limite + 1)).fetchall()
+        else:
+            rows = conn.execute("SELECT id, titulo, banda, tom, hash, versao FROM cifras WHERE versao > ? ORDER BY versao, id LIMIT ?", (desde if desde else -1, limite + 1)).fetchall()
+
+        excluidas = []
+        if desde and not cursor:
+            excluidas = [r["id"] for r in conn.execute("SELECT id FROM cifras_excluidas WHERE versao > ? ORDER BY versao", (desde,))]
+
+    proximo = None
+    if len(rows) > limite:
+        rows = rows[:limite]
+        proximo = codificar_cursor(rows[-1]["versao"], rows[-1]["id"])
+    return responder_dados({
+        "version": versao,
+        "changed": [{"id": r["id"], "titulo": r["titulo"], "banda": r["banda"], "tom": r["tom"], "hash": r["hash"]} for r in rows],
+        "deleted": excluidas,
+        "next": proximo,
+        "reset": reinicio,
+    })
+
+@app.route("/api/search")
+@exigir_token
+def api_search():
+    # Autocomplete: cada palavra casa por prefixo, sem acentos, ordenado por relevância (bm25)
+    q = request.args.get("q", "").strip()
+    limite = request.args.get("limit", BUSCA_LIMITE_API, type=int)
+    limite = max(1, min(limite, BUSCA_LIMITE_API_MAXIMO))
+    if not q: return responder_dados([])
+    with get_cifras_conn() as conn:
+        rows = busca.buscar(conn, q, limite=limite)
+    return responder_dados([dict(r) for r in rows])
+
+def responder_cifra(entrada, imutavel=False):
+    # Transposição opcional: ?tom=A ou ?semitones=2
+    semitons = request.args.get("semitones", 0, type=int)
+    tom = request.args.get("tom", "").strip()
+    if tom:
+        semitons = transposicao.semitons_para(entrada.dados["tom"], tom)
+        if semitons is None: return jsonify({"error": "tom inválido"}), 400
+    # Corpo já comprimido no cache: nada de dict(row) nem JSON por requisição
+    return responder_entrada(cifra_transposta(entrada, semitons), imutavel)
 
 @app.route("/api/song/<int:cifra_id>")
+@exigir_token
 def api_song(cifra_id):
-    row = get_cifras_conn().execute("SELECT * FROM cifras WHERE id=?", (cifra_id,)).fetchone()
-    return jsonify(dict(row)) if row else (jsonify({"error": "404"}), 404)
+    entrada = carregar_cifra(cifra_id)
+    if entrada is None: return jsonify({"error": "404"}), 404
+    registrar_uso('api_song', cifra_id, (g.usuario or {}).get('login'))
+    return responder_cifra(entrada)
+
+@app.route("/api/song/<int:cifra_id>/<conteudo_hash>")
+@exigir_token
+def api_song_revisao(cifra_id, conteudo_hash):
+    # Uma revisão da música: o hash vem do catálogo ou do open_song e muda a cada edição, então o
+    # corpo (e a transposição, que depende só dele) fica em cache no celular e em proxies por um ano
+    entrada = carregar_cifra(cifra_id)
+    if entrada is None: return jsonify({"error": "404"}), 404
+    if entrada.hash != conteudo_hash:
+        # Revisão antiga: o endereço atual vai junto para o cliente não precisar de outra volta
+        return jsonify({"error": "404", "url": url_cifra(cifra_id, entrada.hash)}), 404
+    registrar_uso('api_song', cifra_id, (g.usuario or {}).get('login'))
+    return responder_cifra(entrada, imutavel=True)
+
+@app.route("/api/setlist/<conteudo_hash>")
+@exigir_token
+def api_setlist(conteudo_hash):
+    pacote = cache_setlists.obter(conteudo_hash)
+    if pacote is None:
+        # Saiu do cache; remonta se for a setlist atual de alguma sala
+        atual = next((a for a in list(setlists.values()) if a['hash'] == conteudo_hash), None)
+        if atual: pacote = montar_setlist(atual['song_ids'])
+    if pacote is None or pacote.hash != conteudo_hash: return jsonify({"error": "404"}), 404
+    # O endereço muda junto com o conteúdo, então pode ficar em cache para sempre
+    return responder_entrada(pacote, imutavel=True)
+
+@app.route("/api/cache/stats")
+def api_cache_stats():
+    return jsonify(cache_cifras.estatisticas())
+
+def acesso_metricas():
+    # Com ECHO_METRICS_TOKEN, quem tiver o token; sem ele, só chamadas diretas da própria máquina
+    if METRICAS_TOKEN: return token_da_requisicao() == METRICAS_TOKEN
+    return request.remote_addr in ("127.0.0.1", "::1") and "X-Forwarded-For" not in request.headers
+
+@app.route("/metrics")
+def metrics():
+    if not acesso_metricas():
+        return jsonify({"error": "403", "message": "Defina ECHO_METRICS_TOKEN para raspar de fora da máquina"}), 403
+    return Response(METRICAS.exportar(), mimetype=metricas.CONTENT_TYPE)
+
+@app.route("/healthz")
+def healthz():
+    # Prontidão (painel_echo.py, proxies): o processo responde e o banco abre. Contadores só para acesso local
+    try:
+        with get_cifras_conn() as conn: conn.execute("SELECT 1").fetchone()
+    except Exception as e:
+        return jsonify({"status": "erro", "erro": str(e)}), 503
+    dados = {"status": "ok"}
+    if acesso_metricas():
+        dados.update(processo=PROCESSO, uptime_s=round(time.time() - INICIO_PROCESSO, 1), requisicoes=m_http.contagem(),
+                     conexoes=len(sockets_locais()), usuarios=usuarios_identificados())
+    return jsonify(dados)
 
 @socketio.on('connect')
-def handle_connect():
-    connected_users[request.sid] = {'user_info': 'Anônimo', 'logs': []}
-    emit('router_claimed', {'router_user': router_user})
+def handle_connect(auth=None):
+    if ESTADO.compartilhado: manter_processo_vivo()
+    auth = auth if isinstance(auth, dict) else {}
+    # auth={'format': 'msgpack'} pede os eventos em MessagePack (bytes); o padrão continua JSON
+    formato = 'msgpack' if auth.get('format') == 'msgpack' and serializacao.disponivel() else 'json'
+    connected_users[request.sid] = {'user_info': 'Anônimo', 'sala': None, 'processo': PROCESSO, 'formato': formato,
+                                    'conectado_em': datetime.now().strftime("%H:%M:%S"), 'logs': []}
+    # auth={'acks': true}: o celular confirma cada open_song depois de carregar a música (controle de vazão)
+    if auth.get('acks'): clientes_ack[request.sid] = (None, formato == 'msgpack')
+    # A sala vem no handshake (auth={'room': ...}) para o estado atual chegar já da sala certa;
+    # clientes antigos ficam na sala padrão
+    sala = str(auth.get('room') or '').strip()
+    entrar_na_sala(request.sid, sala if NOME_SALA.match(sala) else SALA_PADRAO)
+    registrar_evento(request.sid, 'connect', ip=request.remote_addr, formato=formato)
+
+@socketio.on('disconnect')
+def handle_disconnect(reason=None):
+    sessao = connected_users.pop(request.sid, None)
+    clientes_ack.pop(request.sid, None)
+    entregas.esquecer(request.sid)
+    if sessao is not None:
+        limpar_sala_vazia(sessao['sala'])
+        socketio.emit('sessao_saiu', {'sid': request.sid}, namespace=ADMIN_NS)
+
+@socketio.on('join_room')
+def handle_join_room(data):
+    sala = str((data or {}).get('room') or '').strip()
+    if not NOME_SALA.match(sala): return
+    if sala != sala_de(request.sid): entrar_na_sala(request.sid, sala)
+    registrar_evento(request.sid, 'join_room', sala=sala)
+
+@socketio.on('leave_room')
+def handle_leave_room(data=None):
+    # Sair de uma sala é voltar para a padrão
+    if sala_de(request.sid) == SALA_PADRAO: return
+    entrar_na_sala(request.sid, SALA_PADRAO)
+    registrar_evento(request.sid, 'join_room', sala=SALA_PADRAO)
 
 @socketio.on('identify')
 def handle_identify(data):
-    if request.sid in connected_users: connected_users[request.sid]['user_info'] = data.get('username')
+    sessao = connected_users.get(request.sid)
+    if sessao is None: return
+    usuario = usuario_do_token(data.get('token'))
+    if usuario:
+        sessao['user_info'], sessao['nivel'] = usuario['login'], usuario['nivel']
+    elif EXIGIR_TOKEN:
+        # Continua recebendo os eventos da sala, mas anônimo e sem poder comandar
+        registrar_evento(request.sid, 'auth_error', usuario=data.get('username'))
+        emit('auth_error', {'message': 'Token inválido ou expirado'})
+        return
+    else:
+        sessao['user_info'] = data.get('username')
+    connected_users[request.sid] = sessao
+    registrar_evento(request.sid, 'identify', usuario=sessao['user_info'])
+
+def sessao_router(sid):
+    # Sessão que pode comandar a sala (com token exigido: só nível Router) ou None
+    sessao = connected_users.get(sid)
+    if sessao is None: return None
+    if EXIGIR_TOKEN and sessao.get('nivel') != 'Router':
+        emit('auth_error', {'message': 'Somente usuários Router comandam a sala'})
+        return None
+    return sessao
 
 @socketio.on('claim_router')
 def handle_claim_router(data):
-    global router_user; router_user = data.get('user')
-    emit('router_claimed', {'router_user': router_user}, broadcast=True)
+    sessao = sessao_router(request.sid)
+    if sessao is None: return
+    sala = sessao['sala']
+    router = routers[sala] = sessao['user_info'] if EXIGIR_TOKEN else data.get('user')
+    registrar_evento(request.sid, 'claim_router', usuario=router, sala=sala)
+    emitir_sala('router_claimed', {'router_user': router, 'room': sala}, sala)
+
+@socketio.on('release_router')
+def handle_release_router(data):
+    sessao = sessao_router(request.sid)
+    if sessao is None: return
+    sala = sessao['sala']
+    usuario = sessao['user_info'] if EXIGIR_TOKEN else data.get('user')
+    if routers.get(sala) != usuario: return
+    routers.pop(sala, None)
+    registrar_evento(request.sid, 'release_router', usuario=usuario, sala=sala)
+    emitir_sala('router_claimed', {'router_user': None, 'room': sala}, sala)
 
 @socketio.on('open_song')
 def handle_open_song(data):
-    emit('open_song', {'song_id': data.get('song_id')}, broadcast=True, include_self=False)
+    sessao = sessao_router(request.sid)
+    if sessao is None: return
+    sala = sessao['sala']
+    song_id = data.get('song_id')
+    seq = proximo_seq((atuais.get(sala) or {}).get('seq'))
+    atuais[sala] = {'song_id': song_id, 'seq_musica': seq, 'semitones': 0, 'tom': None, 'seq': seq}
+    payload = payload_open_song(song_id, seq)
+    if 'ts' in data: payload['ts'] = data['ts']  # instante do toque no router, para medir a latência até os celulares
+    registrar_evento(request.sid, 'open_song', song_id=song_id, seq=seq)
+    registrar_uso('open_song', song_id, sessao['user_info'], sala)
+    # O estado da sala (catch-up de quem entra) já é o novo; o broadcast pode esperar o fim da rajada
+    rajadas_open_song.publicar(sala, (payload, request.sid))
+
+@socketio.on('publish_setlist')
+def handle_publish_setlist(data):
+    sessao = sessao_router(request.sid)
+    if sessao is None: return
+    song_ids = []
+    for cifra_id in (data.get('song_ids') or [])[:SETLIST_MAX_MUSICAS]:
+        try: song_ids.append(int(cifra_id))
+        except (TypeError, ValueError): continue
+    registrar_evento(request.sid, 'publish_setlist', musicas=len(song_ids))
+    for cifra_id in song_ids: registrar_uso('setlist', cifra_id, sessao['user_info'], sessao['sala'])
+    publicar_setlist(song_ids, sessao['sala'])
+
+@socketio.on('change_key')
+def handle_change_key(data):
+    # Router muda o tom; cada celular transpõe a cifra que já tem, sem baixar de novo
+    try: semitons = int(data.get('semitones') or 0) % 12
+    except (TypeError, ValueError): return
+    sessao = sessao_router(request.sid)
+    if sessao is None: return
+    sala = sessao['sala']
+    atual = atuais.get(sala) or {}
+    payload = {'song_id': data.get('song_id'), 'semitones': semitons, 'seq': proximo_seq(atual.get('seq'))}
+    entrada = carregar_cifra(payload['song_id'])
+    if entrada: payload['tom'] = transposicao.tom_transposto(entrada.dados["tom"], semitons)
+    if atual.get('song_id') == payload['song_id']:
+        atuais[sala] = dict(atual, semitones=semitons, tom=payload.get('tom'), seq=payload['seq'])
+    registrar_evento(request.sid, 'change_key', song_id=payload['song_id'], semitones=semitons)
+    emitir_sala('key_changed', payload, sala, skip_sid=request.sid)
+
+@socketio.on('connect', namespace=ADMIN_NS)
+def handle_admin_connect():
+    # A tela de conectados recebe o retrato atual e depois só os eventos novos
+    emit('sessoes', {'sessoes': resumo_sessoes(), 'salas': resumo_salas(), 'log_max': LOG_SESSAO_MAX})
 
 if __name__ == "__main__":
+    # Direto (python app.py, como o painel_echo.py sobe): no modo threading é o servidor do Werkzeug,
+    # liberado aqui como no producao.py
     init_dbs()
-    socketio.run(app, host="0.0.0.0", port=5000, debug=False)
\ No newline at end of file
+    socketio.run(app, host="0.0.0.0", port=5000, debug=False, allow_unsafe_werkzeug=(socketio.async_mode == "threading"))
\ No newline at end of file
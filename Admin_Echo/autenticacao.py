@@ -0,0 +1,117 @@
+import os
+import secrets
+import threading
+import time
+from collections import deque
+
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+
+def chave_secreta(pasta, nome="segredo.key"):
+    """APP_SECRET_KEY do ambiente ou, sem ela, uma chave aleatória criada na primeira subida e guardada em
+    `pasta` (a mesma dos bancos), para os tokens valerem depois de reiniciar e entre os processos."""
+    chave = os.environ.get("APP_SECRET_KEY")
+    if chave: return chave
+    caminho = os.path.join(pasta, nome)
+    try:
+        # O_EXCL: com vários processos subindo juntos só um cria; os outros leem a dele
+        fd = os.open(caminho, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        for _ in range(50):
+            with open(caminho, encoding="ascii") as f: chave = f.read().strip()
+            if chave: return chave
+            time.sleep(0.01)  # o criador ainda não terminou de gravar
+        raise RuntimeError(f"{caminho} vazio; apague o arquivo ou defina APP_SECRET_KEY")
+    chave = secrets.token_hex(32)
+    with os.fdopen(fd, "w", encoding="ascii") as f: f.write(chave)
+    return chave
+
+
+class EmissorTokens:
+    """Tokens de sessão assinados (HMAC) e com validade, emitidos no /api/login.
+
+    Conferir um token custa um HMAC; o hash de senha (scrypt/pbkdf2) só roda no login.
+    """
+
+    def __init__(self, segredo, validade_s=12 * 3600, salt="echo-api"):
+        self.validade_s = validade_s
+        self._assinador = URLSafeTimedSerializer(segredo, salt=salt)
+
+    def emitir(self, usuario_id, login, nivel):
+        return self._assinador.dumps({"id": usuario_id, "login": login, "nivel": nivel})
+
+    def verificar(self, token):
+        # Dados do token ({'id', 'login', 'nivel'}) ou None se inválido/expirado
+        if not token:
+            return None
+        try:
+            dados = self._assinador.loads(token, max_age=self.validade_s)
+        except (SignatureExpired, BadSignature):
+            return None
+        return dados if isinstance(dados, dict) and "id" in dados else None
+
+
+class LimitadorTentativas:
+    """Janela deslizante de tentativas por chave (IP, login...), em memória do processo."""
+
+    def __init__(self, maximo, janela_s=60.0, max_chaves=10000):
+        self.maximo = maximo
+        self.janela_s = janela_s
+        self.max_chaves = max_chaves
+        self._tentativas = {}
+        self._lock = threading.Lock()
+
+    def _limpar(self, fila, agora):
+        while fila and agora - fila[0] >= self.janela_s:
+            fila.popleft()
+
+    def bloqueado(self, chave):
+        # Segundos até liberar (0 = pode tentar)
+        agora = time.monotonic()
+        with self._lock:
+            fila = self._tentativas.get(chave)
+            if not fila: return 0
+            self._limpar(fila, agora)
+            if len(fila) < self.maximo: return 0
+            return max(1, int(self.janela_s - (agora - fila[0])) + 1)
+
+    def registrar(self, chave):
+        agora = time.monotonic()
+        with self._lock:
+            if chave not in self._tentativas and len(self._tentativas) >= self.max_chaves:
+                # Muitas chaves (varredura de IPs/logins): descarta as que já saíram da janela
+                for k in [k for k, f in self._tentativas.items() if not f or agora - f[-1] >= self.janela_s]:
+                    del self._tentativas[k]
+            fila = self._tentativas.setdefault(chave, deque())
+            self._limpar(fila, agora)
+            fila.append(agora)
+
+    def zerar(self, chave):
+        with self._lock:
+            self._tentativas.pop(chave, None)
+
+
+class CacheStatus:
+    """Status/nível dos usuários por id com validade curta, para checar tokens sem ir ao banco."""
+
+    def __init__(self, carregar, ttl_s=30.0):
+        self.carregar = carregar  # id -> (status, nivel) ou None se o usuário não existe mais
+        self.ttl_s = ttl_s
+        self._itens = {}
+        self._lock = threading.Lock()
+
+    def obter(self, usuario_id):
+        agora = time.monotonic()
+        with self._lock:
+            item = self._itens.get(usuario_id)
+        if item and agora - item[1] < self.ttl_s:
+            return item[0]
+        valor = self.carregar(usuario_id)
+        with self._lock:
+            self._itens[usuario_id] = (valor, agora)
+        return valor
+
+    def invalidar(self, usuario_id=None):
+        with self._lock:
+            if usuario_id is None: self._itens.clear()
+            else: self._itens.pop(usuario_id, None)
@@ -0,0 +1,106 @@
+# Utilitários compartilhados pelos benchmarks: subir o servidor isolado e resumir latências
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.dirname(AQUI)
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+def resumo(valores):
+    if not valores:
+        return {"n": 0}
+    return {
+        "n": len(valores),
+        "p50": round(percentil(valores, 0.50), 2),
+        "p95": round(percentil(valores, 0.95), 2),
+        "p99": round(percentil(valores, 0.99), 2),
+        "max": round(max(valores), 2),
+        "media": round(statistics.fmean(valores), 2),
+    }
+
+
+def porta_livre(quantidade=1):
+    # Primeira de `quantidade` portas seguidas livres (um processo por porta com ECHO_WORKERS)
+    while True:
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            base = s.getsockname()[1]
+        if base + quantidade > 65535: continue
+        livres = True
+        for porta in range(base + 1, base + quantidade):
+            with socket.socket() as s:
+                try: s.bind(("127.0.0.1", porta))
+                except OSError: livres = False; break
+        if livres: return base
+
+
+def subir_servidor(pasta, porta, modo="threading", extra_env=None):
+    """Sobe producao.py com os bancos em `pasta` e espera a porta abrir."""
+    env = dict(os.environ, ECHO_DB_DIR=pasta, ECHO_PORT=str(porta), ECHO_HOST="127.0.0.1", ECHO_ASYNC_MODE=modo, **(extra_env or {}))
+    # stderr vai para arquivo: um PIPE que ninguém lê enche (log de acesso) e trava o servidor
+    log = tempfile.TemporaryFile(mode="w+", encoding="utf-8")
+    proc = subprocess.Popen([sys.executable, os.path.join(RAIZ, "producao.py")], cwd=RAIZ, env=env,
+                            stdout=subprocess.DEVNULL, stderr=log)
+    proc.log = log
+    esperar_porta(porta, proc)
+    return proc
+
+
+def esperar_porta(porta, proc, limite=20):
+    fim = time.time() + limite
+    while time.time() < fim:
+        if proc.poll() is not None:
+            proc.log.seek(0)
+            raise RuntimeError(f"servidor saiu com código {proc.returncode}:\n{proc.log.read()}")
+        try:
+            with socket.create_connection(("127.0.0.1", porta), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f"servidor não abriu a porta {porta} em {limite} s")
+
+
+def derrubar_servidor(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+    proc.log.close()
+
+
+def obter_token(porta, usuario, senha):
+    # Login no servidor de teste; o token vai no Authorization da API e no identify do socket
+    conn = http.client.HTTPConnection("127.0.0.1", porta, timeout=30)
+    try:
+        conn.request("POST", "/api/login", body=json.dumps({"username": usuario, "password": senha}),
+                     headers={"Content-Type": "application/json"})
+        resp = conn.getresponse()
+        dados = json.loads(resp.read() or b"{}")
+    finally:
+        conn.close()
+    if resp.status != 200: raise RuntimeError(f"login de {usuario} falhou: {resp.status} {dados}")
+    return dados["token"]
+
+
+def versao_git():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
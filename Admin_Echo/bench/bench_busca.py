@@ -0,0 +1,82 @@
+"""Latência da busca: FTS5 (busca.py) x LIKE '%q%' antigo, num catálogo sintético.
+
+Meta: p95 em torno de 10 ms (e p50 de ~1 ms) para o /api/search com 50k músicas.
+
+    python bench/bench_busca.py --musicas 50000 --consultas 500
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(AQUI))
+
+from _comum import percentil
+from dados_sinteticos import pesos_zipf, vocabulario
+
+
+def frase(rnd, vocab, pesos, n):
+    return " ".join(rnd.choices(vocab, cum_weights=pesos, k=n))
+
+
+def sem_acento(texto):
+    import unicodedata
+    return "".join(c for c in unicodedata.normalize("NFD", texto) if unicodedata.category(c) != "Mn")
+
+
+def medir(funcao, consultas):
+    tempos = []
+    for q in consultas:
+        inicio = time.perf_counter()
+        funcao(q)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tempos), percentil(tempos, 0.95), percentil(tempos, 0.99)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--musicas", type=int, default=50000)
+    ap.add_argument("--consultas", type=int, default=500)
+    args = ap.parse_args()
+    rnd = random.Random(42)
+    vocab = vocabulario(rnd, 5000)
+    pesos = pesos_zipf(len(vocab))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["ECHO_DB_DIR"] = tmp
+        import app as app_mod
+        import busca
+        import catalogo
+        app_mod.init_dbs()
+        # Títulos usam palavras quaisquer do vocabulário; a letra segue a Zipf
+        titulos = [" ".join(rnd.choice(vocab) for _ in range(rnd.randint(2, 4))) for _ in range(args.musicas)]
+        with app_mod.get_cifras_conn() as conn:
+            catalogo.inserir_varias(
+                conn,
+                [(t, f"Banda {rnd.choice(vocab)}", "G", frase(rnd, vocab, pesos, 150), "G D Em C\n" * 40, "2024-01-01T00:00:00")
+                 for t in titulos],
+            )
+            conn.commit()
+
+            # Consultas como o usuário digita: começo de um título, sem acento e com a última palavra incompleta
+            consultas = []
+            for _ in range(args.consultas):
+                palavras = rnd.choice(titulos).split()[:rnd.randint(1, 2)]
+                palavras[-1] = palavras[-1][:max(2, len(palavras[-1]) - 2)]
+                consultas.append(sem_acento(" ".join(palavras)))
+            fts = medir(lambda q: busca.buscar(conn, q, limite=20), consultas)
+            like = medir(lambda q: conn.execute(
+                "SELECT id, titulo, banda, tom FROM cifras WHERE titulo LIKE ? OR banda LIKE ? LIMIT 20",
+                (f"%{q}%", f"%{q}%")).fetchall(), consultas)
+
+    print(f"músicas={args.musicas} consultas={args.consultas}")
+    print(f"FTS5: p50={fts[0]:.2f} ms  p95={fts[1]:.2f} ms  p99={fts[2]:.2f} ms")
+    print(f"LIKE: p50={like[0]:.2f} ms  p95={like[1]:.2f} ms  p99={like[2]:.2f} ms  (sem acentos e sem a letra)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Benchmark da camada de conexões: sqlite3.connect por requisição (antes) x PoolSQLite (depois).
+
+Roda as rotas /api/songs e /api/song/<id> pelo test client do Flask, com várias threads,
+num banco temporário. O cache de músicas é desligado para medir só o caminho do SQLite.
+
+    python bench/bench_conexoes.py --musicas 2000 --threads 8 --requisicoes 4000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(AQUI))
+
+
+class ConexaoPorRequisicao:
+    """Comportamento antigo: abre e fecha uma conexão a cada uso."""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+
+    @contextmanager
+    def conexao(self):
+        conn = sqlite3.connect(self.caminho)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+
+def popular(app_mod, quantidade):
+    import catalogo
+    app_mod.init_dbs()
+    with app_mod.get_cifras_conn() as conn:
+        catalogo.inserir_varias(
+            conn,
+            [(f"Música {i:05d}", f"Banda {i % 97}", "G", "letra " * 200, "G D Em C\n" * 60, "2024-01-01T00:00:00") for i in range(quantidade)],
+        )
+        conn.commit()
+
+
+def rodar(app_mod, threads, requisicoes, quantidade):
+    cliente_por_thread = threading.local()
+    restantes = [requisicoes]
+    lock = threading.Lock()
+    erros = [0]
+
+    def trabalhador():
+        cliente = cliente_por_thread.__dict__.setdefault("c", app_mod.app.test_client())
+        rnd = random.Random()
+        while True:
+            with lock:
+                if restantes[0] <= 0: return
+                restantes[0] -= 1
+            if rnd.random() < 0.2:
+                r = cliente.get("/api/songs?limit=50")
+            else:
+                r = cliente.get(f"/api/song/{rnd.randint(1, quantidade)}")
+            if r.status_code != 200:
+                with lock: erros[0] += 1
+
+    inicio = time.perf_counter()
+    ts = [threading.Thread(target=trabalhador) for _ in range(threads)]
+    for t in ts: t.start()
+    for t in ts: t.join()
+    return requisicoes / (time.perf_counter() - inicio), erros[0]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--musicas", type=int, default=2000)
+    ap.add_argument("--threads", type=int, default=8)
+    ap.add_argument("--requisicoes", type=int, default=4000)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["ECHO_DB_DIR"] = tmp
+        import app as app_mod
+        app_mod.cache_cifras.max_itens = 0  # mede o banco, não o cache
+        app_mod.EXIGIR_TOKEN = False  # mede as consultas, não a recusa sem token
+        popular(app_mod, args.musicas)
+
+        pool = app_mod.cifras_pool
+        app_mod.cifras_pool = ConexaoPorRequisicao(app_mod.CIFRAS_DB_PATH)
+        antes, erros_antes = rodar(app_mod, args.threads, args.requisicoes, args.musicas)
+        app_mod.cifras_pool = pool
+        depois, erros_depois = rodar(app_mod, args.threads, args.requisicoes, args.musicas)
+        pool.fechar()
+
+    print(f"músicas={args.musicas} threads={args.threads} requisições={args.requisicoes}")
+    print(f"antes  (connect por requisição): {antes:8.1f} req/s  erros={erros_antes}")
+    print(f"depois (PoolSQLite + WAL):       {depois:8.1f} req/s  erros={erros_depois}")
+    print(f"ganho: {depois / antes:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
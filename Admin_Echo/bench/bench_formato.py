@@ -0,0 +1,129 @@
+"""Compara JSON e MessagePack (cru, gzip e brotli) nas respostas reais da API e no open_song completo.
+
+Preenche um catálogo sintético (dados_sinteticos.py), pede as rotas pelo cliente de teste do Flask
+com Accept JSON e MessagePack e mede o tamanho dos corpos e o tempo de descompressão + decodificação
+por resposta (em Python; no celular os números absolutos mudam, a proporção entre formatos é o que vale).
+
+    pip install msgpack brotli
+    python bench/bench_formato.py --musicas 10000 --json formato.json
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _comum import RAIZ, versao_git
+from dados_sinteticos import popular
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def decodificador(mimetype, codificacao):
+    descomprimir = {"gzip": gzip.decompress, "br": brotli.decompress if brotli else None}.get(codificacao, lambda b: b)
+    if mimetype == "application/msgpack":
+        import msgpack
+        return lambda corpo: msgpack.unpackb(descomprimir(corpo), raw=False)
+    return lambda corpo: json.loads(descomprimir(corpo))
+
+
+def medir(cliente, caminhos, cabecalhos, repeticoes):
+    """Bytes totais e µs por resposta para decodificar, somando todos os caminhos."""
+    corpos = []
+    for caminho in caminhos:
+        resp = cliente.get(caminho, headers=cabecalhos)
+        assert resp.status_code == 200, (caminho, resp.status_code)
+        corpos.append((resp.data, resp.mimetype, resp.headers.get("Content-Encoding")))
+    decodificar = decodificador(corpos[0][1], corpos[0][2])
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        for corpo, _, _ in corpos:
+            decodificar(corpo)
+    gasto = time.perf_counter() - inicio
+    return {"bytes": sum(len(c) for c, _, _ in corpos),
+            "decodificar_us": round(gasto / (repeticoes * len(corpos)) * 1e6, 1)}
+
+
+def variantes():
+    # (nome, cabeçalhos); br só se o brotli estiver instalado no servidor e aqui
+    saida = []
+    for formato, accept in (("json", "application/json"), ("msgpack", "application/msgpack")):
+        for codificacao in (None, "gzip", "br"):
+            if codificacao == "br" and brotli is None: continue
+            cabecalhos = {"Accept": accept, "Accept-Encoding": codificacao or "identity"}
+            saida.append((f"{formato}+{codificacao}" if codificacao else formato, cabecalhos))
+    return saida
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--musicas", type=int, default=10000)
+    ap.add_argument("--amostra", type=int, default=200, help="músicas pedidas em /api/song/<id>")
+    ap.add_argument("--setlist", type=int, default=20, help="músicas no pacote da setlist")
+    ap.add_argument("--repeticoes", type=int, default=5)
+    ap.add_argument("--json", help="grava o resultado neste arquivo")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        popular(pasta, args.musicas, 1)
+        # O app lê ECHO_DB_DIR ao ser importado
+        os.environ["ECHO_DB_DIR"] = pasta
+        sys.path.insert(0, RAIZ)
+        import app as app_mod
+        import serializacao
+        if not serializacao.disponivel(): sys.exit("instale o msgpack: pip install msgpack")
+        app_mod.EXIGIR_TOKEN = False
+        app_mod.init_dbs()
+        cliente = app_mod.app.test_client()
+
+        ids = random.Random(1).sample(range(1, args.musicas + 1), min(args.amostra, args.musicas))
+        pacote = app_mod.montar_setlist(ids[:args.setlist])
+        paginas, depois = [], None
+        while True:
+            caminho = "/api/songs?limit=2000" + (f"&after={depois}" if depois else "")
+            paginas.append(caminho)
+            depois = cliente.get(caminho).headers.get("X-Next-Cursor")
+            if not depois: break
+        cargas = {
+            "catalogo": paginas,
+            "musica": [f"/api/song/{i}" for i in ids],
+            "setlist": [app_mod.url_setlist(pacote.hash)],
+        }
+        resultado = {"commit": versao_git(), "musicas": args.musicas, "cargas": {}}
+        for nome, caminhos in cargas.items():
+            resultado["cargas"][nome] = {v: medir(cliente, caminhos, cab, args.repeticoes) for v, cab in variantes()}
+
+        # open_song com a música inteira (ECHO_OPEN_SONG_PAYLOAD=full): texto JSON vs anexo binário
+        payloads = [{"song_id": i, "seq": 1, "hash": "0" * 16, "song": app_mod.carregar_cifra(i).dados} for i in ids]
+        socket = {}
+        for formato, codificar, decodificar in (("json", lambda p: json.dumps(p, ensure_ascii=False).encode("utf-8"), json.loads),
+                                                ("msgpack", serializacao.empacotar, serializacao.desempacotar)):
+            corpos = [codificar(p) for p in payloads]
+            inicio = time.perf_counter()
+            for _ in range(args.repeticoes):
+                for corpo in corpos: decodificar(corpo)
+            socket[formato] = {"bytes": sum(map(len, corpos)),
+                               "decodificar_us": round((time.perf_counter() - inicio) / (args.repeticoes * len(corpos)) * 1e6, 1)}
+        resultado["cargas"]["open_song_full"] = socket
+
+    for nome, medidas in resultado["cargas"].items():
+        base = medidas["json"]["bytes"]
+        print(f"{nome}:", file=sys.stderr)
+        for variante, m in medidas.items():
+            print(f"  {variante:14} {m['bytes']:>11,} bytes ({m['bytes'] / base:6.1%})  {m['decodificar_us']:>9} µs/resposta", file=sys.stderr)
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    print(texto)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            f.write(texto)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""Benchmark HTTP das rotas do app.py num catálogo sintético grande.
+
+Preenche bancos temporários (dados_sinteticos.py), sobe o servidor e dispara clientes
+concorrentes contra /api/songs, /api/song/<id>, /api/login, /api/me e a busca do admin (/cifras?q=).
+Relata vazão, percentis de latência e tamanho das respostas, em JSON para comparar commits.
+
+    python bench/bench_http.py --musicas 10000 --concorrencia 8 --duracao 10 --json atual.json
+    python bench/bench_http.py --musicas 10000 --json novo.json --comparar atual.json --tolerancia 10
+
+Com --comparar, sai com código 1 se algum cenário perder mais que --tolerancia % de vazão
+ou piorar o p95 além disso.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _comum import derrubar_servidor, obter_token, porta_livre, resumo, subir_servidor, versao_git
+from dados_sinteticos import SENHA_PADRAO, popular
+
+
+class Cliente:
+    """Conexão HTTP/1.1 keep-alive; reabre sozinha se o servidor fechar."""
+
+    def __init__(self, host, porta):
+        self.host, self.porta = host, porta
+        self.conn = None
+
+    def pedir(self, metodo, caminho, corpo=None, cabecalhos=None):
+        for tentativa in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.porta, timeout=30)
+            try:
+                self.conn.request(metodo, caminho, body=corpo, headers=cabecalhos or {})
+                resp = self.conn.getresponse()
+                dados = resp.read()
+                if resp.getheader("Connection", "").lower() == "close":
+                    self.conn.close(); self.conn = None
+                return resp.status, dados
+            except (http.client.HTTPException, OSError):
+                self.conn.close(); self.conn = None
+                if tentativa: raise
+
+
+def cenarios(musicas, usuarios, consultas, token):
+    gzip = {"Accept-Encoding": "gzip", "Authorization": f"Bearer {token}"}
+    return {
+        "api_songs": lambda rnd: ("GET", "/api/songs?limit=500", None, gzip),
+        "api_song": lambda rnd: ("GET", f"/api/song/{rnd.randint(1, musicas)}", None, gzip),
+        "api_login": lambda rnd: ("POST", "/api/login",
+                                  json.dumps({"username": f"bench{rnd.randrange(usuarios)}", "password": SENHA_PADRAO}),
+                                  {"Content-Type": "application/json"}),
+        # Conferência do token (HMAC + cache de status): o que substitui o login repetido
+        "api_me": lambda rnd: ("GET", "/api/me", None, gzip),
+        "admin_busca": lambda rnd: ("GET", f"/cifras?q={quote(rnd.choice(consultas))}", None, gzip),
+    }
+
+
+def rodar_cenario(host, porta, gerar, concorrencia, duracao):
+    latencias, tamanhos, status = [], [], {}
+    erros = [0]
+    lock = threading.Lock()
+    fim = time.perf_counter() + duracao
+
+    def trabalhador(semente):
+        rnd = random.Random(semente)
+        cli = Cliente(host, porta)
+        meus_t, meus_b, meus_s = [], [], {}
+        while time.perf_counter() < fim:
+            metodo, caminho, corpo, cab = gerar(rnd)
+            inicio = time.perf_counter()
+            try:
+                codigo, dados = cli.pedir(metodo, caminho, corpo, cab)
+            except Exception:
+                with lock: erros[0] += 1
+                continue
+            meus_t.append((time.perf_counter() - inicio) * 1000)
+            meus_b.append(len(dados))
+            meus_s[codigo] = meus_s.get(codigo, 0) + 1
+        with lock:
+            latencias.extend(meus_t); tamanhos.extend(meus_b)
+            for k, v in meus_s.items(): status[k] = status.get(k, 0) + v
+
+    inicio = time.perf_counter()
+    ts = [threading.Thread(target=trabalhador, args=(i,)) for i in range(concorrencia)]
+    for t in ts: t.start()
+    for t in ts: t.join()
+    decorrido = time.perf_counter() - inicio
+    return {
+        "req_s": round(len(latencias) / decorrido, 1),
+        "latencia_ms": resumo(latencias),
+        "bytes_medio": round(sum(tamanhos) / len(tamanhos)) if tamanhos else 0,
+        "status": {str(k): v for k, v in sorted(status.items())},
+        "erros_rede": erros[0],
+    }
+
+
+def comparar(atual, base, tolerancia):
+    regressoes = []
+    print(f"\ncomparação com {base.get('commit')} (tolerância {tolerancia}%):")
+    for nome, novo in atual["cenarios"].items():
+        antigo = base.get("cenarios", {}).get(nome)
+        if not antigo: continue
+        dv = (novo["req_s"] / antigo["req_s"] - 1) * 100 if antigo["req_s"] else 0.0
+        p_novo, p_antigo = novo["latencia_ms"].get("p95"), antigo["latencia_ms"].get("p95")
+        dp = (p_novo / p_antigo - 1) * 100 if p_novo and p_antigo else 0.0
+        marca = ""
+        if dv < -tolerancia or dp > tolerancia:
+            regressoes.append(nome); marca = "  <-- REGRESSÃO"
+        print(f"  {nome:12s} vazão {antigo['req_s']:8.1f} -> {novo['req_s']:8.1f} ({dv:+.1f}%)   "
+              f"p95 {p_antigo} -> {p_novo} ms ({dp:+.1f}%){marca}")
+    return regressoes
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--musicas", type=int, default=10000, help="tamanho do catálogo sintético (1k a 100k)")
+    ap.add_argument("--usuarios", type=int, default=50)
+    ap.add_argument("--concorrencia", type=int, default=8)
+    ap.add_argument("--duracao", type=float, default=10.0, help="segundos por cenário")
+    ap.add_argument("--cenarios", default="api_songs,api_song,api_login,api_me,admin_busca")
+    ap.add_argument("--modo", default="threading", choices=("threading", "eventlet", "gevent"))
+    ap.add_argument("--json", help="grava o resultado neste arquivo")
+    ap.add_argument("--comparar", help="resultado JSON anterior para comparar")
+    ap.add_argument("--tolerancia", type=float, default=10.0, help="piora máxima aceita, em %%")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        inicio = time.perf_counter()
+        popular(pasta, args.musicas, args.usuarios)
+        print(f"catálogo sintético: {args.musicas} músicas em {time.perf_counter() - inicio:.1f} s", file=sys.stderr)
+        porta = porta_livre()
+        # O limite de logins por IP do servidor barraria o cenário api_login (todos os clientes são 127.0.0.1)
+        proc = subir_servidor(pasta, porta, args.modo, {"ECHO_LOGIN_POR_IP": "1000000"})
+        try:
+            token = obter_token(porta, "bench0", SENHA_PADRAO)
+            # Consultas da busca: começo de títulos reais do catálogo, como alguém digitando
+            _, dados = Cliente("127.0.0.1", porta).pedir("GET", "/api/songs?limit=500", cabecalhos={"Authorization": f"Bearer {token}"})
+            consultas = [m["titulo"].split()[0][:4] for m in json.loads(dados)] or ["a"]
+            todos = cenarios(args.musicas, args.usuarios, consultas, token)
+            resultado = {"commit": versao_git(), "musicas": args.musicas, "concorrencia": args.concorrencia,
+                         "duracao_s": args.duracao, "modo": args.modo, "cenarios": {}}
+            for nome in args.cenarios.split(","):
+                print(f"rodando {nome}...", file=sys.stderr)
+                resultado["cenarios"][nome] = rodar_cenario("127.0.0.1", porta, todos[nome], args.concorrencia, args.duracao)
+        finally:
+            derrubar_servidor(proc)
+
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    print(texto)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            f.write(texto)
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)
+        if comparar(resultado, base, args.tolerancia):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
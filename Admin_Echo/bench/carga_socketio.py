@@ -0,0 +1,217 @@
+"""Teste de carga do tempo real: N celulares simulados + um router disparando open_song.
+
+Sobe o servidor (producao.py) num banco temporário, conecta N clientes python-socketio
+(connect -> identify -> escuta open_song) e um router (claim_router -> open_song a uma
+taxa fixa). Mede a latência de fan-out (toque no router -> evento em cada celular),
+eventos perdidos e CPU/memória do processo do servidor.
+
+    pip install "python-socketio[asyncio_client]" psutil
+    python bench/carga_socketio.py --clientes 300 --taxa 2 --duracao 20 --modo eventlet
+    python bench/carga_socketio.py --clientes 100 --json resultado.json
+
+Para testar contra um servidor já rodando, use --url http://host:porta (sem subir nada).
+
+Com --workers N sobe N processos (ECHO_WORKERS, fila e estado em SQLite) e distribui os celulares
+entre as portas; o router fica no primeiro processo. O relatório separa a latência de quem está no
+mesmo processo do router e de quem recebe pela fila, vindo de outro processo.
+
+O servidor sobe com ECHO_OPEN_SONG_JANELA_MS=0 (--janela-ms) para medir o fan-out de todos os toques.
+Com janela (ou com --url), os toques que o servidor juntou num só não chegam a ninguém: saem em
+eventos_coalescidos, e as entregas esperadas/perdidas contam só os eventos que foram transmitidos.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import socketio
+
+try:
+    import psutil
+except ImportError:  # sem psutil o relatório sai sem CPU/memória
+    psutil = None
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _comum import derrubar_servidor, esperar_porta, obter_token, porta_livre, resumo, subir_servidor, versao_git
+from dados_sinteticos import SENHA_PADRAO, popular
+
+
+def agora_ms():
+    return time.time() * 1000.0
+
+
+class Amostrador:
+    """Amostra CPU e memória (RSS) do processo do servidor enquanto o teste roda."""
+
+    def __init__(self, pid):
+        self.proc = psutil.Process(pid) if (psutil and pid) else None
+        self.filhos = {}
+        self.cpu = []
+        self.rss = []
+
+    async def rodar(self, parar):
+        if self.proc is None: return
+        self.proc.cpu_percent(None)
+        while not parar.is_set():
+            await asyncio.sleep(0.5)
+            try:
+                # Com --workers o pid é o supervisor: soma os processos filhos
+                procs = [self.proc] + [self.filhos.setdefault(f.pid, f) for f in self.proc.children()]
+                self.cpu.append(sum(p.cpu_percent(None) for p in procs))
+                self.rss.append(sum(p.memory_info().rss for p in procs) / (1024 * 1024))
+            except psutil.Error:
+                return
+
+    def relatorio(self):
+        if not self.cpu:
+            return None
+        return {"cpu_pct_media": round(statistics.fmean(self.cpu), 1), "cpu_pct_max": round(max(self.cpu), 1),
+                "rss_mb_max": round(max(self.rss), 1)}
+
+
+async def conectar_celular(url, indice, recebidos, tempos_conexao, transporte):
+    cli = socketio.AsyncClient(reconnection=False)
+    meus = recebidos[indice] = {}
+
+    @cli.on("open_song")
+    async def ao_abrir(data):
+        chegada = agora_ms()
+        ts = data.get("ts")
+        if ts is not None:
+            meus[ts] = chegada - ts
+
+    inicio = time.perf_counter()
+    await cli.connect(url, transports=[transporte])
+    await cli.emit("identify", {"username": f"celular{indice}"})
+    tempos_conexao.append((time.perf_counter() - inicio) * 1000)
+    return cli
+
+
+async def executar(args, urls, pid):
+    url = urls[0]
+    recebidos = {}
+    tempos_conexao = []
+    celulares = []
+    # Conecta em lotes para não transformar o teste num ataque de handshake
+    for lote in range(0, args.clientes, args.lote_conexao):
+        tarefas = [conectar_celular(urls[i % len(urls)], i, recebidos, tempos_conexao, args.transporte)
+                   for i in range(lote, min(lote + args.lote_conexao, args.clientes))]
+        for r in await asyncio.gather(*tarefas, return_exceptions=True):
+            if isinstance(r, Exception): print(f"falha ao conectar: {r!r}", file=sys.stderr)
+            else: celulares.append(r)
+
+    # Só um usuário Router com token comanda a sala (bench0 dos dados sintéticos)
+    router = socketio.AsyncClient(reconnection=False)
+    await router.connect(url, transports=[args.transporte])
+    await router.emit("identify", {"username": "bench0", "token": args.token})
+    await router.emit("claim_router", {"user": "bench0"})
+    await asyncio.sleep(args.aquecimento)
+
+    parar = asyncio.Event()
+    amostrador = Amostrador(pid)
+    tarefa_amostra = asyncio.create_task(amostrador.rodar(parar))
+
+    enviados = []
+    intervalo = 1.0 / args.taxa
+    fim = time.perf_counter() + args.duracao
+    n = 0
+    while time.perf_counter() < fim:
+        ts = agora_ms()
+        enviados.append(ts)
+        await router.emit("open_song", {"song_id": (n % args.musicas) + 1, "user": "router", "ts": ts})
+        n += 1
+        await asyncio.sleep(intervalo)
+    await asyncio.sleep(args.espera_final)
+    parar.set()
+    await tarefa_amostra
+
+    for cli in celulares + [router]:
+        try: await cli.disconnect()
+        except Exception: pass
+
+    latencias = [v for meus in recebidos.values() for v in meus.values()]
+    # Fan-out completo: tempo até o ÚLTIMO celular receber cada evento
+    por_evento = []
+    for ts in enviados:
+        chegadas = [meus[ts] for meus in recebidos.values() if ts in meus]
+        if len(chegadas) == len(celulares) and chegadas:
+            por_evento.append(max(chegadas))
+    # Evento que nenhum celular recebeu = o servidor juntou com o seguinte (janela do open_song), não perda
+    transmitidos = [ts for ts in enviados if any(ts in meus for meus in recebidos.values())]
+    esperados = len(transmitidos) * len(celulares)
+    # Celular i ficou na porta i % workers; o router está na primeira
+    mesmo = [v for i, meus in recebidos.items() if i % len(urls) == 0 for v in meus.values()]
+    outro = [v for i, meus in recebidos.items() if i % len(urls) != 0 for v in meus.values()]
+    return {
+        "workers": len(urls),
+        "modo": args.modo,
+        "clientes": len(celulares),
+        "falhas_conexao": args.clientes - len(celulares),
+        "eventos_enviados": len(enviados),
+        "eventos_coalescidos": len(enviados) - len(transmitidos),
+        "entregas_esperadas": esperados,
+        "entregas_recebidas": len(latencias),
+        "entregas_perdidas": esperados - len(latencias),
+        "conexao_ms": resumo(tempos_conexao),
+        "latencia_entrega_ms": resumo(latencias),
+        "latencia_fanout_completo_ms": resumo(por_evento),
+        "latencia_mesmo_processo_ms": resumo(mesmo),
+        "latencia_outro_processo_ms": resumo(outro),
+        "servidor": amostrador.relatorio(),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--clientes", type=int, default=100)
+    ap.add_argument("--taxa", type=float, default=2.0, help="open_song por segundo")
+    ap.add_argument("--duracao", type=float, default=15.0, help="segundos disparando open_song")
+    ap.add_argument("--modo", default="threading", choices=("threading", "eventlet", "gevent"))
+    ap.add_argument("--transporte", default="websocket", choices=("websocket", "polling"))
+    ap.add_argument("--payload", default="id", choices=("id", "hash", "full"), help="ECHO_OPEN_SONG_PAYLOAD do servidor")
+    ap.add_argument("--janela-ms", type=float, default=0, help="ECHO_OPEN_SONG_JANELA_MS do servidor (0 = sem juntar toques)")
+    ap.add_argument("--musicas", type=int, default=20)
+    ap.add_argument("--lote-conexao", type=int, default=50)
+    ap.add_argument("--aquecimento", type=float, default=1.0)
+    ap.add_argument("--espera-final", type=float, default=2.0)
+    ap.add_argument("--workers", type=int, default=1, help="processos do servidor (ECHO_WORKERS)")
+    ap.add_argument("--url", help="usa um servidor já rodando em vez de subir um")
+    ap.add_argument("--token", help="token de um usuário Router (com --url); sem --url o teste faz login sozinho")
+    ap.add_argument("--json", help="grava o resultado neste arquivo")
+    args = ap.parse_args()
+
+    proc = None
+    with tempfile.TemporaryDirectory() as pasta:
+        if args.url:
+            urls, pid = [args.url], None
+        else:
+            popular(pasta, args.musicas, usuarios=1)
+            porta = porta_livre(args.workers)
+            proc = subir_servidor(pasta, porta, args.modo, {"ECHO_OPEN_SONG_PAYLOAD": args.payload,
+                                                              "ECHO_OPEN_SONG_JANELA_MS": str(args.janela_ms),
+                                                              "ECHO_WORKERS": str(args.workers)})
+            urls, pid = [f"http://127.0.0.1:{porta + i}" for i in range(args.workers)], proc.pid
+            for i in range(1, args.workers): esperar_porta(porta + i, proc)
+            args.token = obter_token(porta, "bench0", SENHA_PADRAO)
+        try:
+            resultado = asyncio.run(executar(args, urls, pid))
+        finally:
+            if proc: derrubar_servidor(proc)
+
+    resultado["payload"] = args.payload
+    resultado["janela_ms"] = args.janela_ms if not args.url else None
+    resultado["commit"] = versao_git()
+    resultado["taxa"] = args.taxa
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    print(texto)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            f.write(texto)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Preenche cifras.db e usuarios.db com dados sintéticos para benchmarks.
+
+Gera músicas com tamanhos parecidos com os de verdade (letra de ~1,5 KB, cifra de ~2-3 KB com
+linhas de acordes sobre a letra) e usuários com hash de senha do Werkzeug.
+
+    python bench/dados_sinteticos.py --pasta /tmp/echo-bench --musicas 10000 --usuarios 200
+
+Todos os usuários sintéticos (bench0, bench1, ...) usam a senha SENHA_PADRAO.
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.dirname(AQUI)
+
+SENHA_PADRAO = "bench-senha"
+SILABAS = ("ca", "ra", "ção", "gra", "lou", "vor", "san", "to", "gló", "ri", "a", "céu", "fé", "mor",
+           "vi", "tó", "se", "nhor", "pí", "paz", "luz", "mi", "nho", "pro", "mes", "ro", "cha", "fo", "go", "mar")
+TONS = ("C", "D", "E", "F", "G", "A", "B", "Bb", "Eb", "Am", "Em", "Dm", "F#m", "Bm")
+PROGRESSOES = (("G", "D/F#", "Em", "C"), ("C", "G", "Am", "F"), ("D", "A", "Bm", "G"), ("E", "B", "C#m7", "A"))
+
+
+# Vocabulário e pesos também usados pelo bench_busca.py (consultas sobre o mesmo tipo de texto)
+def vocabulario(rnd, tamanho=4000):
+    palavras = sorted({"".join(rnd.choice(SILABAS) for _ in range(rnd.randint(2, 4))) for _ in range(tamanho * 2)})
+    rnd.shuffle(palavras)
+    return palavras[:tamanho]
+
+
+def pesos_zipf(tamanho):
+    # Frequência das palavras segue uma Zipf (s=1), como num texto de verdade
+    acumulado, total = [], 0.0
+    for r in range(1, tamanho + 1):
+        total += 1.0 / r
+        acumulado.append(total)
+    return acumulado
+
+
+def gerar_musicas(quantidade, semente=42):
+    """Itera tuplas (titulo, banda, tom, letra, cifra, created_at) prontas para o INSERT."""
+    rnd = random.Random(semente)
+    vocab = vocabulario(rnd)
+    pesos = pesos_zipf(len(vocab))
+    bandas = [" ".join(rnd.choice(vocab) for _ in range(rnd.randint(1, 3))).title() for _ in range(max(10, quantidade // 20))]
+    inicio = datetime(2020, 1, 1)
+    for i in range(quantidade):
+        versos = []
+        for _ in range(rnd.randint(24, 36)):
+            versos.append(" ".join(rnd.choices(vocab, cum_weights=pesos, k=rnd.randint(5, 8))).capitalize())
+        letra = "\n".join(versos)
+        prog = rnd.choice(PROGRESSOES)
+        linhas = []
+        for v, verso in enumerate(versos):
+            acordes = "".join(f"{prog[(v + k) % 4]:<{max(4, len(verso) // 4)}}" for k in range(4)).rstrip()
+            linhas.extend((acordes, verso))
+        titulo = " ".join(rnd.choice(vocab) for _ in range(rnd.randint(2, 4))).capitalize()
+        criada = (inicio + timedelta(minutes=37 * i)).isoformat()
+        yield (titulo, rnd.choice(bandas), rnd.choice(TONS), letra, "\n".join(linhas), criada)
+
+
+def popular(pasta, musicas, usuarios=50, lote=2000):
+    """Cria o esquema (via app.init_dbs) em `pasta` e insere os dados sintéticos."""
+    antigo = os.environ.get("ECHO_DB_DIR")
+    os.environ["ECHO_DB_DIR"] = pasta
+    if RAIZ not in sys.path: sys.path.insert(0, RAIZ)
+    try:
+        import app as app_mod
+        import catalogo
+        from werkzeug.security import generate_password_hash
+        app_mod.init_dbs()
+        # Pelo mesmo caminho das importações: versão e hash do conteúdo em cada linha, como em produção
+        with app_mod.get_cifras_conn() as conn:
+            buffer = []
+            for linha in gerar_musicas(musicas):
+                buffer.append(linha)
+                if len(buffer) >= lote:
+                    catalogo.inserir_varias(conn, buffer); conn.commit(); buffer.clear()
+            if buffer:
+                catalogo.inserir_varias(conn, buffer); conn.commit()
+        # Um hash só (o custo de verificação no login é o mesmo para todos)
+        hash_senha = generate_password_hash(SENHA_PADRAO)
+        with app_mod.get_usuarios_conn() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO usuarios (nome_completo, login, email, senha, nivel) VALUES (?, ?, ?, ?, ?)",
+                [(f"Usuário {i}", f"bench{i}", f"bench{i}@exemplo.com", hash_senha, "Router" if i == 0 else "Musico")
+                 for i in range(usuarios)],
+            )
+            conn.commit()
+        app_mod.cifras_pool.fechar()
+        app_mod.usuarios_pool.fechar()
+    finally:
+        if antigo is None: os.environ.pop("ECHO_DB_DIR", None)
+        else: os.environ["ECHO_DB_DIR"] = antigo
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--pasta", required=True, help="pasta onde criar cifras.db e usuarios.db")
+    ap.add_argument("--musicas", type=int, default=1000)
+    ap.add_argument("--usuarios", type=int, default=50)
+    args = ap.parse_args()
+    os.makedirs(args.pasta, exist_ok=True)
+    popular(args.pasta, args.musicas, args.usuarios)
+    print(f"{args.musicas} músicas e {args.usuarios} usuários em {args.pasta}")
+
+
+if __name__ == "__main__":
+    main()
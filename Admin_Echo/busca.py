@@ -0,0 +1,79 @@
+import re
+import sqlite3
+
+# Índice FTS5 (external content) sobre cifras. O tokenizer unicode61 com remove_diacritics
+# dobra os acentos no índice e na consulta: "coracao" encontra "Coração".
+# prefix='2 3' mantém índices de prefixo para o autocomplete não varrer o vocabulário.
+_CRIAR_FTS = """
+    CREATE VIRTUAL TABLE cifras_fts USING fts5(
+        titulo, banda, letra,
+        content='cifras', content_rowid='id',
+        tokenize="unicode61 remove_diacritics {nivel}",
+        prefix='2 3'
+    )
+"""
+
+# Gatilhos mantêm o índice em dia com qualquer escrita em cifras (app.py, servidor.py, importações)
+_GATILHOS = (
+    """CREATE TRIGGER IF NOT EXISTS cifras_fts_ai AFTER INSERT ON cifras BEGIN
+        INSERT INTO cifras_fts (rowid, titulo, banda, letra) VALUES (new.id, new.titulo, new.banda, new.letra);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS cifras_fts_ad AFTER DELETE ON cifras BEGIN
+        INSERT INTO cifras_fts (cifras_fts, rowid, titulo, banda, letra) VALUES ('delete', old.id, old.titulo, old.banda, old.letra);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS cifras_fts_au AFTER UPDATE OF titulo, banda, letra ON cifras BEGIN
+        INSERT INTO cifras_fts (cifras_fts, rowid, titulo, banda, letra) VALUES ('delete', old.id, old.titulo, old.banda, old.letra);
+        INSERT INTO cifras_fts (rowid, titulo, banda, letra) VALUES (new.id, new.titulo, new.banda, new.letra);
+    END""",
+)
+
+# Pesos do bm25 por coluna: título pesa mais que banda, que pesa mais que a letra
+_RANK = "bm25(cifras_fts, 10.0, 5.0, 1.0)"
+
+_TERMO = re.compile(r"\w+", re.UNICODE)
+
+
+def criar_indice(conn):
+    """Cria o índice e os gatilhos se ainda não existirem (o commit fica com quem chama)."""
+    existe = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='cifras_fts'").fetchone()
+    if not existe:
+        try:
+            conn.execute(_CRIAR_FTS.format(nivel=2))
+        except sqlite3.OperationalError:
+            # SQLite < 3.27 não conhece remove_diacritics 2
+            conn.execute(_CRIAR_FTS.format(nivel=1))
+        conn.execute("INSERT INTO cifras_fts (cifras_fts) VALUES ('rebuild')")
+    for gatilho in _GATILHOS:
+        conn.execute(gatilho)
+
+
+def expressao_fts(texto):
+    # Autocomplete: palavras completas casam inteiras e só a última (ainda sendo digitada)
+    # casa por prefixo ("cora"*). As aspas neutralizam a sintaxe do FTS5 (AND/OR/NEAR, parênteses)
+    termos = [f'"{t}"' for t in _TERMO.findall(texto)]
+    if termos:
+        termos[-1] += "*"
+    return " ".join(termos)
+
+
+def buscar(conn, texto, limite=50, colunas="c.id, c.titulo, c.banda, c.tom"):
+    """Músicas que casam com `texto`, das mais relevantes para as menos.
+
+    Primeiro ranqueia só título/banda (listas de postings curtas); a letra entra depois,
+    para completar o limite, e só quando o prefixo digitado já tem 3+ letras. Prefixos
+    curtos na letra casam com boa parte do catálogo e custariam um bm25 sobre milhares de linhas.
+    `colunas` deve começar por c.id.
+    """
+    expressao = expressao_fts(texto)
+    if not expressao:
+        return []
+    sql = (f"SELECT {colunas} FROM cifras_fts JOIN cifras c ON c.id = cifras_fts.rowid "
+           f"WHERE cifras_fts MATCH ? ORDER BY {_RANK} LIMIT ?")
+    rows = conn.execute(sql, ("{titulo banda} : (" + expressao + ")", limite)).fetchall()
+    if len(rows) < limite and len(_TERMO.findall(texto)[-1]) >= 3:
+        vistos = {r[0] for r in rows}
+        for r in conn.execute(sql, (expressao, limite + len(rows))):
+            if r[0] not in vistos:
+                rows.append(r)
+                if len(rows) >= limite: break
+    return rows
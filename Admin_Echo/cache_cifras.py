@@ -0,0 +1,167 @@
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import serializacao
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional; sem ele servimos só gzip/identity
+    brotli = None
+
+
+def hash_cifra(titulo, banda, tom, letra, cifra):
+    # Hash da revisão, gravado na coluna cifras.hash a cada escrita: só o conteúdo entra (versão do
+    # catálogo e data não), então salvar sem mudar nada mantém o mesmo endereço /api/song/<id>/<hash>
+    conteudo = json.dumps([titulo, banda, tom, letra, cifra], ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return hashlib.sha1(conteudo).hexdigest()[:16]
+
+
+class EntradaCifra:
+    """Uma música já pronta para servir: dict para templates + corpos JSON pré-codificados."""
+
+    __slots__ = ("dados", "json", "gzip", "br", "hash", "tamanho", "variantes", "msgpack", "dono")
+
+    def __init__(self, dados, conteudo_hash=None):
+        self.dados = dados
+        # JSON canônico: o hash precisa sair igual em /api/song e no open_song
+        self.json = json.dumps(dados, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        # Músicas usam o hash gravado no banco (hash_cifra); variantes e setlists, o do próprio JSON
+        self.hash = conteudo_hash or hashlib.sha1(self.json).hexdigest()[:16]
+        self.gzip = gzip.compress(self.json, compresslevel=6)
+        self.br = brotli.compress(self.json, quality=5) if brotli else None
+        self.tamanho = len(self.json) + len(self.gzip) + (len(self.br) if self.br else 0)
+        # Versões transpostas (semitons -> EntradaCifra), no máximo 11; saem junto com a entrada
+        self.variantes = {}
+        # Corpos MessagePack ({codificação: bytes}), feitos só quando algum cliente pede
+        self.msgpack = None
+        # (cache, chave) de quem paga os bytes feitos depois de guardar; as variantes usam o da original
+        self.dono = None
+
+    def _cobrar(self, n):
+        if self.dono is not None: self.dono[0].crescer(self, n)
+
+    def guardar_variante(self, semitons, dados):
+        # Transposta memorizada na entrada; ela e o MessagePack dela pesam no limite de bytes do cache
+        variante = EntradaCifra(dados)
+        variante.dono = self.dono
+        atual = self.variantes.setdefault(semitons, variante)
+        if atual is variante: self._cobrar(variante.tamanho)
+        return atual
+
+    def corpo(self, codificacao):
+        # codificacao: "br", "gzip" ou None (identity)
+        if codificacao == "br" and self.br is not None: return self.br, "br"
+        if codificacao in ("br", "gzip"): return self.gzip, "gzip"
+        return self.json, None
+
+    def corpo_msgpack(self, codificacao):
+        if self.msgpack is None:
+            bruto = serializacao.empacotar(self.dados)
+            corpos = {None: bruto, "gzip": gzip.compress(bruto, compresslevel=6),
+                      "br": brotli.compress(bruto, quality=5) if brotli else None}
+            # Dois pedidos juntos podem montar os corpos ao mesmo tempo: o que chega depois descarta os seus
+            # (no pior caso uma cobrança a mais, que sai junto com a entrada; o total nunca fica abaixo do real)
+            if self.msgpack is None:
+                self.msgpack = corpos
+                self._cobrar(sum(len(c) for c in corpos.values() if c))
+        if codificacao == "br" and self.msgpack["br"] is not None: return self.msgpack["br"], "br"
+        if codificacao in ("br", "gzip"): return self.msgpack["gzip"], "gzip"
+        return self.msgpack[None], None
+
+
+class CacheCifras:
+    """LRU limitado por número de músicas e por bytes, com contadores de acerto/erro."""
+
+    def __init__(self, max_itens=512, max_bytes=32 * 1024 * 1024):
+        self.max_itens = max_itens
+        self.max_bytes = max_bytes
+        self._itens = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Gerações para o miss não gravar uma leitura anterior a uma escrita (ver geracao/guardar)
+        self._geracao_geral = 0
+        self._geracoes = {}
+        self.acertos = 0
+        self.erros = 0
+        self.remocoes = 0
+        self.descartadas = 0
+
+    def geracao(self, cifra_id):
+        # Leia antes de ir ao banco e passe para guardar(): invalidar no meio do caminho muda o valor
+        with self._lock: return self._geracao_geral, self._geracoes.get(cifra_id, 0)
+
+    def obter(self, cifra_id):
+        with self._lock:
+            entrada = self._itens.get(cifra_id)
+            if entrada is None:
+                self.erros += 1
+                return None
+            self._itens.move_to_end(cifra_id)
+            self.acertos += 1
+            return entrada
+
+    def guardar(self, cifra_id, dados, conteudo_hash=None, geracao=None):
+        # `dados` pode vir já como EntradaCifra (setlist: a chave é o hash dela). A codificação roda fora do lock
+        entrada = dados if isinstance(dados, EntradaCifra) else EntradaCifra(dados, conteudo_hash)
+        with self._lock:
+            if geracao is not None and geracao != (self._geracao_geral, self._geracoes.get(cifra_id, 0)):
+                # Uma escrita invalidou a música depois da leitura: serve só esta requisição, sem guardar
+                self.descartadas += 1
+                return entrada
+            antiga = self._itens.pop(cifra_id, None)
+            if antiga is not None: self._bytes -= antiga.tamanho
+            if entrada.tamanho <= self.max_bytes:
+                entrada.dono = (self, cifra_id)
+                self._itens[cifra_id] = entrada
+                self._bytes += entrada.tamanho
+                self._aparar()
+        return entrada
+
+    def crescer(self, entrada, n):
+        """Cobra `n` bytes feitos depois de guardar (variante transposta, corpos MessagePack) da música
+        dona de `entrada` e remove as mais antigas se passar do limite. Música que já saiu do cache não conta."""
+        with self._lock:
+            dono = entrada.dono
+            # A tupla dono é de uma guardada só: variante de uma revisão substituída não cobra da nova
+            atual = self._itens.get(dono[1]) if dono is not None else None
+            if atual is None or atual.dono is not dono: return
+            atual.tamanho += n
+            self._bytes += n
+            self._aparar()
+
+    def _aparar(self):
+        # Chamado com o lock: tira as menos usadas até caber nos dois limites
+        while self._itens and (len(self._itens) > self.max_itens or self._bytes > self.max_bytes):
+            _, removida = self._itens.popitem(last=False)
+            self._bytes -= removida.tamanho
+            self.remocoes += 1
+
+    def invalidar(self, cifra_id=None):
+        # Sem id = limpa tudo
+        with self._lock:
+            if cifra_id is None:
+                self._itens.clear(); self._bytes = 0
+                self._geracao_geral += 1; self._geracoes.clear()
+                return
+            self._geracoes[cifra_id] = self._geracoes.get(cifra_id, 0) + 1
+            antiga = self._itens.pop(cifra_id, None)
+            if antiga is not None: self._bytes -= antiga.tamanho
+
+    def estatisticas(self):
+        with self._lock:
+            total = self.acertos + self.erros
+            return {
+                "itens": len(self._itens),
+                "bytes": self._bytes,
+                "max_itens": self.max_itens,
+                "max_bytes": self.max_bytes,
+                "acertos": self.acertos,
+                "erros": self.erros,
+                "remocoes": self.remocoes,
+                "descartadas": self.descartadas,
+                "taxa_acerto": round(self.acertos / total, 4) if total else 0.0,
+                "brotli": brotli is not None,
+            }
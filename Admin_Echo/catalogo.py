@@ -0,0 +1,46 @@
+from cache_cifras import hash_cifra
+
+# Escritas em cifras com o controle de versão do sync incremental, usadas pelo app.py e pelo servidor.py.
+# Toda escrita sobe a versão do catálogo e marca a linha (ou a lápide, na exclusão) com a versão nova,
+# para /api/songs/changes entregar a mudança. Tudo na transação de quem chama: o commit fica com ele.
+
+
+def versao_catalogo(conn):
+    return conn.execute("SELECT versao FROM catalogo WHERE id = 1").fetchone()[0]
+
+
+def incrementar_versao_catalogo(conn):
+    conn.execute("UPDATE catalogo SET versao = versao + 1 WHERE id = 1")
+    return versao_catalogo(conn)
+
+
+def inserir(conn, titulo, banda, tom, letra, cifra, created_at):
+    """Grava uma música nova e devolve o id."""
+    versao = incrementar_versao_catalogo(conn)
+    cur = conn.execute("INSERT INTO cifras (titulo, banda, tom, letra, cifra, created_at, versao, hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                       (titulo, banda, tom, letra, cifra, created_at, versao, hash_cifra(titulo, banda, tom, letra, cifra)))
+    return cur.lastrowid
+
+
+def inserir_varias(conn, linhas):
+    """Grava em lote (importação, dados de teste): `linhas` com (titulo, banda, tom, letra, cifra, created_at).
+    O lote inteiro é uma versão do catálogo. Devolve quantas gravou."""
+    versao = incrementar_versao_catalogo(conn)
+    linhas = [tuple(linha) + (versao, hash_cifra(*linha[:5])) for linha in linhas]
+    conn.executemany("INSERT INTO cifras (titulo, banda, tom, letra, cifra, created_at, versao, hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", linhas)
+    return len(linhas)
+
+
+def atualizar(conn, cifra_id, titulo, banda, tom, letra, cifra):
+    # Conteúdo novo = hash novo = endereço novo; o antigo continua imutável nos caches dos celulares
+    versao = incrementar_versao_catalogo(conn)
+    conn.execute("UPDATE cifras SET titulo=?, banda=?, tom=?, letra=?, cifra=?, versao=?, hash=? WHERE id=?",
+                 (titulo, banda, tom, letra, cifra, versao, hash_cifra(titulo, banda, tom, letra, cifra), cifra_id))
+
+
+def excluir(conn, cifra_id):
+    """Apaga a música e deixa a lápide para os clientes a tirarem do cache local. False se não existia."""
+    if not conn.execute("DELETE FROM cifras WHERE id = ?", (cifra_id,)).rowcount: return False
+    versao = incrementar_versao_catalogo(conn)
+    conn.execute("INSERT OR REPLACE INTO cifras_excluidas (id, versao) VALUES (?, ?)", (cifra_id, versao))
+    return True
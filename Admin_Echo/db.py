@@ -0,0 +1,192 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Pragmas aplicados em toda conexão nova. WAL deixa leitores e o escritor (admin editando)
+# trabalharem ao mesmo tempo; busy_timeout espera o lock em vez de estourar "database is locked".
+PRAGMAS_PADRAO = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("busy_timeout", 5000),
+    ("temp_store", "MEMORY"),
+    ("cache_size", -8000),  # ~8 MB de cache de páginas por conexão
+    ("mmap_size", 64 * 1024 * 1024),
+    ("foreign_keys", "ON"),
+)
+
+
+class CursorObservado:
+    """Cursor que mede a consulta até o resultado ser lido e avisa o observador uma vez.
+
+    O tempo inclui o execute e as leituras (fetchone/fetchall/iteração); escritas são avisadas
+    na hora, com o rowcount. Cursor largado no meio da leitura avisa ao ser coletado.
+    """
+
+    __slots__ = ("_cursor", "_sql", "_params", "_gasto", "_linhas", "_observador")
+
+    def __init__(self, cursor, sql, params, gasto, observador):
+        self._cursor = cursor
+        self._sql = sql
+        self._params = params
+        self._gasto = gasto
+        self._linhas = 0
+        self._observador = observador
+        if cursor.description is None: self._avisar(max(cursor.rowcount, 0))
+
+    def _avisar(self, linhas):
+        observador, self._observador = self._observador, None
+        if observador is not None: observador(self._sql, self._params, self._gasto, linhas)
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._gasto += time.perf_counter() - inicio
+        self._linhas += row is not None
+        self._avisar(self._linhas)
+        return row
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._gasto += time.perf_counter() - inicio
+        self._linhas += len(rows)
+        self._avisar(self._linhas)
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        inicio = time.perf_counter()
+        try:
+            row = next(self._cursor)
+        except StopIteration:
+            self._gasto += time.perf_counter() - inicio
+            self._avisar(self._linhas)
+            raise
+        self._gasto += time.perf_counter() - inicio
+        self._linhas += 1
+        return row
+
+    def __getattr__(self, nome):
+        # lastrowid, rowcount, description, fetchmany...
+        return getattr(self._cursor, nome)
+
+    def __del__(self):
+        try:
+            self._avisar(self._linhas)
+        except Exception:
+            pass
+
+
+class ConexaoObservada:
+    """Conexão do pool com execute/executemany medidos; o resto passa direto para a sqlite3.Connection."""
+
+    __slots__ = ("_conn", "_observador")
+
+    def __init__(self, conn, observador):
+        self._conn = conn
+        self._observador = observador
+
+    def execute(self, sql, params=()):
+        inicio = time.perf_counter()
+        cursor = self._conn.execute(sql, params)
+        return CursorObservado(cursor, sql, params, time.perf_counter() - inicio, self._observador)
+
+    def executemany(self, sql, seq_params):
+        inicio = time.perf_counter()
+        cursor = self._conn.executemany(sql, seq_params)
+        return CursorObservado(cursor, sql, None, time.perf_counter() - inicio, self._observador)
+
+    def __getattr__(self, nome):
+        return getattr(self._conn, nome)
+
+
+class PoolSQLite:
+    """Pool de conexões SQLite reaproveitáveis entre threads.
+
+    Uso:
+        with pool.conexao() as conn:
+            conn.execute(...)
+            conn.commit()
+
+    A conexão sempre volta para o pool ao sair do bloco; uma transação esquecida
+    aberta é desfeita (rollback) antes da devolução.
+
+    Com `observador(sql, params, duracao_s, linhas)`, cada consulta feita pelo bloco é medida
+    (ConexaoObservada); sem ele o bloco recebe a sqlite3.Connection pura.
+    """
+
+    def __init__(self, caminho, tamanho=8, timeout=10.0, cache_statements=256, pragmas=PRAGMAS_PADRAO, observador=None):
+        self.caminho = caminho
+        self.observador = observador
+        self.tamanho = tamanho
+        self.timeout = timeout
+        self.cache_statements = cache_statements
+        self.pragmas = pragmas
+        self._livres = queue.LifoQueue()
+        self._criadas = 0
+        self._lock = threading.Lock()
+
+    def _abrir(self):
+        conn = sqlite3.connect(
+            self.caminho,
+            timeout=self.timeout,
+            check_same_thread=False,  # a conexão muda de thread entre requisições, nunca é usada por duas ao mesmo tempo
+            cached_statements=self.cache_statements,
+        )
+        conn.row_factory = sqlite3.Row
+        for nome, valor in self.pragmas:
+            conn.execute(f"PRAGMA {nome}={valor}")
+        return conn
+
+    def _pegar(self):
+        try:
+            return self._livres.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._criadas < self.tamanho:
+                self._criadas += 1
+                try:
+                    return self._abrir()
+                except Exception:
+                    self._criadas -= 1
+                    raise
+        # Pool cheio: espera alguém devolver
+        try:
+            return self._livres.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(f"pool de conexões esgotado para {os.path.basename(self.caminho)}")
+
+    def _devolver(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Conexão quebrada ou fechada por engano: descarta e libera a vaga
+            with self._lock:
+                self._criadas -= 1
+            return
+        self._livres.put(conn)
+
+    @contextmanager
+    def conexao(self):
+        conn = self._pegar()
+        try:
+            yield ConexaoObservada(conn, self.observador) if self.observador else conn
+        finally:
+            self._devolver(conn)
+
+    def fechar(self):
+        while True:
+            try:
+                conn = self._livres.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._criadas -= 1
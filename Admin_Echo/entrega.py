@@ -0,0 +1,128 @@
+import itertools
+import threading
+import time
+
+# Controle de vazão do open_song (usado pelo app.py, sem depender do Socket.IO):
+#   Coalescedor      -> rajada de toques do router vira uma troca só, a última (latest wins)
+#   EntregaConfirmada -> no máximo um open_song em voo por celular; o lento pula os intermediários
+
+
+class Coalescedor:
+    """A primeira publicação de uma chave (sala) sai na hora; as que chegam dentro de `janela_s` viram uma
+    só, a mais nova, enviada quando a janela fecha. Em rajada contínua sai no máximo uma por janela.
+
+    enviar(chave, item) faz a entrega; agendar(funcao, atraso_s) roda funcao numa tarefa de fundo.
+    """
+
+    def __init__(self, janela_s, enviar, agendar):
+        self.janela_s = janela_s
+        self.enviar = enviar
+        self.agendar = agendar
+        self._rajadas = {}  # chave -> {'fim': instante em que a janela fecha, 'pendente': item ou None}
+        self._lock = threading.Lock()
+        self.coalescidos = 0
+
+    def publicar(self, chave, item):
+        if self.janela_s <= 0: return self.enviar(chave, item)
+        agora = time.monotonic()
+        with self._lock:
+            rajada = self._rajadas.get(chave)
+            if rajada is None or (agora >= rajada['fim'] and rajada['pendente'] is None):
+                # Fora de rajada: sai já e abre a janela
+                self._rajadas[chave] = {'fim': agora + self.janela_s, 'pendente': None}
+                imediato, agendar = True, False
+            else:
+                if rajada['pendente'] is not None: self.coalescidos += 1
+                agendar = rajada['pendente'] is None
+                rajada['pendente'] = item
+                imediato = False
+                espera = max(0.0, rajada['fim'] - agora)
+        if imediato: self.enviar(chave, item)
+        elif agendar: self.agendar(lambda: self._fechar(chave), espera)
+
+    def _fechar(self, chave):
+        with self._lock:
+            rajada = self._rajadas.get(chave)
+            if rajada is None or rajada['pendente'] is None: return
+            item, rajada['pendente'] = rajada['pendente'], None
+            # O envio do fim da janela abre outra: quem continua rolando segue agrupado
+            rajada['fim'] = time.monotonic() + self.janela_s
+        self.enviar(chave, item)
+
+    def esquecer(self, chave):
+        with self._lock: self._rajadas.pop(chave, None)
+
+
+class EntregaConfirmada:
+    """Um evento em voo por cliente: o próximo só sai depois da confirmação (ack) do anterior, e o que
+    chega nesse meio-tempo substitui o pendente em vez de entrar numa fila. Sem confirmação em `prazo_s`
+    (ack perdido, app em segundo plano) o mais novo sai assim mesmo, sem esperar outro toque do router.
+
+    enviar(sid, item, confirmar) manda o item e chama confirmar() quando o cliente responder;
+    agendar(funcao, atraso_s) como no Coalescedor; ao_confirmar(segundos) recebe o tempo entre o envio
+    e a confirmação.
+    """
+
+    def __init__(self, enviar, agendar, prazo_s=5.0, ao_confirmar=None):
+        self.enviar = enviar
+        self.agendar = agendar
+        self.prazo_s = prazo_s
+        self.ao_confirmar = ao_confirmar or (lambda segundos: None)
+        # sid -> {'em_voo': número do envio ou None, 'desde', 'pendente', 'vigiado': envio com prazo agendado}
+        self._clientes = {}
+        self._numeros = itertools.count(1)
+        self._lock = threading.Lock()
+        self.pulados = 0
+
+    def entregar(self, sid, item):
+        """Manda agora (True) ou deixa como pendente do cliente (False)."""
+        agora = time.monotonic()
+        vigiar = None
+        with self._lock:
+            cliente = self._clientes.setdefault(sid, {'em_voo': None, 'desde': 0.0, 'pendente': None, 'vigiado': None})
+            if cliente['em_voo'] is not None and agora - cliente['desde'] < self.prazo_s:
+                if cliente['pendente'] is not None: self.pulados += 1
+                cliente['pendente'] = item
+                # Um prazo por envio: se a confirmação não vier, o pendente sai quando ele vencer
+                if cliente['vigiado'] != cliente['em_voo']:
+                    vigiar = cliente['vigiado'] = cliente['em_voo']
+                    espera = cliente['desde'] + self.prazo_s - agora
+                numero = None
+            else:
+                if cliente['pendente'] is not None:
+                    # Prazo estourado com um pendente mais velho que este: vai só o mais novo
+                    self.pulados += 1
+                    cliente['pendente'] = None
+                numero = cliente['em_voo'] = next(self._numeros)
+                cliente['desde'] = agora
+        if vigiar is not None: self.agendar(lambda: self._prazo_vencido(sid, vigiar), espera)
+        if numero is None: return False
+        self.enviar(sid, item, lambda *_: self._confirmado(sid, numero))
+        return True
+
+    def _confirmado(self, sid, numero):
+        with self._lock:
+            cliente = self._clientes.get(sid)
+            # Confirmação de um envio que já foi substituído (prazo estourado): ignora
+            if cliente is None or cliente['em_voo'] != numero: return
+            segundos = time.monotonic() - cliente['desde']
+            cliente['em_voo'] = None
+            pendente, cliente['pendente'] = cliente['pendente'], None
+        self.ao_confirmar(segundos)
+        if pendente is not None: self.entregar(sid, pendente)
+
+    def _prazo_vencido(self, sid, numero):
+        with self._lock:
+            cliente = self._clientes.get(sid)
+            # Confirmou a tempo (ou já saiu outro envio): nada a fazer
+            if cliente is None or cliente['em_voo'] != numero or cliente['pendente'] is None: return
+            pendente, cliente['pendente'] = cliente['pendente'], None
+            cliente['em_voo'] = None
+        self.entregar(sid, pendente)
+
+    def esquecer(self, sid):
+        with self._lock: self._clientes.pop(sid, None)
+
+    def atrasados(self):
+        # Clientes com um envio ainda sem confirmação
+        with self._lock: return sum(1 for c in self._clientes.values() if c['em_voo'] is not None)
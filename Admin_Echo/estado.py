@@ -0,0 +1,201 @@
+import json
+import os
+import time
+import uuid
+from collections.abc import MutableMapping
+
+import socketio
+
+from db import PoolSQLite
+
+# Estado do tempo real compartilhado entre processos do servidor.
+#
+# ECHO_ESTADO_URL escolhe onde ficam routers, setlists e sessões:
+#   (vazio)              -> dicts em memória, um processo só (padrão)
+#   sqlite:///caminho.db -> arquivo SQLite comum aos processos da mesma máquina
+#   redis://host:6379/0  -> hashes no Redis (pip install redis)
+#
+# ECHO_MESSAGE_QUEUE liga os processos para os emits do Socket.IO chegarem em todos:
+#   (vazio)              -> sem fila, um processo só
+#   sqlite:///caminho.db -> fila em tabela SQLite (substituto local do Redis, sem dependências)
+#   redis://... / amqp:// -> repassado ao Flask-SocketIO (message_queue)
+
+PREFIXO_SQLITE = "sqlite:///"
+
+
+class MapaSQLite(MutableMapping):
+    """Dict com valores JSON numa tabela SQLite (uma linha por chave)."""
+
+    def __init__(self, pool, nome):
+        self.pool = pool
+        self.nome = nome
+
+    def __getitem__(self, chave):
+        with self.pool.conexao() as conn:
+            row = conn.execute("SELECT valor FROM estado WHERE mapa = ? AND chave = ?", (self.nome, chave)).fetchone()
+        if row is None: raise KeyError(chave)
+        return json.loads(row["valor"])
+
+    def __setitem__(self, chave, valor):
+        with self.pool.conexao() as conn:
+            conn.execute("INSERT OR REPLACE INTO estado (mapa, chave, valor) VALUES (?, ?, ?)",
+                         (self.nome, chave, json.dumps(valor, ensure_ascii=False)))
+            conn.commit()
+
+    def __delitem__(self, chave):
+        with self.pool.conexao() as conn:
+            apagadas = conn.execute("DELETE FROM estado WHERE mapa = ? AND chave = ?", (self.nome, chave)).rowcount
+            conn.commit()
+        if not apagadas: raise KeyError(chave)
+
+    def items(self):
+        # Uma consulta só em vez de uma por chave
+        with self.pool.conexao() as conn:
+            rows = conn.execute("SELECT chave, valor FROM estado WHERE mapa = ?", (self.nome,)).fetchall()
+        return [(row["chave"], json.loads(row["valor"])) for row in rows]
+
+    def values(self):
+        return [valor for _, valor in self.items()]
+
+    def __iter__(self):
+        return iter([chave for chave, _ in self.items()])
+
+    def __len__(self):
+        with self.pool.conexao() as conn:
+            return conn.execute("SELECT COUNT(*) FROM estado WHERE mapa = ?", (self.nome,)).fetchone()[0]
+
+    def clear(self):
+        with self.pool.conexao() as conn:
+            conn.execute("DELETE FROM estado WHERE mapa = ?", (self.nome,))
+            conn.commit()
+
+
+class MapaRedis(MutableMapping):
+    """Dict com valores JSON num hash do Redis."""
+
+    def __init__(self, cliente, nome):
+        self.cliente = cliente
+        self.chave_hash = f"echo:{nome}"
+
+    def __getitem__(self, chave):
+        valor = self.cliente.hget(self.chave_hash, chave)
+        if valor is None: raise KeyError(chave)
+        return json.loads(valor)
+
+    def __setitem__(self, chave, valor):
+        self.cliente.hset(self.chave_hash, chave, json.dumps(valor, ensure_ascii=False))
+
+    def __delitem__(self, chave):
+        if not self.cliente.hdel(self.chave_hash, chave): raise KeyError(chave)
+
+    def items(self):
+        return [(k.decode(), json.loads(v)) for k, v in self.cliente.hgetall(self.chave_hash).items()]
+
+    def values(self):
+        return [json.loads(v) for v in self.cliente.hvals(self.chave_hash)]
+
+    def __iter__(self):
+        return iter([k.decode() for k in self.cliente.hkeys(self.chave_hash)])
+
+    def __len__(self):
+        return self.cliente.hlen(self.chave_hash)
+
+    def clear(self):
+        self.cliente.delete(self.chave_hash)
+
+
+class Estado:
+    """Fábrica dos mapas compartilhados. `compartilhado` diz se há outros processos lendo o mesmo estado."""
+
+    def __init__(self, url=None):
+        self.url = url or ""
+        self.compartilhado = bool(self.url)
+        if not self.url:
+            self._fabrica = lambda nome: {}
+        elif self.url.startswith(PREFIXO_SQLITE):
+            pool = PoolSQLite(self.url[len(PREFIXO_SQLITE):], tamanho=4)
+            with pool.conexao() as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS estado (
+                        mapa TEXT NOT NULL,
+                        chave TEXT NOT NULL,
+                        valor TEXT NOT NULL,
+                        PRIMARY KEY (mapa, chave)
+                    ) WITHOUT ROWID
+                """)
+                conn.commit()
+            self._fabrica = lambda nome: MapaSQLite(pool, nome)
+        elif self.url.startswith(("redis://", "rediss://", "unix://")):
+            import redis
+            cliente = redis.Redis.from_url(self.url)
+            self._fabrica = lambda nome: MapaRedis(cliente, nome)
+        else:
+            raise ValueError(f"ECHO_ESTADO_URL não suportada: {self.url!r}")
+
+    def mapa(self, nome):
+        return self._fabrica(nome)
+
+
+class GerenciadorFilaSQLite(socketio.PubSubManager):
+    """Fila do Socket.IO numa tabela SQLite, para vários processos na mesma máquina sem Redis.
+
+    Cada processo grava os emits na tabela e lê os dos outros a cada `intervalo` segundos,
+    então a latência extra entre processos fica limitada por esse intervalo.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, caminho, intervalo=0.01, retencao=60.0, channel="socketio", write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.pool = PoolSQLite(caminho, tamanho=4)
+        self.intervalo = intervalo
+        self.retencao = retencao
+        self._ultima_limpeza = time.time()
+        with self.pool.conexao() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS fila (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    canal TEXT NOT NULL,
+                    criada REAL NOT NULL,
+                    corpo TEXT NOT NULL
+                )
+            """)
+            conn.commit()
+
+    def _publish(self, data):
+        agora = time.time()
+        with self.pool.conexao() as conn:
+            conn.execute("INSERT INTO fila (canal, criada, corpo) VALUES (?, ?, ?)",
+                         (self.channel, agora, json.dumps(data, ensure_ascii=False)))
+            # Quem publica também apaga as mensagens velhas (todos os leitores já passaram por elas)
+            if agora - self._ultima_limpeza > self.retencao:
+                conn.execute("DELETE FROM fila WHERE criada < ?", (agora - self.retencao,))
+                self._ultima_limpeza = agora
+            conn.commit()
+
+    def _listen(self):
+        with self.pool.conexao() as conn:
+            ultimo = conn.execute("SELECT COALESCE(MAX(id), 0) FROM fila").fetchone()[0]
+        while True:
+            with self.pool.conexao() as conn:
+                rows = conn.execute("SELECT id, corpo FROM fila WHERE id > ? AND canal = ? ORDER BY id",
+                                    (ultimo, self.channel)).fetchall()
+            for row in rows:
+                ultimo = row["id"]
+                yield row["corpo"]
+            if not rows:
+                self.server.sleep(self.intervalo)
+
+
+def opcoes_socketio(url_fila):
+    """Argumentos extras do SocketIO(...) para a fila escolhida em ECHO_MESSAGE_QUEUE."""
+    if not url_fila:
+        return {}
+    if url_fila.startswith(PREFIXO_SQLITE):
+        intervalo = float(os.environ.get("ECHO_FILA_INTERVALO", 0.01))
+        return {"client_manager": GerenciadorFilaSQLite(url_fila[len(PREFIXO_SQLITE):], intervalo=intervalo)}
+    return {"message_queue": url_fila}
+
+
+def id_processo():
+    return f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
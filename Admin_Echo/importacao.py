@@ -0,0 +1,226 @@
+"""Importação e exportação em lote do catálogo de cifras (ChordPro, CSV ou JSON Lines).
+
+Tudo em fluxo: a entrada é lida registro a registro e gravada em lotes (executemany, uma
+transação por lote); a exportação pagina a tabela pelo id e devolve o arquivo em pedaços.
+
+    python importacao.py importar biblioteca.jsonl
+    python importacao.py importar musicas.csv --lote 1000 --permitir-duplicadas
+    python importacao.py importar cifras.cho --formato chordpro
+    python importacao.py exportar --formato csv > catalogo.csv
+
+Usa os bancos de ECHO_DB_DIR (ou da pasta do app), como o servidor.
+"""
+import argparse
+import csv
+import io
+import json
+import re
+import sys
+from datetime import datetime
+
+import catalogo
+import transposicao
+
+FORMATOS = ("jsonl", "csv", "chordpro")
+EXTENSOES = {".jsonl": "jsonl", ".ndjson": "jsonl", ".json": "jsonl", ".csv": "csv",
+             ".cho": "chordpro", ".chopro": "chordpro", ".chordpro": "chordpro", ".crd": "chordpro", ".pro": "chordpro"}
+CAMPOS = ("titulo", "banda", "tom", "letra", "cifra")
+# Nomes alternativos aceitos na entrada (exportações de outros apps)
+SINONIMOS = {"title": "titulo", "artist": "banda", "artista": "banda", "key": "tom",
+             "lyrics": "letra", "chords": "cifra", "chart": "cifra"}
+LIMITES = {"titulo": 200, "banda": 200, "tom": 10, "letra": 100_000, "cifra": 200_000}
+MAX_ERROS_GUARDADOS = 100
+
+_DIRETIVA = re.compile(r"^\{\s*([\w-]+)\s*(?::\s*(.*?))?\s*\}\s*$")
+
+
+def formato_por_nome(nome):
+    for ext, formato in EXTENSOES.items():
+        if (nome or "").lower().endswith(ext): return formato
+    return None
+
+
+# ---------- leitura (cada leitor itera (número da linha, dict)) ----------
+
+def ler_jsonl(texto):
+    for n, linha in enumerate(texto, 1):
+        if not linha.strip(): continue
+        try:
+            yield n, json.loads(linha)
+        except ValueError as e:
+            yield n, ValueError(f"JSON inválido: {e}")
+
+
+def ler_csv(texto):
+    leitor = csv.DictReader(texto)
+    for registro in leitor:
+        yield leitor.line_num, registro
+
+
+def ler_chordpro(texto):
+    # Várias músicas por arquivo, separadas por {new_song} / {ns}
+    atual, corpo, inicio = {}, [], 1
+    for n, linha in enumerate(texto, 1):
+        linha = linha.rstrip("\r\n")
+        m = _DIRETIVA.match(linha)
+        if m:
+            nome, valor = m[1].lower(), (m[2] or "").strip()
+            if nome in ("new_song", "ns"):
+                if atual or any(l.strip() for l in corpo): yield inicio, _musica_chordpro(atual, corpo)
+                atual, corpo, inicio = {}, [], n + 1
+            elif nome in ("title", "t"): atual["titulo"] = valor
+            elif nome in ("artist", "subtitle", "st"): atual.setdefault("banda", valor)
+            elif nome == "key": atual["tom"] = valor
+            elif nome in ("comment", "c", "ci", "comment_italic"): corpo.append(valor)
+            # Outras diretivas (start_of_chorus, capo...) não têm campo próprio aqui
+            continue
+        if linha.startswith("#"): continue
+        corpo.append(linha)
+    if atual or any(l.strip() for l in corpo): yield inicio, _musica_chordpro(atual, corpo)
+
+
+def _musica_chordpro(atual, corpo):
+    cifra = "\n".join(corpo).strip("\n")
+    return dict(atual, cifra=cifra, letra=transposicao.letra_sem_acordes(cifra))
+
+
+LEITORES = {"jsonl": ler_jsonl, "csv": ler_csv, "chordpro": ler_chordpro}
+
+
+def validar(registro):
+    """Tupla pronta para o INSERT (sem created_at/versao) ou ValueError com o motivo."""
+    if isinstance(registro, Exception): return registro
+    if not isinstance(registro, dict): return ValueError("registro não é um objeto")
+    dados = {}
+    for chave, valor in registro.items():
+        chave = SINONIMOS.get(str(chave).strip().lower(), str(chave).strip().lower())
+        if chave in CAMPOS and valor is not None: dados[chave] = str(valor).strip("\n") if chave in ("letra", "cifra") else str(valor).strip()
+    if not dados.get("letra") and dados.get("cifra"): dados["letra"] = transposicao.letra_sem_acordes(dados["cifra"])
+    for campo in CAMPOS:
+        if not dados.get(campo): return ValueError(f"campo obrigatório vazio: {campo}")
+        if len(dados[campo]) > LIMITES[campo]: return ValueError(f"{campo} maior que {LIMITES[campo]} caracteres")
+    if transposicao.analisar_tom(dados["tom"]) is None: return ValueError(f"tom inválido: {dados['tom']!r}")
+    return tuple(dados[c] for c in CAMPOS)
+
+
+def _chave_duplicada(titulo, banda):
+    return titulo.casefold(), banda.casefold()
+
+
+def importar(conn, texto, formato, lote=500, permitir_duplicadas=False, progresso=None):
+    """Lê `texto` (iterável de linhas) e grava em lotes de `lote` músicas, uma transação por lote.
+
+    Cada lote passa por catalogo.inserir_varias e vira uma versão do catálogo, então o sync
+    incremental do app recebe as músicas novas. `progresso(resumo)` é chamado depois de cada lote.
+    Devolve o resumo final.
+    """
+    resumo = {"lidas": 0, "inseridas": 0, "duplicadas": 0, "invalidas": 0, "erros": []}
+    existentes = set()
+    if not permitir_duplicadas:
+        for row in conn.execute("SELECT titulo, banda FROM cifras"): existentes.add(_chave_duplicada(row[0], row[1]))
+    buffer = []
+
+    def gravar():
+        agora = datetime.now().isoformat()
+        catalogo.inserir_varias(conn, [linha + (agora,) for linha in buffer])
+        conn.commit()
+        resumo["inseridas"] += len(buffer)
+        buffer.clear()
+        if progresso: progresso(resumo)
+
+    for numero, registro in LEITORES[formato](texto):
+        resumo["lidas"] += 1
+        linha = validar(registro)
+        if isinstance(linha, Exception):
+            resumo["invalidas"] += 1
+            if len(resumo["erros"]) < MAX_ERROS_GUARDADOS: resumo["erros"].append((numero, str(linha)))
+            continue
+        if not permitir_duplicadas:
+            chave = _chave_duplicada(linha[0], linha[1])
+            if chave in existentes:
+                resumo["duplicadas"] += 1
+                continue
+            existentes.add(chave)
+        buffer.append(linha)
+        if len(buffer) >= lote: gravar()
+    if buffer: gravar()
+    return resumo
+
+
+# ---------- exportação ----------
+
+def exportar(abrir_conn, formato, lote=500):
+    """Itera pedaços de texto do catálogo inteiro, em ordem de id, sem carregar tudo na memória.
+
+    `abrir_conn()` é um context manager (get_cifras_conn); a conexão volta ao pool entre as páginas.
+    """
+    colunas = ("id",) + CAMPOS + ("created_at",)
+    if formato == "csv":
+        saida = io.StringIO()
+        escritor = csv.writer(saida)
+        escritor.writerow(colunas)
+        yield saida.getvalue()
+    ultimo = 0
+    while True:
+        with abrir_conn() as conn:
+            rows = conn.execute(f"SELECT {', '.join(colunas)} FROM cifras WHERE id > ? ORDER BY id LIMIT ?",
+                                (ultimo, lote)).fetchall()
+        if not rows: return
+        ultimo = rows[-1]["id"]
+        if formato == "jsonl":
+            yield "".join(json.dumps(dict(row), ensure_ascii=False) + "\n" for row in rows)
+        elif formato == "csv":
+            saida = io.StringIO()
+            escritor = csv.writer(saida)
+            escritor.writerows(tuple(row) for row in rows)
+            yield saida.getvalue()
+        else:
+            yield "".join(
+                f"{{title: {row['titulo']}}}\n{{artist: {row['banda']}}}\n{{key: {row['tom']}}}\n\n{row['cifra']}\n\n{{new_song}}\n"
+                for row in rows)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = ap.add_subparsers(dest="comando", required=True)
+    imp = sub.add_parser("importar", help="importa um arquivo (ou - para a entrada padrão)")
+    imp.add_argument("arquivo")
+    imp.add_argument("--formato", choices=FORMATOS, help="padrão: pela extensão do arquivo")
+    imp.add_argument("--lote", type=int, default=500, help="músicas por transação")
+    imp.add_argument("--permitir-duplicadas", action="store_true", help="não pula título+banda já cadastrados")
+    exp = sub.add_parser("exportar", help="exporta o catálogo inteiro para a saída padrão (ou --saida)")
+    exp.add_argument("--formato", choices=FORMATOS, default="jsonl")
+    exp.add_argument("--saida")
+    args = ap.parse_args()
+
+    import app as app_mod
+    app_mod.init_dbs()
+    if args.comando == "exportar":
+        saida = open(args.saida, "w", encoding="utf-8", newline="") if args.saida else sys.stdout
+        try:
+            for pedaco in exportar(app_mod.get_cifras_conn, args.formato): saida.write(pedaco)
+        finally:
+            if args.saida: saida.close()
+        return
+
+    formato = args.formato or formato_por_nome(args.arquivo)
+    if formato is None: sys.exit("não deu para saber o formato pela extensão; use --formato")
+    entrada = sys.stdin if args.arquivo == "-" else open(args.arquivo, encoding="utf-8-sig", newline="")
+
+    def progresso(r):
+        print(f"\r{r['lidas']} lidas, {r['inseridas']} inseridas, {r['duplicadas']} duplicadas, "
+              f"{r['invalidas']} inválidas", end="", file=sys.stderr, flush=True)
+
+    with entrada, app_mod.get_cifras_conn() as conn:
+        resumo = importar(conn, entrada, formato, lote=args.lote,
+                          permitir_duplicadas=args.permitir_duplicadas, progresso=progresso)
+    progresso(resumo)
+    print(file=sys.stderr)
+    for numero, motivo in resumo["erros"]:
+        print(f"  linha {numero}: {motivo}", file=sys.stderr)
+    if resumo["invalidas"] > len(resumo["erros"]):
+        print(f"  ... e mais {resumo['invalidas'] - len(resumo['erros'])} inválidas", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
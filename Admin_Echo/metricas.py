@@ -0,0 +1,128 @@
+import bisect
+import math
+import threading
+
+# Métricas em memória no formato texto do Prometheus (sem dependências).
+# Cada processo tem as suas; com ECHO_WORKERS o Prometheus raspa cada porta e soma.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Baldes em segundos: requisições HTTP e eventos (ms a segundos) e consultas SQLite (µs a ms)
+BALDES_PADRAO = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BALDES_SQL = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+
+
+def _rotulos(nomes, valores):
+    if not nomes: return ""
+    pares = []
+    for nome, valor in zip(nomes, valores):
+        valor = str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pares.append(f'{nome}="{valor}"')
+    return "{" + ",".join(pares) + "}"
+
+
+def _numero(valor):
+    if valor == math.inf: return "+Inf"
+    if isinstance(valor, float) and valor.is_integer(): return str(int(valor))
+    return repr(valor) if isinstance(valor, float) else str(valor)
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def _cabecalho(self):
+        return [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def inc(self, *rotulos, valor=1):
+        with self._lock:
+            self._valores[rotulos] = self._valores.get(rotulos, 0) + valor
+
+    def exportar(self):
+        with self._lock: itens = sorted(self._valores.items())
+        return self._cabecalho() + [f"{self.nome}{_rotulos(self.rotulos, r)} {_numero(v)}" for r, v in itens]
+
+
+class Medidor(_Metrica):
+    """Valor lido na hora da raspagem: `ler()` devolve um número ou {rótulos: número}.
+
+    tipo="counter" para contadores que já existem em outro lugar (ex.: acertos do cache).
+    """
+
+    def __init__(self, nome, ajuda, ler, rotulos=(), tipo="gauge"):
+        super().__init__(nome, ajuda, rotulos)
+        self.ler = ler
+        self.tipo = tipo
+
+    def exportar(self):
+        valores = self.ler()
+        if not isinstance(valores, dict): valores = {(): valores}
+        return self._cabecalho() + [f"{self.nome}{_rotulos(self.rotulos, r)} {_numero(v)}" for r, v in sorted(valores.items())]
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome, ajuda, rotulos=(), baldes=BALDES_PADRAO):
+        super().__init__(nome, ajuda, rotulos)
+        self.baldes = tuple(sorted(baldes))
+
+    def observar(self, valor, *rotulos):
+        # Guarda a contagem por balde (não cumulativa); a soma acumulada sai só na exportação
+        i = bisect.bisect_left(self.baldes, valor)
+        with self._lock:
+            serie = self._valores.get(rotulos)
+            if serie is None:
+                serie = self._valores[rotulos] = [[0] * (len(self.baldes) + 1), 0.0]
+            serie[0][i] += 1
+            serie[1] += valor
+
+    def contagem(self):
+        # Total de observações somando todos os rótulos
+        with self._lock: return sum(sum(c) for c, _ in self._valores.values())
+
+    def exportar(self):
+        with self._lock: itens = sorted((r, (list(c), s)) for r, (c, s) in self._valores.items())
+        linhas = self._cabecalho()
+        for rotulos, (contagens, soma) in itens:
+            acumulado = 0
+            for limite, contagem in zip(self.baldes + (math.inf,), contagens):
+                acumulado += contagem
+                linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos + ('le',), rotulos + (_numero(limite),))} {acumulado}")
+            linhas.append(f"{self.nome}_sum{_rotulos(self.rotulos, rotulos)} {_numero(soma)}")
+            linhas.append(f"{self.nome}_count{_rotulos(self.rotulos, rotulos)} {acumulado}")
+        return linhas
+
+
+class Registro:
+    def __init__(self):
+        self._metricas = []
+
+    def _novo(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def contador(self, nome, ajuda, rotulos=()):
+        return self._novo(Contador(nome, ajuda, rotulos))
+
+    def medidor(self, nome, ajuda, ler, rotulos=(), tipo="gauge"):
+        return self._novo(Medidor(nome, ajuda, ler, rotulos, tipo))
+
+    def histograma(self, nome, ajuda, rotulos=(), baldes=BALDES_PADRAO):
+        return self._novo(Histograma(nome, ajuda, rotulos, baldes))
+
+    def exportar(self):
+        linhas = []
+        for metrica in self._metricas:
+            linhas.extend(metrica.exportar())
+        return "\n".join(linhas) + "\n"
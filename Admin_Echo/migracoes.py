@@ -0,0 +1,126 @@
+import sqlite3
+
+import busca
+from cache_cifras import hash_cifra
+
+# Migrações versionadas pelo PRAGMA user_version de cada banco.
+#
+# Cada lista é a história do esquema: a posição i (começando em 1) leva o banco da versão i-1
+# para a i. Migração nova vai sempre no fim; as antigas não mudam depois de publicadas.
+# A migração 1 cobre bancos criados antes do controle de versão (tudo com IF NOT EXISTS).
+
+
+def _cifras_v1(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS cifras (id INTEGER PRIMARY KEY AUTOINCREMENT, titulo TEXT NOT NULL, banda TEXT NOT NULL, tom TEXT NOT NULL, letra TEXT NOT NULL, cifra TEXT NOT NULL, created_at TEXT NOT NULL)")
+    # Versão do catálogo: incrementada a cada escrita em cifras, usada como ETag
+    conn.execute("CREATE TABLE IF NOT EXISTS catalogo (id INTEGER PRIMARY KEY CHECK (id = 1), versao INTEGER NOT NULL)")
+    conn.execute("INSERT OR IGNORE INTO catalogo (id, versao) VALUES (1, 0)")
+    # Sync incremental: cada linha guarda a versão do catálogo em que mudou pela última vez
+    if "versao" not in colunas(conn, "cifras"):
+        conn.execute("ALTER TABLE cifras ADD COLUMN versao INTEGER NOT NULL DEFAULT 0")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cifras_versao ON cifras (versao)")
+    # Lápides das exclusões, para os clientes removerem a música do cache local
+    conn.execute("CREATE TABLE IF NOT EXISTS cifras_excluidas (id INTEGER PRIMARY KEY, versao INTEGER NOT NULL)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cifras_excluidas_versao ON cifras_excluidas (versao)")
+    # Índice FTS5 sem acentos sobre titulo/banda/letra, sincronizado por gatilhos
+    busca.criar_indice(conn)
+
+
+def _cifras_v2(conn):
+    # Lista do admin (mais novas primeiro) e catálogo da API (ordem alfabética), ambos paginados por
+    # chave; o id no fim desempata e deixa o índice cobrir o cursor inteiro
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cifras_created_at ON cifras (created_at, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cifras_titulo ON cifras (titulo COLLATE NOCASE, id)")
+
+
+def _cifras_v3(conn):
+    # Hash do conteúdo de cada música: endereço imutável /api/song/<id>/<hash>, novo a cada edição.
+    # As linhas recebem uma versão nova do catálogo para os clientes pegarem os hashes no próximo sync
+    if "hash" not in colunas(conn, "cifras"):
+        conn.execute("ALTER TABLE cifras ADD COLUMN hash TEXT")
+    conn.execute("UPDATE catalogo SET versao = versao + 1 WHERE id = 1")
+    versao_nova = conn.execute("SELECT versao FROM catalogo WHERE id = 1").fetchone()[0]
+    ultimo = 0
+    while True:
+        # Em lotes pelo id: letra e cifra do catálogo inteiro não cabem de uma vez na memória
+        linhas = conn.execute("SELECT id, titulo, banda, tom, letra, cifra FROM cifras WHERE id > ? ORDER BY id LIMIT 1000", (ultimo,)).fetchall()
+        if not linhas: break
+        conn.executemany("UPDATE cifras SET hash = ?, versao = ? WHERE id = ?",
+                         [(hash_cifra(*linha[1:]), versao_nova, linha[0]) for linha in linhas])
+        ultimo = linhas[-1][0]
+
+
+def _usuarios_v1(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS usuarios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome_completo TEXT NOT NULL,
+            login TEXT NOT NULL UNIQUE,
+            email TEXT NOT NULL,
+            senha TEXT NOT NULL,
+            nivel TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'ativo'
+        )
+    """)
+
+
+def _usuarios_v2(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_usuarios_status ON usuarios (status)")
+
+
+def _uso_v1(conn):
+    # Eventos brutos (podados depois de alguns dias) e totais por dia, que os relatórios leem
+    conn.execute("CREATE TABLE IF NOT EXISTS uso_eventos (id INTEGER PRIMARY KEY, em REAL NOT NULL, tipo TEXT NOT NULL, cifra_id INTEGER, usuario TEXT, sala TEXT)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_uso_eventos_em ON uso_eventos (em)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS uso_diario_musica (
+            dia TEXT NOT NULL, cifra_id INTEGER NOT NULL, tipo TEXT NOT NULL, total INTEGER NOT NULL,
+            PRIMARY KEY (dia, cifra_id, tipo)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS uso_diario_usuario (
+            dia TEXT NOT NULL, usuario TEXT NOT NULL, tipo TEXT NOT NULL, total INTEGER NOT NULL,
+            PRIMARY KEY (dia, usuario, tipo)
+        ) WITHOUT ROWID
+    """)
+
+
+CIFRAS = [_cifras_v1, _cifras_v2, _cifras_v3]
+USUARIOS = [_usuarios_v1, _usuarios_v2]
+USO = [_uso_v1]
+
+
+def colunas(conn, tabela):
+    return [c["name"] for c in conn.execute(f"PRAGMA table_info({tabela})")]
+
+
+def versao(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def aplicar(conn, migracoes):
+    """Roda as migrações pendentes numa transação só e devolve quantas rodaram.
+
+    BEGIN IMMEDIATE pega o lock de escrita antes de ler a versão, então dois processos subindo
+    juntos não aplicam a mesma migração duas vezes: o segundo espera e encontra o banco em dia.
+    """
+    if versao(conn) == len(migracoes): return 0
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        atual = versao(conn)
+        if atual > len(migracoes):
+            raise sqlite3.DatabaseError(f"banco na versão {atual}, mais nova que este código ({len(migracoes)})")
+        for migracao in migracoes[atual:]:
+            migracao(conn)
+        conn.execute(f"PRAGMA user_version = {len(migracoes)}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    pendentes = len(migracoes) - atual
+    if pendentes:
+        # Índices novos: estatísticas para o planejador escolher entre eles
+        conn.execute("ANALYZE")
+        conn.commit()
+    return pendentes
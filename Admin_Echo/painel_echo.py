@@ -1,5 +1,4 @@
 import sys
-import subprocess
 import pyperclip
 from pyngrok import ngrok
 from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QLabel, QPushButton, QMessageBox
@@ -8,7 +7,7 @@ from PyQt5.QtGui import QFont, QPixmap
 import qrcode
 from io import BytesIO 
 import os
-import time
+from supervisor import SupervisorServidor
 
 class ModernSwitch(QPushButton):
     def __init__(self, parent=None):
@@ -31,58 +30,42 @@ class ModernSwitch(QPushButton):
 class EchoThread(QThread):
     ngrok_started = pyqtSignal(str)
     error_occurred = pyqtSignal(str)
+    server_ready = pyqtSignal(bool)     # True na primeira subida, False depois de um reinício
+    status_changed = pyqtSignal(str)
+    stats_updated = pyqtSignal(dict)
 
     def __init__(self, port, server_path):
         super().__init__()
         self.port = port
         self.server_path = server_path
-        self.server_process = None
+        # Sobe o app.py, espera o /healthz, drena o log (logs/servidor.log) e reinicia se cair
+        self.supervisor = SupervisorServidor(
+            server_path, porta=port,
+            ao_ficar_pronto=self.server_ready.emit,
+            ao_mudar_status=self.status_changed.emit,
+            ao_atualizar=self.stats_updated.emit,
+            ao_falhar=self.error_occurred.emit,
+        )
 
     def run(self):
         try:
             # 1. Limpa instâncias antigas
             ngrok.kill()
             
-            # 2. Inicia Túnel Ngrok
+            # 2. Inicia Túnel Ngrok (continua o mesmo quando o servidor reinicia)
             public_url = ngrok.connect(self.port).public_url
             pyperclip.copy(public_url)
-            
-            # 3. Define o diretório de trabalho (onde o app.py mora)
-            cwd = os.path.dirname(os.path.abspath(self.server_path))
-
-            # 4. Define o executável Python (Usa o do sistema se for executável compilado)
-            python_exe = "python3" if getattr(sys, 'frozen', False) else sys.executable
-            python_exe = "/home/daniel/.pyenv/versions/3.12.3/bin/python"
-
-            # 5. Inicia o Flask com output não-bufferizado (-u) para capturar erros
-            self.server_process = subprocess.Popen(
-                [python_exe, "-u", self.server_path],
-                cwd=cwd, 
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                env=os.environ.copy()
-            )
-            
-            # Pequena espera para verificar se o servidor não "crashou" no login
-            time.sleep(1.5)
-            
-            if self.server_process.poll() is None:
-                self.ngrok_started.emit(public_url)
-            else:
-                _, err = self.server_process.communicate()
-                self.error_occurred.emit(f"Flask falhou ao iniciar:\n{err}")
+            self.server_ready.connect(lambda primeira_vez: primeira_vez and self.ngrok_started.emit(public_url))
+
+            # 3. Sobe o servidor e fica acompanhando até stop()
+            self.supervisor.rodar()
 
         except Exception as e:
             self.error_occurred.emit(str(e))
 
     def stop(self):
-        if self.server_process:
-            self.server_process.terminate()
-            try:
-                self.server_process.wait(timeout=2)
-            except:
-                self.server_process.kill()
+        self.supervisor.parar()
+        self.wait(10000)
         ngrok.kill()
 
 class EchoControlPanel(QWidget):
@@ -110,6 +93,10 @@ class EchoControlPanel(QWidget):
         self.info_label = QLabel("Clique no interruptor para iniciar")
         self.info_label.setStyleSheet("color: #888; font-size: 12px;")
 
+        # Requisições por segundo e conectados, lidos do /healthz a cada 2 s
+        self.stats_label = QLabel("")
+        self.stats_label.setStyleSheet("color: #4fc3f7; font-size: 12px;")
+
         self.qr_code_label = QLabel()
         self.qr_code_label.setFixedSize(300, 300)
         self.qr_code_label.setStyleSheet("background-color: #1b2a3a; border: 1px solid #333; border-radius: 12px;")
@@ -126,6 +113,7 @@ class EchoControlPanel(QWidget):
         layout.addWidget(self.label_status, alignment=Qt.AlignCenter)
         layout.addWidget(self.switch, alignment=Qt.AlignCenter)
         layout.addWidget(self.info_label, alignment=Qt.AlignCenter)
+        layout.addWidget(self.stats_label, alignment=Qt.AlignCenter)
         layout.addWidget(self.qr_code_label, alignment=Qt.AlignCenter)
         layout.addWidget(self.desenv_label, alignment=Qt.AlignCenter)
         layout.addWidget(self.link_label, alignment=Qt.AlignCenter)
@@ -167,6 +155,9 @@ class EchoControlPanel(QWidget):
         self.echo_thread = EchoThread(5000, server_path)
         self.echo_thread.ngrok_started.connect(self.on_success)
         self.echo_thread.error_occurred.connect(self.on_error)
+        self.echo_thread.server_ready.connect(self.on_ready)
+        self.echo_thread.status_changed.connect(self.on_status)
+        self.echo_thread.stats_updated.connect(self.on_stats)
         self.echo_thread.start()
 
     def on_success(self, url):
@@ -176,6 +167,25 @@ class EchoControlPanel(QWidget):
         self.link_label.setText(f"Link: {url}\n(Copiado!)")
         self.generate_qr_code(url)
 
+    def on_ready(self, primeira_vez):
+        # Depois de um reinício o link e o QR code continuam valendo
+        if not primeira_vez:
+            self.label_status.setText("Status: ONLINE!")
+            self.label_status.setStyleSheet("color: #4CAF50;")
+            self.info_label.setText("Servidor reiniciado. Escaneie para conectar o Echo App:")
+
+    def on_status(self, texto):
+        self.label_status.setText("Status: REINICIANDO...")
+        self.label_status.setStyleSheet("color: #FFD700;")
+        self.info_label.setText(texto)
+        self.stats_label.setText("")
+
+    def on_stats(self, dados):
+        if "conexoes" not in dados: return
+        req_s = dados.get("req_s")
+        taxa = f"{req_s:.1f} req/s · " if req_s is not None else ""
+        self.stats_label.setText(f"{taxa}{dados['conexoes']} conectados · {dados['usuarios']} identificados")
+
     def on_error(self, error_msg):
         self.switch.setChecked(False)
         self.stop_all()
@@ -198,6 +208,7 @@ class EchoControlPanel(QWidget):
         self.label_status.setText("Status: DESLIGADO")
         self.label_status.setStyleSheet("color: #F44336;")
         self.info_label.setText("Clique no interruptor para iniciar")
+        self.stats_label.setText("")
         self.qr_code_label.clear()
         self.link_label.setText("")
 
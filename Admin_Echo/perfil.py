@@ -0,0 +1,110 @@
+import cProfile
+import io
+import itertools
+import json
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+# Diagnóstico opt-in para produção (ver README): perfil cProfile das requisições lentas ou de uma
+# amostra delas, e log das consultas SQLite lentas. Tudo desligado por padrão.
+
+_NAO_ARQUIVO = re.compile(r"[^\w.-]+")
+
+
+class Perfilador:
+    """Perfila requisições com cProfile e grava em `pasta` as que passarem de `limite_ms`.
+
+    cada=N perfila só uma a cada N requisições e grava todas as da amostra, rápidas ou lentas (custo
+    baixo, mostra o caso típico); cada=0 perfila todas e guarda só as lentas (o cProfile deixa o código
+    Python ~2x mais lento enquanto está ligado).
+    Um perfil por vez: no Python 3.12+ o cProfile é global ao processo, e nos modos eventlet/gevent as
+    outras requisições da mesma thread também entram no perfil; quem chega com o perfilador ocupado passa sem.
+    """
+
+    def __init__(self, pasta, limite_ms=200.0, cada=0, maximo_arquivos=200):
+        self.pasta = pasta
+        self.limite_s = limite_ms / 1000.0
+        self.cada = cada
+        self.maximo_arquivos = maximo_arquivos
+        self._contagem = itertools.count(1)
+        self._ocupado = threading.Lock()
+        os.makedirs(pasta, exist_ok=True)
+
+    def iniciar(self):
+        # cProfile.Profile ligado ou None (fora da amostra ou perfilador ocupado)
+        if self.cada and next(self._contagem) % self.cada: return None
+        if not self._ocupado.acquire(blocking=False): return None
+        perfil = cProfile.Profile()
+        try:
+            perfil.enable()
+        except ValueError:  # outro profiler ativo (depurador, sys.setprofile...)
+            self._ocupado.release()
+            return None
+        return perfil
+
+    def terminar(self, perfil, duracao_s, rotulo):
+        perfil.disable()
+        self._ocupado.release()
+        # Na amostragem o limite não vale: a amostra existe para mostrar também as requisições normais
+        if not self.cada and duracao_s < self.limite_s: return None
+        nome = f"{time.strftime('%Y%m%d-%H%M%S')}_{int(duracao_s * 1000)}ms_{_NAO_ARQUIVO.sub('_', rotulo)[:80]}"
+        caminho = os.path.join(self.pasta, nome)
+        perfil.dump_stats(caminho + ".prof")
+        # Resumo legível ao lado do .prof (o .prof abre no snakeviz ou em pstats)
+        texto = io.StringIO()
+        texto.write(f"{rotulo}  {duracao_s * 1000:.1f} ms\n\n")
+        pstats.Stats(perfil, stream=texto).sort_stats("cumulative").print_stats(40)
+        with open(caminho + ".txt", "w", encoding="utf-8") as f:
+            f.write(texto.getvalue())
+        self._limpar()
+        return caminho
+
+    def _limpar(self):
+        # Mantém só os `maximo_arquivos` perfis mais novos (cada um = .prof + .txt)
+        perfis = sorted(f for f in os.listdir(self.pasta) if f.endswith(".prof"))
+        for antigo in perfis[:max(0, len(perfis) - self.maximo_arquivos)]:
+            for extensao in (".prof", ".txt"):
+                try: os.remove(os.path.join(self.pasta, antigo[:-5] + extensao))
+                except OSError: pass
+
+
+def formato_parametros(params):
+    # Só a forma dos parâmetros (tipo e tamanho), nunca os valores: logins e hashes não vão para o log
+    if params is None: return "lote"
+    if isinstance(params, dict): return {k: formato_parametros([v])[0] for k, v in params.items()}
+    forma = []
+    for valor in params:
+        if isinstance(valor, (str, bytes)): forma.append(f"{type(valor).__name__}({len(valor)})")
+        else: forma.append(type(valor).__name__)
+    return forma
+
+
+class LogConsultasLentas:
+    """Uma linha JSON por consulta SQLite acima de `limite_ms`, em arquivo com rotação."""
+
+    def __init__(self, caminho, limite_ms=50.0, max_bytes=5 * 1024 * 1024, copias=3):
+        self.limite_s = limite_ms / 1000.0
+        self.logger = logging.getLogger(f"echo.sql_lentas.{caminho}")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        if not self.logger.handlers:
+            manipulador = RotatingFileHandler(caminho, maxBytes=max_bytes, backupCount=copias, encoding="utf-8")
+            manipulador.setFormatter(logging.Formatter("%(message)s"))
+            self.logger.addHandler(manipulador)
+
+    def registrar(self, banco, sql, params, duracao_s, linhas, origem=None):
+        if duracao_s < self.limite_s: return
+        self.logger.info(json.dumps({
+            "hora": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "banco": banco,
+            "ms": round(duracao_s * 1000, 2),
+            "linhas": linhas,
+            "sql": " ".join(sql.split()),
+            "params": formato_parametros(params),
+            "origem": origem,
+        }, ensure_ascii=False))
@@ -0,0 +1,92 @@
+# Ponto de entrada de produção: escolhe o backend do Socket.IO por ECHO_ASYNC_MODE.
+#   ECHO_ASYNC_MODE=eventlet python producao.py   (pip install eventlet)
+#   ECHO_ASYNC_MODE=gevent   python producao.py   (pip install gevent gevent-websocket)
+#   ECHO_ASYNC_MODE=threading python producao.py  (padrão; uma thread do SO por websocket)
+#
+# Vários processos (um por núcleo), cada um na sua porta a partir de ECHO_PORT, ligados por fila e
+# estado compartilhado (estado.py); na frente, um proxy com afinidade por IP (ver README):
+#   ECHO_WORKERS=4 ECHO_ASYNC_MODE=eventlet python producao.py
+import os
+import sys
+
+MODO = os.environ.setdefault("ECHO_ASYNC_MODE", "threading")
+WORKERS = int(os.environ.get("ECHO_WORKERS", 1))
+
+
+def supervisionar():
+    # Imports aqui dentro: nos processos filhos nada disso pode vir antes do monkey patch
+    import signal
+    import subprocess
+    import time
+    # Sem fila/estado configurados, os processos da mesma máquina usam um SQLite comum (estado.py)
+    pasta = os.environ.get("ECHO_DB_DIR", os.path.dirname(os.path.abspath(__file__)))
+    compartilhado = "sqlite:///" + os.path.join(pasta, "tempo_real.db")
+    os.environ.setdefault("ECHO_MESSAGE_QUEUE", compartilhado)
+    os.environ.setdefault("ECHO_ESTADO_URL", compartilhado)
+    porta = int(os.environ.get("ECHO_PORT", 5000))
+    filhos = []
+
+    def encerrar(*_):
+        for filho in filhos:
+            if filho.poll() is None: filho.terminate()
+        for filho in filhos:
+            try: filho.wait(timeout=5)
+            except subprocess.TimeoutExpired: filho.kill()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, encerrar)
+    signal.signal(signal.SIGINT, encerrar)
+    for i in range(WORKERS):
+        env = dict(os.environ, ECHO_WORKER=str(i), ECHO_PORT=str(porta + i))
+        filhos.append(subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env))
+        if i == 0:
+            # O primeiro cria/atualiza os bancos sozinho antes dos outros subirem
+            esperar_porta(porta, filhos[0])
+    print(f"[ECHO] {WORKERS} processos nas portas {porta}-{porta + WORKERS - 1}", flush=True)
+    while True:
+        for filho in filhos:
+            if filho.poll() is not None:
+                print(f"[ECHO] processo {filho.pid} saiu com código {filho.returncode}; encerrando os demais", flush=True)
+                encerrar()
+        time.sleep(1)
+
+
+def esperar_porta(porta, proc, limite=30):
+    import socket
+    import time
+    fim = time.time() + limite
+    while time.time() < fim and proc.poll() is None:
+        try:
+            with socket.create_connection(("127.0.0.1", porta), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.1)
+
+
+if WORKERS > 1 and "ECHO_WORKER" not in os.environ:
+    supervisionar()
+
+# O monkey patch tem que vir antes de importar Flask/app para que sockets, threads,
+# locks e filas (inclusive o pool do db.py) virem cooperativos
+if MODO == "eventlet":
+    import eventlet
+    eventlet.monkey_patch()
+elif MODO == "gevent":
+    from gevent import monkey
+    monkey.patch_all()
+elif MODO != "threading":
+    sys.exit(f"ECHO_ASYNC_MODE inválido: {MODO!r} (use threading, eventlet ou gevent)")
+
+from app import app, socketio, init_dbs
+
+if __name__ == "__main__":
+    host = os.environ.get("ECHO_HOST", "0.0.0.0")
+    port = int(os.environ.get("ECHO_PORT", 5000))
+    init_dbs()
+    if "APP_SECRET_KEY" not in os.environ:
+        print("[ECHO] APP_SECRET_KEY não definida; os tokens da API são assinados com a chave de segredo.key na pasta dos bancos", flush=True)
+    print(f"[ECHO] servidor em {host}:{port} (async_mode={socketio.async_mode})", flush=True)
+    # No modo threading o Socket.IO usa o servidor do Werkzeug; liberado aqui de propósito
+    # para eventos pequenos. Para muitos celulares use eventlet ou gevent.
+    socketio.run(app, host=host, port=port, debug=False, log_output=False,
+                 allow_unsafe_werkzeug=(MODO == "threading"))
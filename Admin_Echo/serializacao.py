@@ -0,0 +1,52 @@
+import gzip
+import json
+
+try:
+    import msgpack
+except ImportError:  # msgpack é opcional; sem ele a API e os sockets falam só JSON
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Formato binário negociado pelo cabeçalho Accept (API) ou pelo auth do handshake (Socket.IO).
+# JSON continua o padrão: só recebe MessagePack quem pede.
+MSGPACK = "application/msgpack"
+TIPOS_MSGPACK = (MSGPACK, "application/x-msgpack", "application/vnd.msgpack")
+
+# Respostas menores que isso vão sem compressão (o cabeçalho gzip/br não compensa)
+COMPRIMIR_A_PARTIR = 1024
+
+
+def disponivel():
+    return msgpack is not None
+
+
+def prefere_msgpack(accept_mimetypes):
+    """True se o Accept pede MessagePack acima de JSON (Accept ausente ou */* = JSON)."""
+    if msgpack is None: return False
+    return accept_mimetypes.best_match(("application/json",) + TIPOS_MSGPACK) in TIPOS_MSGPACK
+
+
+def empacotar(dados):
+    return msgpack.packb(dados, use_bin_type=True)
+
+
+def desempacotar(corpo):
+    return msgpack.unpackb(corpo, raw=False)
+
+
+def codificar(dados, binario):
+    """(corpo, mimetype) no formato escolhido."""
+    if binario: return empacotar(dados), MSGPACK
+    return json.dumps(dados, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), "application/json"
+
+
+def comprimir(corpo, aceitas):
+    """(corpo, Content-Encoding ou None) para respostas montadas na hora; `aceitas` é request.accept_encodings."""
+    if len(corpo) < COMPRIMIR_A_PARTIR: return corpo, None
+    if brotli and aceitas["br"]: return brotli.compress(corpo, quality=4), "br"
+    if aceitas["gzip"]: return gzip.compress(corpo, compresslevel=5), "gzip"
+    return corpo, None
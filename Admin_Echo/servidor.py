@@ -2,49 +2,41 @@
 from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit
-import sqlite3, os
+import os
 from datetime import datetime
+from autenticacao import chave_secreta
+from db import PoolSQLite
+import catalogo
+import migracoes
+import estado
 
 # Configuração básica
 app = Flask(__name__, template_folder="templates", static_folder="static")
-app.secret_key = os.environ.get("APP_SECRET_KEY", "dev-secret")
+app.secret_key = chave_secreta(os.environ.get("ECHO_DB_DIR", os.path.dirname(os.path.abspath(__file__))))
 
 CORS(app)
-socketio = SocketIO(app, cors_allowed_origins="*")
+# Mesma fila/estado compartilhado do app.py (ECHO_MESSAGE_QUEUE / ECHO_ESTADO_URL, ver estado.py)
+socketio = SocketIO(app, cors_allowed_origins="*", **estado.opcoes_socketio(os.environ.get("ECHO_MESSAGE_QUEUE", "")))
 
-DB_PATH = os.path.join(os.path.dirname(__file__), "cifras.db")
+DB_PATH = os.path.join(os.environ.get("ECHO_DB_DIR", os.path.dirname(os.path.abspath(__file__))), "cifras.db")
+pool = PoolSQLite(DB_PATH, tamanho=int(os.environ.get("ECHO_DB_POOL", 8)))
 
-# Estado em memória (perde ao reiniciar)
-state = {
-    "router_sid": None,
-    "router_user": None
-}
+# Estado do router: em memória (perde ao reiniciar) ou compartilhado entre processos
+state = estado.Estado(os.environ.get("ECHO_ESTADO_URL")).mapa("servidor")
+state.setdefault("router_sid", None)
+state.setdefault("router_user", None)
 
 # ---------------------------
 # Funções auxiliares
 # ---------------------------
 def get_conn():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    # Context manager do pool (db.py): use `with get_conn() as conn:`
+    return pool.conexao()
 
 def init_db():
-    if not os.path.exists(DB_PATH):
-        conn = get_conn()
-        cur = conn.cursor()
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS cifras (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                titulo TEXT NOT NULL,
-                banda TEXT NOT NULL,
-                tom TEXT NOT NULL,
-                letra TEXT NOT NULL,
-                cifra TEXT NOT NULL,
-                created_at TEXT NOT NULL
-            )
-        """)
-        conn.commit()
-        conn.close()
+    # Mesmo esquema versionado do app.py (migracoes.py): as escritas daqui gravam o hash da música
+    with get_conn() as conn:
+        migracoes.aplicar(conn, migracoes.CIFRAS)
 
 # ---------------------------
 # Rotas ADMIN WEB (HTML)
@@ -56,23 +48,22 @@ def home():
 @app.route("/cifras")
 def listar_cifras():
     q = request.args.get("q", "").strip()
-    conn = get_conn()
-    cur = conn.cursor()
-    if q:
-        cur.execute("""
-            SELECT id, titulo, banda, tom, created_at
-            FROM cifras
-            WHERE titulo LIKE ? OR banda LIKE ? OR tom LIKE ?
-            ORDER BY created_at DESC
-        """, (f"%{q}%", f"%{q}%", f"%{q}%"))
-    else:
-        cur.execute("""
-            SELECT id, titulo, banda, tom, created_at
-            FROM cifras
-            ORDER BY created_at DESC
-        """)
-    rows = cur.fetchall()
-    conn.close()
+    with get_conn() as conn:
+        cur = conn.cursor()
+        if q:
+            cur.execute("""
+                SELECT id, titulo, banda, tom, created_at
+                FROM cifras
+                WHERE titulo LIKE ? OR banda LIKE ? OR tom LIKE ?
+                ORDER BY created_at DESC
+            """, (f"%{q}%", f"%{q}%", f"%{q}%"))
+        else:
+            cur.execute("""
+                SELECT id, titulo, banda, tom, created_at
+                FROM cifras
+                ORDER BY created_at DESC
+            """)
+        rows = cur.fetchall()
     return render_template("index.html", musicas=rows, q=q)
 
 @app.route("/cifras/nova", methods=["GET", "POST"])
@@ -88,26 +79,20 @@ def criar_cifra():
         if not all(data.values()):
             flash("Preencha todos os campos.", "danger")
             return render_template("create_edit.html", mode="create", values=data)
-        conn = get_conn()
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO cifras (titulo, banda, tom, letra, cifra, created_at)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (data["titulo"], data["banda"], data["tom"], data["letra"], data["cifra"],
-              datetime.now().isoformat(timespec="seconds")))
-        conn.commit()
-        conn.close()
+        with get_conn() as conn:
+            # Versão e hash como no app.py (catalogo.py): o sync incremental dos celulares vê a música nova
+            catalogo.inserir(conn, *data.values(), datetime.now().isoformat(timespec="seconds"))
+            conn.commit()
         flash("Cifra cadastrada com sucesso!", "success")
         return redirect(url_for("listar_cifras"))
     return render_template("create_edit.html", mode="create", values={})
 
 @app.route("/cifras/<int:cifra_id>")
 def detalhar_cifra(cifra_id):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM cifras WHERE id = ?", (cifra_id,))
-    row = cur.fetchone()
-    conn.close()
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM cifras WHERE id = ?", (cifra_id,))
+        row = cur.fetchone()
     if not row:
         flash("Registro não encontrado.", "warning")
         return redirect(url_for("listar_cifras"))
@@ -115,8 +100,6 @@ def detalhar_cifra(cifra_id):
 
 @app.route("/cifras/<int:cifra_id>/editar", methods=["GET", "POST"])
 def editar_cifra(cifra_id):
-    conn = get_conn()
-    cur = conn.cursor()
     if request.method == "POST":
         data = {
             "titulo": request.form.get("titulo", "").strip(),
@@ -128,20 +111,16 @@ def editar_cifra(cifra_id):
         if not all(data.values()):
             flash("Preencha todos os campos.", "danger")
             data["id"] = cifra_id
-            conn.close()
             return render_template("create_edit.html", mode="edit", values=data)
-        cur.execute("""
-            UPDATE cifras
-               SET titulo = ?, banda = ?, tom = ?, letra = ?, cifra = ?
-             WHERE id = ?
-        """, (data["titulo"], data["banda"], data["tom"], data["letra"], data["cifra"], cifra_id))
-        conn.commit()
-        conn.close()
+        with get_conn() as conn:
+            catalogo.atualizar(conn, cifra_id, *data.values())
+            conn.commit()
         flash("Cifra atualizada!", "success")
         return redirect(url_for("detalhar_cifra", cifra_id=cifra_id))
-    cur.execute("SELECT * FROM cifras WHERE id = ?", (cifra_id,))
-    row = cur.fetchone()
-    conn.close()
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM cifras WHERE id = ?", (cifra_id,))
+        row = cur.fetchone()
     if not row:
         flash("Registro não encontrado.", "warning")
         return redirect(url_for("listar_cifras"))
@@ -149,11 +128,10 @@ def editar_cifra(cifra_id):
 
 @app.route("/cifras/<int:cifra_id>/excluir", methods=["POST"])
 def excluir_cifra(cifra_id):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM cifras WHERE id = ?", (cifra_id,))
-    conn.commit()
-    conn.close()
+    with get_conn() as conn:
+        # Com lápide, para os celulares tirarem a música do cache local
+        catalogo.excluir(conn, cifra_id)
+        conn.commit()
     flash("Cifra excluída.", "info")
     return redirect(url_for("listar_cifras"))
 
@@ -162,20 +140,18 @@ def excluir_cifra(cifra_id):
 # ---------------------------
 @app.route("/api/songs", methods=["GET"])
 def list_songs():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT id, titulo FROM cifras ORDER BY titulo")
-    rows = cur.fetchall()
-    conn.close()
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT id, titulo FROM cifras ORDER BY titulo")
+        rows = cur.fetchall()
     return jsonify([{"id": r["id"], "titulo": r["titulo"]} for r in rows])
 
 @app.route("/api/song/<int:song_id>", methods=["GET"])
 def get_song(song_id):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT id, titulo, cifra, letra FROM cifras WHERE id = ?", (song_id,))
-    row = cur.fetchone()
-    conn.close()
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT id, titulo, cifra, letra FROM cifras WHERE id = ?", (song_id,))
+        row = cur.fetchone()
     if not row:
         return jsonify({"error": "not found"}), 404
     return jsonify({
@@ -192,14 +168,14 @@ def get_song(song_id):
 def handle_connect():
     sid = request.sid
     print(f"[SOCKET] connect {sid}")
-    if state["router_sid"]:
-        emit("router_claimed", {"router_user": state["router_user"]}, room=sid)
+    if state.get("router_sid"):
+        emit("router_claimed", {"router_user": state.get("router_user")}, room=sid)
 
 @socketio.on("disconnect")
 def handle_disconnect():
     sid = request.sid
     print(f"[SOCKET] disconnect {sid}")
-    if state["router_sid"] == sid:
+    if state.get("router_sid") == sid:
         print("[SOCKET] router disconnected")
         state["router_sid"] = None
         state["router_user"] = None
@@ -215,7 +191,7 @@ def on_claim_router(data):
 
 @socketio.on("release_router")
 def on_release_router(data):
-    if state["router_sid"] == request.sid:
+    if state.get("router_sid") == request.sid:
         state["router_sid"] = None
         state["router_user"] = None
         socketio.emit("router_cleared", {})
@@ -0,0 +1,156 @@
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from collections import deque
+from logging.handlers import RotatingFileHandler
+
+# Supervisor do servidor usado pelo painel_echo.py (sem Qt, para rodar em qualquer thread):
+# sobe o app.py, espera o /healthz, drena a saída para um log com rotação, acompanha os
+# contadores do /healthz e reinicia com espera crescente se o servidor cair ou travar.
+
+
+def python_padrao():
+    # Empacotado com PyInstaller, sys.executable é o próprio painel: usa ECHO_PYTHON ou o python do PATH
+    if os.environ.get("ECHO_PYTHON"): return os.environ["ECHO_PYTHON"]
+    if not getattr(sys, "frozen", False): return sys.executable
+    return shutil.which("python3") or shutil.which("python") or "python3"
+
+
+class SupervisorServidor:
+    INTERVALO_S = 2.0          # entre consultas ao /healthz com o servidor no ar
+    LIMITE_PRONTO_S = 30.0     # para o primeiro /healthz responder depois de subir
+    FALHAS_TRAVADO = 3         # /healthz seguidos sem resposta = servidor travado, reinicia
+    ESPERA_MAX_S = 30.0        # teto da espera entre reinícios (1, 2, 4... s)
+    ESTAVEL_S = 60.0           # no ar por mais que isso zera a espera
+
+    def __init__(self, caminho_app, porta=5000, python=None, pasta_logs=None,
+                 ao_ficar_pronto=None, ao_mudar_status=None, ao_atualizar=None, ao_falhar=None):
+        self.caminho_app = caminho_app
+        self.porta = porta
+        self.python = python or python_padrao()
+        self.url_saude = f"http://127.0.0.1:{porta}/healthz"
+        # Direto, sem http_proxy do ambiente: o /healthz só mostra os contadores para chamadas locais
+        self._http = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+        self.ao_ficar_pronto = ao_ficar_pronto or (lambda primeira_vez: None)
+        self.ao_mudar_status = ao_mudar_status or (lambda texto: None)
+        self.ao_atualizar = ao_atualizar or (lambda dados: None)
+        self.ao_falhar = ao_falhar or (lambda texto: None)
+        self.processo = None
+        self.ultimas_linhas = deque(maxlen=40)  # para mostrar no erro de inicialização
+        self._parar = threading.Event()
+        pasta_logs = pasta_logs or os.path.join(os.path.dirname(os.path.abspath(caminho_app)), "logs")
+        os.makedirs(pasta_logs, exist_ok=True)
+        self.caminho_log = os.path.join(pasta_logs, "servidor.log")
+        self._log = logging.getLogger(f"echo.servidor.{self.caminho_log}")
+        self._log.propagate = False
+        self._log.setLevel(logging.INFO)
+        if not self._log.handlers:
+            manipulador = RotatingFileHandler(self.caminho_log, maxBytes=2 * 1024 * 1024, backupCount=5, encoding="utf-8")
+            manipulador.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self._log.addHandler(manipulador)
+
+    # ---------- ciclo de vida ----------
+
+    def rodar(self):
+        """Bloqueia até parar(): sobe, acompanha e reinicia o servidor."""
+        tentativas = 0
+        primeira_vez = True
+        while not self._parar.is_set():
+            self._subir()
+            if self._esperar_pronto():
+                self.ao_ficar_pronto(primeira_vez)
+                primeira_vez = False
+                no_ar_desde = time.monotonic()
+                self._acompanhar()
+                if time.monotonic() - no_ar_desde > self.ESTAVEL_S: tentativas = 0
+            elif primeira_vez and not self._parar.is_set():
+                # Nunca subiu: erro de configuração, não adianta insistir
+                self._derrubar()
+                self.ao_falhar("Servidor não respondeu ao /healthz:\n" + "\n".join(self.ultimas_linhas))
+                return
+            if self._parar.is_set(): break
+            self._derrubar()
+            espera = min(self.ESPERA_MAX_S, 2 ** tentativas)
+            tentativas += 1
+            self.ao_mudar_status(f"Servidor parou (código {self.processo.returncode}); reiniciando em {espera:.0f} s")
+            self._log.info(f"[painel] servidor parou com código {self.processo.returncode}; reiniciando em {espera:.0f} s")
+            self._parar.wait(espera)
+        self._derrubar()
+
+    def parar(self):
+        self._parar.set()
+        self._derrubar()
+
+    def _subir(self):
+        self.processo = subprocess.Popen(
+            [self.python, "-u", self.caminho_app],
+            cwd=os.path.dirname(os.path.abspath(self.caminho_app)),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,  # uma saída só, lida sem parar pela thread abaixo
+            text=True, encoding="utf-8", errors="replace", bufsize=1,
+            env=os.environ.copy(),
+        )
+        threading.Thread(target=self._drenar, args=(self.processo,), daemon=True).start()
+
+    def _drenar(self, processo):
+        # Sem leitor o pipe enche (log de acesso do Werkzeug) e o servidor trava no meio do show
+        for linha in processo.stdout:
+            linha = linha.rstrip()
+            self.ultimas_linhas.append(linha)
+            self._log.info(linha)
+        processo.stdout.close()
+
+    def _derrubar(self):
+        processo = self.processo
+        if processo is None or processo.poll() is not None: return
+        processo.terminate()
+        try:
+            processo.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            processo.kill()
+            processo.wait()
+
+    # ---------- saúde ----------
+
+    def _saude(self, timeout=1.0):
+        try:
+            with self._http.open(self.url_saude, timeout=timeout) as resp:
+                return json.loads(resp.read().decode("utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _esperar_pronto(self):
+        fim = time.monotonic() + self.LIMITE_PRONTO_S
+        while time.monotonic() < fim and not self._parar.is_set():
+            if self.processo.poll() is not None: return False
+            if self._saude(timeout=0.5) is not None: return True
+            self._parar.wait(0.05)
+        return False
+
+    def _acompanhar(self):
+        # Até o processo sair, travar ou parar() ser chamado; manda req/s e conectados a cada INTERVALO_S
+        anterior = None
+        falhas = 0
+        while not self._parar.wait(self.INTERVALO_S):
+            if self.processo.poll() is not None: return
+            dados = self._saude()
+            if dados is None:
+                falhas += 1
+                if falhas >= self.FALHAS_TRAVADO:
+                    self._log.info("[painel] /healthz sem resposta; derrubando o servidor travado")
+                    self._derrubar()
+                    return
+                continue
+            falhas = 0
+            agora = time.monotonic()
+            if anterior and "requisicoes" in dados:
+                # Desconta a consulta anterior do próprio painel
+                dados["req_s"] = max(0, dados["requisicoes"] - anterior[1] - 1) / (agora - anterior[0])
+            anterior = (agora, dados.get("requisicoes", 0))
+            self.ao_atualizar(dados)
@@ -0,0 +1,30 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache_cifras import CacheCifras  # noqa: E402
+
+
+def dados(titulo):
+    return {"id": 1, "titulo": titulo, "banda": "B", "tom": "C", "letra": "la", "cifra": "C G"}
+
+
+def test_miss_lido_antes_de_uma_edicao_nao_fica_no_cache():
+    cache = CacheCifras()
+    geracao = cache.geracao(1)      # requisição: miss, vai ao banco e lê a revisão velha
+    cache.invalidar(1)              # edição grava e invalida
+    velha = cache.guardar(1, dados("velha"), geracao=geracao)
+    assert velha.dados["titulo"] == "velha"   # a requisição ainda responde com o que leu
+    assert cache.obter(1) is None
+    assert cache.estatisticas()["descartadas"] == 1
+    nova = cache.guardar(1, dados("nova"), geracao=cache.geracao(1))
+    assert cache.obter(1) is nova
+
+
+def test_invalidar_tudo_tambem_descarta():
+    cache = CacheCifras()
+    geracao = cache.geracao(1)
+    cache.invalidar()
+    cache.guardar(1, dados("velha"), geracao=geracao)
+    assert cache.obter(1) is None
@@ -0,0 +1,35 @@
+import os
+import sys
+import tempfile
+
+# O app abre os bancos ao importar: pasta temporária antes do import
+os.environ["ECHO_DB_DIR"] = tempfile.mkdtemp()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_mod  # noqa: E402
+
+
+def tentar(cliente, usuario, encaminhado):
+    # Como chega pelo túnel: conexão do loopback e o ngrok acrescenta o IP real no fim do X-Forwarded-For
+    return cliente.post("/api/login", json={"username": usuario, "password": "errada"},
+                        environ_base={"REMOTE_ADDR": "127.0.0.1"}, headers={"X-Forwarded-For": encaminhado})
+
+
+def setup_module():
+    app_mod.init_dbs()
+
+
+def test_primeiro_salto_forjado_nao_da_cota_nova():
+    cliente = app_mod.app.test_client()
+    maximo = app_mod.limite_login_ip.maximo
+    # Um primeiro salto diferente a cada tentativa (e um login diferente, fora do limite por login)
+    codigos = [tentar(cliente, f"u{i}", f"10.0.{i // 256}.{i % 256}, 203.0.113.7").status_code for i in range(maximo + 1)]
+    assert codigos[:maximo] == [401] * maximo
+    assert codigos[-1] == 429
+
+
+def test_ip_real_diferente_tem_a_propria_cota():
+    cliente = app_mod.app.test_client()
+    for i in range(app_mod.limite_login_ip.maximo + 1): tentar(cliente, f"v{i}", "203.0.113.8")
+    assert tentar(cliente, "w", "203.0.113.8").status_code == 429
+    assert tentar(cliente, "w", "198.51.100.9").status_code == 401
@@ -0,0 +1,154 @@
+import re
+from functools import lru_cache
+
+# Notas em semitons a partir de C; a grafia de saída depende do tom de destino
+NOTAS = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+SUSTENIDOS = ("C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B")
+BEMOIS = ("C", "Db", "D", "Eb", "E", "F", "Gb", "G", "Ab", "A", "Bb", "B")
+# Tons escritos com bemóis (maiores e relativos menores)
+TONS_BEMOL = {"F", "Bb", "Eb", "Ab", "Db", "Gb", "Dm", "Gm", "Cm", "Fm", "Bbm", "Ebm"}
+
+_ACORDE = re.compile(
+    r"^(?P<raiz>[A-G])(?P<acid>[#b]?)"
+    r"(?P<sufixo>(?:maj|min|dim|aug|sus|add|m|M|º|°|\+|-|\d|\(|\)|[#b](?=\d))*)"
+    r"(?:/(?P<baixo>[A-G])(?P<acid_baixo>[#b]?))?$"
+)
+_TOM = re.compile(r"^\s*([A-G])([#b]?)(m?)")
+_COLCHETES = re.compile(r"\[([^\]\s]+)\]")
+# Marcas que podem aparecer numa linha de acordes sem torná-la uma linha de letra
+_SEPARADORES = {"|", "||", "-", "/", "%", "x2", "x3", "x4", "(x2)", "(x3)", "(x4)", "2x", "3x", "4x", "(2x)", "(3x)", "(4x)"}
+
+
+def _nota(letra, acidente):
+    return (NOTAS[letra] + (1 if acidente == "#" else -1 if acidente == "b" else 0)) % 12
+
+
+def analisar_acorde(texto):
+    """(raiz, sufixo, baixo) com raiz/baixo em semitons, ou None se não for um acorde."""
+    m = _ACORDE.match(texto)
+    if not m:
+        return None
+    baixo = _nota(m["baixo"], m["acid_baixo"]) if m["baixo"] else None
+    return (_nota(m["raiz"], m["acid"]), m["sufixo"], baixo)
+
+
+def analisar_tom(tom):
+    """(raiz, menor) do campo `tom` da música, ou None."""
+    m = _TOM.match(tom or "")
+    if not m:
+        return None
+    return _nota(m[1], m[2]), bool(m[3])
+
+
+def nome_tom(raiz, menor, bemois):
+    return (BEMOIS if bemois else SUSTENIDOS)[raiz % 12] + ("m" if menor else "")
+
+
+def usa_bemois(tom):
+    m = _TOM.match(tom or "")
+    return bool(m) and (m[1] + m[2] + m[3]) in TONS_BEMOL
+
+
+def _linha_de_acordes(linha):
+    tokens = linha.split()
+    # Aceita um rótulo de seção no começo ("Intro:", "Refrão:")
+    if tokens and tokens[0].endswith(":"):
+        tokens = tokens[1:]
+    acordes = 0
+    for t in tokens:
+        if analisar_acorde(t):
+            acordes += 1
+        elif t not in _SEPARADORES:
+            return False
+    return acordes > 0
+
+
+@lru_cache(maxsize=512)
+def analisar(cifra):
+    """Tokeniza a cifra uma vez em linhas de trechos.
+
+    Cada linha é uma tupla de trechos: str (texto literal) ou (raiz, sufixo, baixo, largura)
+    para um acorde, onde largura é o tamanho do acorde como foi escrito. Reconhece tanto
+    acordes em linha própria (sobre a letra) quanto [C] no meio do texto (ChordPro).
+    O cache é por conteúdo: editar a cifra gera uma entrada nova.
+    """
+    linhas = []
+    for linha in cifra.split("\n"):
+        trechos = []
+        if _linha_de_acordes(linha):
+            # Mantém os espaços entre acordes como texto para preservar o alinhamento
+            for parte in re.split(r"(\s+)", linha):
+                if not parte: continue
+                acorde = analisar_acorde(parte)
+                trechos.append(acorde + (len(parte),) if acorde else parte)
+        else:
+            pos = 0
+            for m in _COLCHETES.finditer(linha):
+                acorde = analisar_acorde(m[1])
+                if acorde is None: continue
+                if m.start() > pos: trechos.append(linha[pos:m.start()])
+                trechos.extend(("[", acorde + (len(m[1]),), "]"))
+                pos = m.end()
+            if pos < len(linha) or not trechos: trechos.append(linha[pos:])
+        linhas.append(tuple(trechos))
+    return tuple(linhas)
+
+
+def _escrever(acorde, semitons, bemois):
+    raiz, sufixo, baixo = acorde[:3]
+    nomes = BEMOIS if bemois else SUSTENIDOS
+    texto = nomes[(raiz + semitons) % 12] + sufixo
+    if baixo is not None:
+        texto += "/" + nomes[(baixo + semitons) % 12]
+    return texto
+
+
+@lru_cache(maxsize=2048)
+def transpor(cifra, semitons, bemois=False):
+    """Cifra transposta em `semitons`, memorizada por (conteúdo, deslocamento, grafia)."""
+    semitons %= 12
+    saida = []
+    for trechos in analisar(cifra):
+        linha = []
+        sobra = 0  # caracteres a mais (ou a menos) do último acorde, descontados do espaço seguinte
+        for t in trechos:
+            if isinstance(t, str):
+                if sobra and t.isspace():
+                    t = " " * max(1, len(t) - sobra)
+                sobra = 0
+                linha.append(t)
+            else:
+                novo = _escrever(t, semitons, bemois)
+                sobra = len(novo) - t[3]
+                linha.append(novo)
+        saida.append("".join(linha))
+    return "\n".join(saida)
+
+
+def semitons_para(tom_origem, tom_destino):
+    """Deslocamento de `tom_origem` até `tom_destino`, ou None se algum for inválido."""
+    origem, destino = analisar_tom(tom_origem), analisar_tom(tom_destino)
+    if origem is None or destino is None:
+        return None
+    return (destino[0] - origem[0]) % 12
+
+
+def tom_transposto(tom, semitons):
+    """Nome do tom depois de transpor, com a grafia (sustenido/bemol) adequada."""
+    analisado = analisar_tom(tom)
+    if analisado is None:
+        return tom
+    raiz, menor = analisado
+    raiz = (raiz + semitons) % 12
+    bemois = nome_tom(raiz, menor, True) in TONS_BEMOL
+    return nome_tom(raiz, menor, bemois)
+
+
+def letra_sem_acordes(cifra):
+    """Só a letra: tira as linhas de acordes e os [C] no meio do texto (usado ao importar ChordPro)."""
+    linhas = []
+    for linha in cifra.split("\n"):
+        if _linha_de_acordes(linha):
+            continue
+        linhas.append(" ".join(_COLCHETES.sub("", linha).split()))
+    return "\n".join(linhas).strip("\n")
@@ -0,0 +1,120 @@
+import collections
+import logging
+import threading
+import time
+
+# Estatísticas de uso das músicas (quem abre o quê e quando) num banco separado (uso.db), para as
+# escritas não disputarem o lock do cifras.db. O caminho quente (open_song, /api/song) só faz um
+# append em memória; descarregar() grava em lote, numa transação, os eventos brutos e os totais por dia
+# que os relatórios do admin leem (uso_diario_*), sem varrer os eventos brutos.
+
+TIPOS = ("open_song", "api_song", "setlist")
+
+log = logging.getLogger("echo.uso")
+
+
+def dia_de(instante):
+    return time.strftime("%Y-%m-%d", time.localtime(instante))
+
+
+class AcumuladorUso:
+    """Fila de eventos em memória, limitada a `maximo` (os mais antigos saem se o banco ficar parado)."""
+
+    def __init__(self, abrir_conn, maximo=100_000, dias_brutos=90):
+        self.abrir_conn = abrir_conn
+        self.maximo = maximo
+        self.dias_brutos = dias_brutos
+        self._fila = collections.deque(maxlen=maximo)
+        self._gravando = threading.Lock()
+        self._podado_em = 0.0
+        self.gravados = 0
+        self.descartados = 0
+
+    def registrar(self, tipo, cifra_id, usuario=None, sala=None):
+        # Sem lock: o append da deque é atômico; a contagem de descartados é aproximada
+        if len(self._fila) >= self.maximo: self.descartados += 1
+        self._fila.append((time.time(), tipo, cifra_id, usuario, sala))
+
+    def pendentes(self):
+        return len(self._fila)
+
+    def descarregar(self):
+        """Grava tudo o que está na fila numa transação e devolve quantos eventos foram gravados."""
+        with self._gravando:
+            lote = []
+            while True:
+                try: lote.append(self._fila.popleft())
+                except IndexError: break
+            if not lote: return 0
+            por_musica = collections.Counter()
+            por_usuario = collections.Counter()
+            for instante, tipo, cifra_id, usuario, _ in lote:
+                dia = dia_de(instante)
+                if cifra_id is not None: por_musica[(dia, cifra_id, tipo)] += 1
+                por_usuario[(dia, usuario or "", tipo)] += 1
+            try:
+                with self.abrir_conn() as conn:
+                    conn.executemany("INSERT INTO uso_eventos (em, tipo, cifra_id, usuario, sala) VALUES (?, ?, ?, ?, ?)", lote)
+                    # Os totais do lote já vêm somados: uma linha por (dia, música, tipo), não uma por evento
+                    conn.executemany("INSERT INTO uso_diario_musica (dia, cifra_id, tipo, total) VALUES (?, ?, ?, ?) "
+                                     "ON CONFLICT (dia, cifra_id, tipo) DO UPDATE SET total = total + excluded.total",
+                                     [chave + (total,) for chave, total in por_musica.items()])
+                    conn.executemany("INSERT INTO uso_diario_usuario (dia, usuario, tipo, total) VALUES (?, ?, ?, ?) "
+                                     "ON CONFLICT (dia, usuario, tipo) DO UPDATE SET total = total + excluded.total",
+                                     [chave + (total,) for chave, total in por_usuario.items()])
+                    self._podar(conn)
+                    conn.commit()
+            except Exception:
+                # Banco ocupado ou com erro: devolve o lote para a próxima rodada (dentro do limite da fila)
+                self._fila.extendleft(reversed(lote))
+                raise
+            self.gravados += len(lote)
+            return len(lote)
+
+    def _podar(self, conn):
+        # Eventos brutos só dos últimos `dias_brutos` dias (no máximo uma vez por hora); os totais ficam
+        agora = time.time()
+        if agora - self._podado_em < 3600: return
+        self._podado_em = agora
+        conn.execute("DELETE FROM uso_eventos WHERE em < ?", (agora - self.dias_brutos * 86400,))
+
+    def rodar(self, intervalo_s, dormir=time.sleep):
+        # Laço da tarefa de fundo; `dormir` é o socketio.sleep no app (cooperativo no eventlet/gevent)
+        while True:
+            dormir(intervalo_s)
+            try:
+                self.descarregar()
+            except Exception:
+                log.exception("falha ao gravar as estatísticas de uso; tenta de novo em %s s", intervalo_s)
+
+
+# ---------- relatórios (só nas tabelas uso_diario_*) ----------
+
+def _colunas_por_tipo():
+    return ", ".join(f"SUM(CASE WHEN tipo = '{t}' THEN total ELSE 0 END) AS {t}" for t in TIPOS)
+
+
+def mais_usadas(conn, desde_dia, limite=20):
+    # Ordena pelas aberturas do router; downloads e setlists desempatam
+    return conn.execute(f"""
+        SELECT cifra_id, {_colunas_por_tipo()}, COUNT(DISTINCT dia) AS dias, MAX(dia) AS ultimo_dia
+          FROM uso_diario_musica WHERE dia >= ?
+         GROUP BY cifra_id ORDER BY open_song DESC, api_song DESC, setlist DESC LIMIT ?
+    """, (desde_dia, limite)).fetchall()
+
+
+def atividade_usuarios(conn, desde_dia, limite=100):
+    return conn.execute(f"""
+        SELECT usuario, {_colunas_por_tipo()}, COUNT(DISTINCT dia) AS dias, MAX(dia) AS ultimo_dia
+          FROM uso_diario_usuario WHERE dia >= ?
+         GROUP BY usuario ORDER BY open_song DESC, api_song DESC LIMIT ?
+    """, (desde_dia, limite)).fetchall()
+
+
+def por_dia(conn, desde_dia):
+    # uso_diario_usuario tem todos os eventos (usuário "" para os anônimos), então serve para o total do dia
+    return conn.execute(f"""
+        SELECT dia, {_colunas_por_tipo()}
+          FROM uso_diario_usuario WHERE dia >= ?
+         GROUP BY dia ORDER BY dia DESC
+    """, (desde_dia,)).fetchall()
@@ -23,6 +23,86 @@ const COLORS = {
   border: "#333333"
 };
 
+// --- TRANSPOSIÇÃO (espelha Admin_Echo/transposicao.py) ---
+const NOTE_INDEX = { C: 0, D: 2, E: 4, F: 5, G: 7, A: 9, B: 11 };
+const SHARPS = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"];
+const FLATS = ["C", "Db", "D", "Eb", "E", "F", "Gb", "G", "Ab", "A", "Bb", "B"];
+const FLAT_KEYS = new Set(["F", "Bb", "Eb", "Ab", "Db", "Gb", "Dm", "Gm", "Cm", "Fm", "Bbm", "Ebm"]);
+const CHORD_RE = /^([A-G])([#b]?)((?:maj|min|dim|aug|sus|add|m|M|º|°|\+|-|\d|\(|\)|[#b](?=\d))*)(?:\/([A-G])([#b]?))?$/;
+const KEY_RE = /^\s*([A-G])([#b]?)(m?)/;
+const SEPARATORS = new Set(["|", "||", "-", "/", "%", "x2", "x3", "x4", "(x2)", "(x3)", "(x4)", "2x", "3x", "4x", "(2x)", "(3x)", "(4x)"]);
+
+function noteValue(letter, acc) {
+  return (NOTE_INDEX[letter] + (acc === "#" ? 1 : acc === "b" ? -1 : 0) + 12) % 12;
+}
+
+function transposeChord(chord, semitones, flats) {
+  const m = CHORD_RE.exec(chord);
+  if (!m) return null;
+  const names = flats ? FLATS : SHARPS;
+  let out = names[(noteValue(m[1], m[2]) + semitones) % 12] + m[3];
+  if (m[4]) out += "/" + names[(noteValue(m[4], m[5]) + semitones) % 12];
+  return out;
+}
+
+function isChordLine(line) {
+  let tokens = line.split(/\s+/).filter(Boolean);
+  if (tokens.length && tokens[0].endsWith(":")) tokens = tokens.slice(1);
+  let chords = 0;
+  for (const t of tokens) {
+    if (CHORD_RE.test(t)) chords++;
+    else if (!SEPARATORS.has(t)) return false;
+  }
+  return chords > 0;
+}
+
+function transposeKey(key, semitones) {
+  const m = KEY_RE.exec(key || "");
+  if (!m) return key;
+  const root = (noteValue(m[1], m[2]) + semitones) % 12;
+  const flat = FLATS[root] + m[3];
+  return FLAT_KEYS.has(flat) ? flat : SHARPS[root] + m[3];
+}
+
+function transposeChart(chart, semitones, flats) {
+  semitones = ((semitones % 12) + 12) % 12;
+  if (!chart || !semitones) return chart;
+  return chart.split("\n").map((line) => {
+    if (isChordLine(line)) {
+      // Ajusta o espaço seguinte para manter os acordes alinhados com a letra
+      let extra = 0;
+      return line.split(/(\s+)/).map((part) => {
+        if (!part) return part;
+        if (/^\s+$/.test(part)) {
+          const fixed = extra ? " ".repeat(Math.max(1, part.length - extra)) : part;
+          extra = 0;
+          return fixed;
+        }
+        const t = transposeChord(part, semitones, flats);
+        if (t === null) { extra = 0; return part; }
+        extra = t.length - part.length;
+        return t;
+      }).join("");
+    }
+    return line.replace(/\[([^\]\s]+)\]/g, (all, c) => {
+      const t = transposeChord(c, semitones, flats);
+      return t === null ? all : `[${t}]`;
+    });
+  }).join("\n");
+}
+
+function serverUrlFor(ip) {
+  return ip.startsWith('http') ? ip : `http://${ip}:5000`;
+}
+
+function authKey(url) { return `auth:${url}`; }
+
+function applyToken(tokenRef, token) {
+  tokenRef.current = token;
+  if (token) axios.defaults.headers.common.Authorization = `Bearer ${token}`;
+  else delete axios.defaults.headers.common.Authorization;
+}
+
 export default function App() {
   const [screen, setScreen] = useState("login");
   const [serverIp, setServerIp] = useState(DEFAULT_SERVER_IP);
@@ -31,15 +111,19 @@ export default function App() {
   
   const [username, setUsername] = useState("");
   const [password, setPassword] = useState("");
+  // Sala do servidor (uma por banda/ensaio); vazio = sala padrão
+  const [room, setRoom] = useState("");
   const [userLevel, setUserLevel] = useState(null);
   const [isMusician, setIsMusician] = useState(false);
   
   const [songs, setSongs] = useState([]);
   const [filteredSongs, setFilteredSongs] = useState([]);
   const [selectedSong, setSelectedSong] = useState(null);
+  const [semitones, setSemitones] = useState(0);
   const [loading, setLoading] = useState(false);
   
   const [isRouter, setIsRouter] = useState(false);
+  const isRouterRef = useRef(false);
   const [routerUser, setRouterUser] = useState(null);
   const [searchText, setSearchText] = useState("");
   
@@ -48,15 +132,53 @@ export default function App() {
   const [scanned, setScanned] = useState(false);
 
   const socketRef = useRef(null);
-  const SERVER_URL = serverIp.startsWith('http') ? serverIp : `http://${serverIp}:5000`;
+  // Catálogo local (id -> música) + versão do servidor, para o sync incremental
+  const catalogRef = useRef({ version: 0, byId: {} });
+  // Músicas completas já abertas nesta sessão: id -> { hash, song, setlist }
+  const songCacheRef = useRef({});
+  // Setlist pré-carregada (hash do pacote); músicas dela abrem sem nenhuma requisição
+  const setlistRef = useRef(null);
+  // Sequência dos eventos do router: maior seq já aceito, seq da música atual e o tom pendente dela
+  const lastSeqRef = useRef(0);
+  const songSeqRef = useRef(0);
+  const keyRef = useRef(null);
+  const [draftSetlist, setDraftSetlist] = useState([]);
+  const SERVER_URL = serverUrlFor(serverIp);
+  // Token de sessão do /api/login: vai em toda chamada à API e no identify do socket
+  const tokenRef = useRef(null);
 
   // ... (useEffect e outras funções permanecem iguais)
   useEffect(() => {
     const loadSavedIp = async () => {
       const savedIp = await AsyncStorage.getItem("server_ip");
       if (savedIp) { setServerIp(savedIp); setIpInput(savedIp); }
+      const savedRoom = await AsyncStorage.getItem("room");
+      if (savedRoom) setRoom(savedRoom);
+      // Token ainda válido: entra direto, sem mandar a senha (e sem o hash de senha no servidor)
+      const url = serverUrlFor(savedIp || DEFAULT_SERVER_IP);
+      const saved = await AsyncStorage.getItem(authKey(url));
+      if (!saved) return;
+      try {
+        const { token } = JSON.parse(saved);
+        const res = await axios.get(`${url}/api/me`, { headers: { Authorization: `Bearer ${token}` } });
+        applyToken(tokenRef, token);
+        setUsername(res.data.login);
+        setUserLevel(res.data.nivel);
+        setScreen("main");
+      } catch (err) {
+        if (err.response?.status === 401) await AsyncStorage.removeItem(authKey(url));
+      }
     };
     loadSavedIp();
+    // Token expirado ou usuário desativado no meio do uso: volta para o login
+    const interceptor = axios.interceptors.response.use((r) => r, (err) => {
+      if (err.response?.status === 401 && tokenRef.current) {
+        applyToken(tokenRef, null);
+        setScreen("login");
+      }
+      return Promise.reject(err);
+    });
+    return () => axios.interceptors.response.eject(interceptor);
   }, []);
 
   useEffect(() => {
@@ -68,21 +190,77 @@ export default function App() {
 
   const setupSocket = (currentUser) => {
     if (socketRef.current) socketRef.current.disconnect();
-    const socket = io(SERVER_URL, { transports: ["websocket"] });
+    lastSeqRef.current = 0;
+    songSeqRef.current = 0;
+    keyRef.current = null;
+    // A sala vai no handshake: a cada (re)conexão o servidor já manda a música/tom atuais dela
+    // acks: confirma cada open_song depois de carregar a música; com a rede lenta o servidor manda só a mais nova
+    const socket = io(SERVER_URL, { transports: ["websocket"], auth: { room: room.trim(), acks: true } });
     socket.on("connect", () => {
-      if (currentUser) socket.emit("identify", { username: currentUser });
+      if (currentUser) socket.emit("identify", { username: currentUser, token: tokenRef.current });
+      // Se era o router, retoma o controle da sala
+      if (isRouterRef.current) socket.emit("claim_router", { user: currentUser });
     });
     socket.on("router_claimed", (data) => setRouterUser(data.router_user));
-    socket.on("open_song", async (data) => {
+    // Mudança de tom vinda do router: transpõe a cifra que já está na tela
+    socket.on("key_changed", (data) => {
+      // Descarta evento velho ou fora de ordem (reenvio na reconexão, rede instável)
+      if (data.seq) {
+        if (data.seq <= lastSeqRef.current) return;
+        lastSeqRef.current = data.seq;
+      }
+      // Guarda o tom para a música que ainda pode estar carregando
+      keyRef.current = { song_id: data.song_id, semitones: data.semitones };
+      setSelectedSong((current) => {
+        if (current && current.id === data.song_id) setSemitones(data.semitones);
+        return current;
+      });
+    });
+    socket.on("setlist", async (data) => {
+      if (setlistRef.current === data.hash) return;
       try {
-        const res = await axios.get(`${SERVER_URL}/api/song/${data.song_id}`);
-        setSelectedSong(res.data);
-        setScreen("song");
-      } catch (err) { console.warn("Erro socket open_song", err); }
+        const res = await axios.get(`${SERVER_URL}${data.url}`);
+        res.data.songs.forEach(({ hash, song }) => {
+          songCacheRef.current[song.id] = { hash, song, setlist: data.hash };
+        });
+        setlistRef.current = data.hash;
+      } catch (err) { console.warn("Erro ao pré-carregar setlist", err); }
+    });
+    socket.on("open_song", async (data, ack) => {
+      try { await showOpenSong(data); }
+      finally { if (typeof ack === "function") ack(); }  // o catch-up de quem entra chega sem ack
     });
     socketRef.current = socket;
   };
 
+  async function showOpenSong(data) {
+    if (data.seq) {
+      if (data.seq <= lastSeqRef.current) return;
+      lastSeqRef.current = data.seq;
+      songSeqRef.current = data.seq;
+    }
+    keyRef.current = null;
+    try {
+      let song;
+      if (data.song) {
+        song = data.song;
+        songCacheRef.current[data.song_id] = { hash: data.hash, song };
+      } else {
+        const cached = songCacheRef.current[data.song_id];
+        const fresh = data.hash
+          ? cached?.hash === data.hash
+          : (cached?.setlist && cached.setlist === setlistRef.current);
+        song = fresh ? cached.song : await loadSong(data.song_id, data.hash);
+      }
+      // Outra música foi aberta enquanto esta carregava: não sobrescreve a mais nova
+      if (data.seq && songSeqRef.current !== data.seq) return;
+      setSelectedSong(song);
+      setSemitones(keyRef.current?.song_id === song.id ? keyRef.current.semitones : 0);
+      setScreen("song");
+      if (data.ts) console.log(`open_song ${data.song_id}: ${Date.now() - data.ts} ms desde o toque no router`);
+    } catch (err) { console.warn("Erro socket open_song", err); }
+  }
+
   const handleBarCodeScanned = async ({ data }) => {
     setScanned(true);
     setScanModalVisible(false);
@@ -99,32 +277,139 @@ export default function App() {
     try {
       const res = await axios.post(`${SERVER_URL}/api/login`, { username, password });
       setUserLevel(res.data.nivel);
+      applyToken(tokenRef, res.data.token);
+      await AsyncStorage.setItem(authKey(SERVER_URL), JSON.stringify({ token: res.data.token }));
+      await AsyncStorage.setItem("room", room.trim());
       setScreen("main");
     } catch (err) {
-      Alert.alert("Erro", "Falha na conexão ou credenciais.");
+      if (err.response?.status === 429) Alert.alert("Aguarde", "Muitas tentativas de login. Tente de novo em instantes.");
+      else Alert.alert("Erro", "Falha na conexão ou credenciais.");
     } finally { setLoading(false); }
   }
 
+  function catalogKey() { return `catalog:${SERVER_URL}`; }
+
+  // Compara sem acentos e sem caixa ("coracao" encontra "Coração")
+  function fold(text) {
+    return (text || "").normalize("NFD").replace(/[\u0300-\u036f]/g, "").toLowerCase();
+  }
+
+  function filterLocal(t, list) {
+    const q = fold(t);
+    return list.filter((s) => fold(s.titulo).includes(q) || fold(s.banda).includes(q));
+  }
+
+  // Busca no servidor (FTS: título, banda e letra, ordenado por relevância) com debounce;
+  // enquanto isso, e se a rede falhar, filtra o catálogo local
+  const searchTimerRef = useRef(null);
+  function onSearch(t) {
+    setSearchText(t);
+    setFilteredSongs(t ? filterLocal(t, songs) : songs);
+    clearTimeout(searchTimerRef.current);
+    if (t.trim().length < 2) return;
+    searchTimerRef.current = setTimeout(async () => {
+      try {
+        const res = await axios.get(`${SERVER_URL}/api/search`, { params: { q: t, limit: 50 } });
+        setFilteredSongs(res.data);
+      } catch (err) { console.warn("Busca offline, usando filtro local", err); }
+    }, 250);
+  }
+
+  function publishCatalog(byId) {
+    const list = Object.values(byId).sort((a, b) => a.titulo.localeCompare(b.titulo) || a.id - b.id);
+    setSongs(list);
+    setFilteredSongs(list);
+  }
+
+  // Baixa só o que mudou desde a última versão conhecida (/api/songs/changes)
   async function fetchSongs() {
     setLoading(true);
     try {
-      const res = await axios.get(`${SERVER_URL}/api/songs`);
-      setSongs(res.data);
-      setFilteredSongs(res.data);
+      if (!catalogRef.current.version) {
+        const saved = await AsyncStorage.getItem(catalogKey());
+        if (saved) catalogRef.current = JSON.parse(saved);
+        publishCatalog(catalogRef.current.byId);
+      }
+      const since = catalogRef.current.version;
+      const byId = { ...catalogRef.current.byId };
+      let cursor = null;
+      let version = since;
+      let first = true;
+      do {
+        const res = await axios.get(`${SERVER_URL}/api/songs/changes`, {
+          params: cursor ? { since, after: cursor } : { since },
+        });
+        if (first) {
+          version = res.data.version;
+          if (!since || res.data.reset) for (const k of Object.keys(byId)) delete byId[k];
+          first = false;
+        }
+        res.data.deleted.forEach((id) => { delete byId[id]; });
+        res.data.changed.forEach((song) => { byId[song.id] = song; });
+        cursor = res.data.next;
+      } while (cursor);
+      if (version === since) return;
+      catalogRef.current = { version, byId };
+      publishCatalog(byId);
+      await AsyncStorage.setItem(catalogKey(), JSON.stringify(catalogRef.current));
     } catch (err) { console.error(err); }
     finally { setLoading(false); }
   }
 
-  function openSongLocal(song) {
-    setSelectedSong(song);
-    setScreen("song");
+  // Limite para baixar uma música: o ack do open_song só sai depois, e sem ele o servidor segura as próximas
+  const SONG_TIMEOUT_MS = 10000;
+
+  // Busca a música completa e guarda junto com o hash para reaproveitar no open_song.
+  // Com o hash (catálogo ou open_song) usa o endereço imutável, que o cache HTTP guarda por um ano
+  async function loadSong(id, hash) {
+    const cached = songCacheRef.current[id];
+    if (hash && cached?.hash === hash) return cached.song;
+    const res = await axios.get(`${SERVER_URL}/api/song/${id}${hash ? `/${hash}` : ""}`, { timeout: SONG_TIMEOUT_MS })
+      .catch((err) => {
+        // Revisão antiga (música editada depois do sync): o 404 traz o endereço atual
+        const url = err.response?.status === 404 && err.response.data?.url;
+        if (!url) throw err;
+        return axios.get(`${SERVER_URL}${url}`, { timeout: SONG_TIMEOUT_MS });
+      });
+    const song = res.data;
+    songCacheRef.current[id] = { hash: song.hash || (res.headers["etag"] || "").replace(/"/g, ""), song };
+    return song;
+  }
+
+  async function openSongLocal(song) {
     if (isRouter && socketRef.current?.connected) {
-      socketRef.current.emit("open_song", { song_id: song.id, user: username });
+      socketRef.current.emit("open_song", { song_id: song.id, user: username, ts: Date.now() });
+    }
+    // A lista só traz id/titulo/banda/tom; o corpo da cifra vem de /api/song/<id>
+    try {
+      setSelectedSong(await loadSong(song.id, song.hash));
+      setSemitones(0);
+      setScreen("song");
+    } catch (err) { Alert.alert("Erro", "Não foi possível abrir a música."); }
+  }
+
+  function changeKey(delta) {
+    const next = (((semitones + delta) % 12) + 12) % 12;
+    setSemitones(next);
+    if (isRouter && socketRef.current?.connected && selectedSong) {
+      socketRef.current.emit("change_key", { song_id: selectedSong.id, semitones: next });
     }
   }
 
+  // Router monta a setlist com toques longos na lista e publica para todos pré-carregarem
+  function toggleDraft(song) {
+    setDraftSetlist((ids) => ids.includes(song.id) ? ids.filter((id) => id !== song.id) : [...ids, song.id]);
+  }
+
+  function publishSetlist() {
+    if (!socketRef.current?.connected) return;
+    socketRef.current.emit("publish_setlist", { song_ids: draftSetlist });
+    Alert.alert("Setlist", `${draftSetlist.length} música(s) enviadas para todos os aparelhos.`);
+  }
+
   function toggleRouter(shouldClaim) {
     setIsRouter(shouldClaim);
+    isRouterRef.current = shouldClaim;
     socketRef.current.emit(shouldClaim ? "claim_router" : "release_router", { user: username });
   }
 
@@ -189,6 +474,14 @@ export default function App() {
                   value={password} 
                   onChangeText={setPassword} 
               />
+              <TextInput 
+                  style={styles.input} 
+                  placeholder="Sala (opcional)" 
+                  placeholderTextColor="#666"
+                  value={room} 
+                  onChangeText={setRoom} 
+                  autoCapitalize="none"
+              />
               <TouchableOpacity style={styles.modernButton} onPress={doLogin}>
                 {loading ? <ActivityIndicator color="#fff" /> : <Text style={styles.buttonText}>ACESSAR</Text>}
               </TouchableOpacity>
@@ -202,19 +495,13 @@ export default function App() {
     <SafeAreaView style={styles.safeContainer}>
       <StatusBar barStyle="light-content" backgroundColor={COLORS.surface} translucent={false} />
       <View style={styles.mainHeader}>
-        <Text style={styles.headerTitle}>Músicas</Text>
+        <Text style={styles.headerTitle}>Músicas{room.trim() ? ` · ${room.trim()}` : ""}</Text>
         <TextInput 
             style={styles.searchInput} 
             placeholder="Pesquisar..." 
             placeholderTextColor="#888"
             value={searchText} 
-            onChangeText={(t)=>{
-                setSearchText(t); 
-                setFilteredSongs(songs.filter(s => 
-                    s.titulo.toLowerCase().includes(t.toLowerCase()) || 
-                    s.banda.toLowerCase().includes(t.toLowerCase())
-                ));
-            }} 
+            onChangeText={onSearch} 
         />
       </View>
 
@@ -225,9 +512,12 @@ export default function App() {
           <TouchableOpacity 
             style={[styles.songCard, { backgroundColor: index % 2 === 0 ? COLORS.surface : COLORS.surfaceLight }]} 
             onPress={()=>openSongLocal(item)}
+            onLongPress={()=> isRouter && toggleDraft(item)}
           >
             <View>
-                <Text style={styles.songTitle}>{item.titulo}</Text>
+                <Text style={styles.songTitle}>
+                  {draftSetlist.includes(item.id) ? `${draftSetlist.indexOf(item.id) + 1}. ` : ""}{item.titulo}
+                </Text>
                 <Text style={styles.songBanda}>{item.banda}</Text>
             </View>
             <Text style={styles.songTom}>{item.tom}</Text>
@@ -244,6 +534,11 @@ export default function App() {
                 trackColor={{ false: "#333", true: COLORS.primary }}
             />
         </View>
+        {isRouter && draftSetlist.length > 0 && (
+          <TouchableOpacity onPress={publishSetlist} style={[styles.routerBtn, {backgroundColor: COLORS.surfaceLight}]}>
+            <Text style={styles.buttonText}>SETLIST ({draftSetlist.length})</Text>
+          </TouchableOpacity>
+        )}
         {userLevel === "Router" && (
           <TouchableOpacity 
             onPress={()=>toggleRouter(!isRouter)} 
@@ -262,10 +557,23 @@ export default function App() {
         <View style={styles.songHeader}>
           <Text style={styles.songDisplayTitle}>{selectedSong?.titulo}</Text>
           <Text style={styles.songDisplayBanda}>{selectedSong?.banda}</Text>
+          {isMusician && (
+            <View style={styles.keyBar}>
+              <TouchableOpacity style={styles.keyButton} onPress={() => changeKey(-1)}>
+                <Text style={styles.buttonText}>-½</Text>
+              </TouchableOpacity>
+              <Text style={styles.songTom}>Tom: {transposeKey(selectedSong?.tom, semitones)}</Text>
+              <TouchableOpacity style={styles.keyButton} onPress={() => changeKey(1)}>
+                <Text style={styles.buttonText}>+½</Text>
+              </TouchableOpacity>
+            </View>
+          )}
         </View>
         <ScrollView style={styles.lyricsContainer}>
             <Text style={styles.lyricsText}>
-                {isMusician ? selectedSong?.cifra : selectedSong?.letra}
+                {isMusician
+                  ? transposeChart(selectedSong?.cifra, semitones, FLAT_KEYS.has(transposeKey(selectedSong?.tom, semitones)))
+                  : selectedSong?.letra}
             </Text>
         </ScrollView>
         <TouchableOpacity style={styles.backButton} onPress={()=>setScreen("main")}>
@@ -350,6 +658,8 @@ const styles = StyleSheet.create({
   },
   songDisplayTitle: { color: COLORS.textPrimary, fontSize: 24, fontWeight: 'bold', textAlign: 'center' },
   songDisplayBanda: { color: COLORS.accent, fontSize: 16, marginTop: 5 },
+  keyBar: { flexDirection: 'row', alignItems: 'center', marginTop: 10 },
+  keyButton: { backgroundColor: COLORS.surfaceLight, paddingVertical: 6, paddingHorizontal: 14, borderRadius: 8, marginHorizontal: 12 },
   lyricsContainer: { flex: 1, padding: 20 },
   lyricsText: { 
     color: COLORS.textPrimary, 